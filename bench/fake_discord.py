@@ -0,0 +1,178 @@
+"""
+假的 Discord HTTP API（只實作登入、取得伺服器/頻道、發送訊息與頻道 webhook）
+
+收到的訊息會依內容中的 [bench:<訊息ID>] 標記或附件檔名記錄到達時間（time.monotonic，
+同一台機器上跨行程可比較），壓測程式再以 /bench/deliveries 取回計算延遲。
+"""
+import re
+import json
+import time
+import asyncio
+import itertools
+from datetime import datetime, timezone
+from aiohttp import web
+
+MARKER_RE = re.compile(r'\[bench:([^\]]+)\]')
+FILENAME_RE = re.compile(r'^(\d+_[a-z]+_\d+)')
+
+BOT_USER = {
+    'id': '100000000000000001',
+    'username': 'bench-bot',
+    'discriminator': '0001',
+    'global_name': None,
+    'avatar': None,
+    'bot': True,
+}
+
+
+def _json(data):
+    # py-cord 只在 Content-Type 恰好為 application/json 時才解析 JSON（不能帶 charset）
+    return web.Response(body=json.dumps(data).encode('utf-8'), headers={'Content-Type': 'application/json'})
+
+
+def create_app(guild_id, channel_id, latency=0.0):
+    deliveries = []
+    counters = {'messages': 0, 'webhook_messages': 0, 'attachments': 0, 'attachment_bytes': 0}
+    webhooks = []
+    snowflakes = itertools.count(200000000000000000)
+
+    async def delay():
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def me(request):
+        return _json(BOT_USER)
+
+    async def guild(request):
+        return _json({
+            'id': str(guild_id),
+            'name': 'bench',
+            'icon': None,
+            'owner_id': BOT_USER['id'],
+            'roles': [],
+            'emojis': [],
+            'stickers': [],
+            'features': [],
+            'premium_tier': 0,
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'explicit_content_filter': 0,
+            'mfa_level': 0,
+            'nsfw_level': 0,
+            'system_channel_flags': 0,
+            'preferred_locale': 'zh-TW',
+        })
+
+    async def channel(request):
+        return _json({
+            'id': str(channel_id),
+            'type': 0,
+            'guild_id': str(guild_id),
+            'name': 'bench',
+            'position': 0,
+            'permission_overwrites': [],
+            'nsfw': False,
+            'parent_id': None,
+            'topic': None,
+        })
+
+    async def create_message(request):
+        attachments = []
+        if request.content_type.startswith('multipart/'):
+            payload = {}
+            reader = await request.multipart()
+            async for part in reader:
+                if part.name == 'payload_json':
+                    payload = json.loads(await part.text())
+                    continue
+                size = 0
+                while True:
+                    chunk = await part.read_chunk(256 * 1024)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                attachments.append((part.filename or '', size))
+        else:
+            payload = await request.json()
+        await delay()
+
+        received = time.monotonic()
+        content = payload.get('content') or ''
+        for marker in MARKER_RE.findall(content):
+            deliveries.append((marker, received))
+        for filename, size in attachments:
+            match = FILENAME_RE.match(filename)
+            if match:
+                deliveries.append((match.group(1), received))
+            counters['attachments'] += 1
+            counters['attachment_bytes'] += size
+        counters['messages'] += 1
+        webhook_id = request.match_info.get('webhook_id')
+        if webhook_id:
+            counters['webhook_messages'] += 1
+            author = {'id': webhook_id, 'username': payload.get('username') or 'bench-webhook',
+                      'discriminator': '0000', 'avatar': None, 'bot': True}
+        else:
+            author = BOT_USER
+
+        message_id = str(next(snowflakes))
+        return _json({
+            'id': message_id,
+            'channel_id': str(channel_id),
+            'guild_id': str(guild_id),
+            'author': author,
+            'webhook_id': webhook_id,
+            'content': content,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [
+                {
+                    'id': str(next(snowflakes)),
+                    'filename': filename,
+                    'size': size,
+                    'url': f"http://{request.host}/attachments/{message_id}/{filename}",
+                    'proxy_url': f"http://{request.host}/attachments/{message_id}/{filename}",
+                }
+                for filename, size in attachments
+            ],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+        })
+
+    async def list_webhooks(request):
+        return _json(webhooks)
+
+    async def create_webhook(request):
+        payload = await request.json()
+        webhook = {
+            'id': str(next(snowflakes)),
+            'type': 1,
+            'token': 'bench-webhook-token',
+            'name': payload.get('name'),
+            'avatar': None,
+            'channel_id': str(channel_id),
+            'guild_id': str(guild_id),
+            'application_id': None,
+            'user': BOT_USER,
+        }
+        webhooks.append(webhook)
+        return _json(webhook)
+
+    async def get_deliveries(request):
+        return _json({'deliveries': deliveries, 'counters': counters})
+
+    app = web.Application(client_max_size=1024 ** 3)
+    app.router.add_get('/api/v{version}/users/@me', me)
+    app.router.add_get('/api/v{version}/guilds/{guild_id}', guild)
+    app.router.add_get('/api/v{version}/channels/{channel_id}', channel)
+    app.router.add_post('/api/v{version}/channels/{channel_id}/messages', create_message)
+    app.router.add_get('/api/v{version}/channels/{channel_id}/webhooks', list_webhooks)
+    app.router.add_post('/api/v{version}/channels/{channel_id}/webhooks', create_webhook)
+    app.router.add_post('/api/v{version}/webhooks/{webhook_id}/{token}', create_message)
+    app.router.add_get('/bench/deliveries', get_deliveries)
+    return app
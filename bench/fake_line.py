@@ -0,0 +1,111 @@
+"""
+假的 Line Messaging API（只實作本專案用到的端點）
+
+訊息 ID 的格式為 "<序號>_<類型>_<位元組數>"（類型為 image/video/audio/file），
+取得內容時依 ID 回傳對應類型與大小的資料，不需要和壓測程式共用狀態。
+另外提供貼圖 CDN 的替代端點（STICKER_CDN_BASE 指向 /stickershop/v1/sticker）。
+"""
+import asyncio
+from aiohttp import web
+
+CONTENT_TYPES = {
+    'image': 'image/jpeg',
+    'video': 'video/mp4',
+    'audio': 'audio/m4a',
+    'file': 'application/octet-stream',
+}
+
+_CHUNK = b'\x00' * (64 * 1024)
+# 貼圖圖片的大小（實際的貼圖 PNG 約數十 KB）
+STICKER_BYTES = 40 * 1024
+
+
+def parse_message_id(message_id):
+    """回傳 (類型, 位元組數)"""
+    try:
+        _, kind, size = message_id.split('_')
+        return kind, int(size)
+    except ValueError:
+        return 'file', 1024
+
+
+def create_app(latency=0.0, group_size=0):
+    """latency 為每個請求額外的延遲秒數；group_size 為群組成員 ID 清單的人數"""
+    counters = {
+        'profiles': 0, 'contents': 0, 'content_bytes': 0, 'pushes': 0, 'pushed_messages': 0, 'stickers': 0,
+    }
+
+    async def delay():
+        if latency:
+            await asyncio.sleep(latency)
+
+    def profile(user_id):
+        return {
+            'userId': user_id,
+            'displayName': f"用戶{user_id[-4:]}",
+            'pictureUrl': f"https://profile.line-scdn.net/{user_id}",
+        }
+
+    async def bot_info(request):
+        await delay()
+        return web.json_response({'userId': 'Ubenchbot', 'basicId': '@bench', 'displayName': 'bench'})
+
+    async def get_profile(request):
+        await delay()
+        counters['profiles'] += 1
+        return web.json_response(profile(request.match_info['user_id']))
+
+    async def member_ids(request):
+        await delay()
+        group_id = request.match_info['group_id']
+        return web.json_response({'memberIds': [f"U{group_id[-6:]}{i:04d}" for i in range(group_size)]})
+
+    async def push(request):
+        await delay()
+        body = await request.json()
+        counters['pushes'] += 1
+        counters['pushed_messages'] += len(body.get('messages', []))
+        return web.json_response({})
+
+    async def content(request):
+        await delay()
+        message_id = request.match_info['message_id']
+        kind, size = parse_message_id(message_id)
+        response = web.StreamResponse(headers={
+            'Content-Type': CONTENT_TYPES.get(kind, 'application/octet-stream'),
+            'Content-Length': str(size),
+        })
+        await response.prepare(request)
+        # 開頭放入訊息 ID，讓每則訊息的內容（雜湊）都不同
+        head = message_id.encode('ascii')[:size]
+        await response.write(head)
+        remaining = size - len(head)
+        while remaining > 0:
+            chunk = _CHUNK[:min(remaining, len(_CHUNK))]
+            await response.write(chunk)
+            remaining -= len(chunk)
+        await response.write_eof()
+        counters['contents'] += 1
+        counters['content_bytes'] += size
+        return response
+
+    async def sticker(request):
+        await delay()
+        counters['stickers'] += 1
+        head = b'\x89PNG\r\n\x1a\n' + request.match_info['sticker_id'].encode('ascii')
+        return web.Response(body=head + _CHUNK[:STICKER_BYTES - len(head)], content_type='image/png')
+
+    async def stats(request):
+        return web.json_response(counters)
+
+    app = web.Application()
+    app.router.add_get('/v2/bot/info', bot_info)
+    app.router.add_get('/v2/bot/profile/{user_id}', get_profile)
+    app.router.add_get('/v2/bot/group/{group_id}/member/{user_id}', get_profile)
+    app.router.add_get('/v2/bot/room/{room_id}/member/{user_id}', get_profile)
+    app.router.add_get('/v2/bot/group/{group_id}/members/ids', member_ids)
+    app.router.add_post('/v2/bot/message/push', push)
+    app.router.add_get('/v2/bot/message/{message_id}/content', content)
+    app.router.add_get('/stickershop/v1/sticker/{sticker_id}/android/sticker.png', sticker)
+    app.router.add_get('/bench/stats', stats)
+    return app
@@ -0,0 +1,147 @@
+"""
+Webhook 負載產生器：產生並簽署貼近實際的 Line webhook 內容，POST 到 /callback
+
+情境包含文字連發、混合媒體、重送（isRedelivery）以及大量群組
+"""
+import hmac
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import itertools
+
+import aiohttp
+
+# 媒體類型與大小範圍（位元組）
+MEDIA_SIZES = {
+    'image': (50 * 1024, 2 * 1024 * 1024),
+    'video': (1024 * 1024, 8 * 1024 * 1024),
+    'audio': (32 * 1024, 512 * 1024),
+    'file': (4 * 1024, 4 * 1024 * 1024),
+}
+
+
+def sign(channel_secret, body):
+    digest = hmac.new(channel_secret.encode('utf-8'), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+class LoadGenerator:
+    """
+    產生 webhook 事件並記錄每則訊息的送出時間
+
+    sent 為 {訊息ID: time.monotonic()}，只包含預期會轉傳到 Discord 的訊息（重送不算）
+    """
+
+    def __init__(self, url, channel_secret, groups=20, users_per_group=30, media_ratio=0.1,
+                 redelivery_ratio=0.05, burst=5, seed=1):
+        self.url = url
+        self.channel_secret = channel_secret
+        self.groups = [f"Cbench{i:026d}" for i in range(groups)]
+        self.users_per_group = users_per_group
+        self.media_ratio = media_ratio
+        self.redelivery_ratio = redelivery_ratio
+        self.burst = burst
+        self.random = random.Random(seed)
+        self._seq = itertools.count(1)
+        self.sent = {}
+        self.requests = 0
+        self.redeliveries = 0
+        self.errors = 0
+        self._history = []
+
+    def _source(self, group_id):
+        user = self.random.randrange(self.users_per_group)
+        return {'type': 'group', 'groupId': group_id, 'userId': f"U{group_id[-6:]}{user:04d}"}
+
+    def _message(self, seq):
+        if self.random.random() < self.media_ratio:
+            kind = self.random.choice(list(MEDIA_SIZES))
+            low, high = MEDIA_SIZES[kind]
+            message_id = f"{seq}_{kind}_{self.random.randint(low, high)}"
+            message = {'id': message_id, 'type': kind}
+            if kind == 'file':
+                message['fileName'] = f"{message_id}.bin"
+                message['fileSize'] = int(message_id.rsplit('_', 1)[1])
+            return message_id, message
+        message_id = f"{seq}_text_0"
+        words = ' '.join(self.random.choice(('早安', '哈哈', '好喔', '明天見', 'ok', '+1')) for _ in range(8))
+        return message_id, {'id': message_id, 'type': 'text', 'text': f"[bench:{message_id}] {words}"}
+
+    def build_burst(self):
+        """同一群組連續的 burst 則訊息，包在同一個 webhook 請求中"""
+        group_id = self.random.choice(self.groups)
+        events = []
+        for _ in range(self.burst):
+            seq = next(self._seq)
+            message_id, message = self._message(seq)
+            events.append({
+                'type': 'message',
+                'mode': 'active',
+                'timestamp': int(time.time() * 1000),
+                'webhookEventId': f"01BENCH{seq:019d}",
+                'deliveryContext': {'isRedelivery': False},
+                'replyToken': f"reply{seq}",
+                'source': self._source(group_id),
+                'message': message,
+            })
+        return events
+
+    async def _post(self, session, events):
+        body = json.dumps({'destination': 'Ubenchbot', 'events': events}, ensure_ascii=False).encode('utf-8')
+        headers = {'X-Line-Signature': sign(self.channel_secret, body), 'Content-Type': 'application/json'}
+        self.requests += 1
+        try:
+            async with session.post(self.url, data=body, headers=headers) as response:
+                if response.status != 200:
+                    self.errors += 1
+        except aiohttp.ClientError:
+            self.errors += 1
+
+    async def run(self, total_events, concurrency=8, rate=None):
+        """
+        送出 total_events 則事件；rate 為每秒事件數上限（None 表示盡量快）
+        """
+        queue = asyncio.Queue()
+        produced = 0
+        while produced < total_events:
+            events = self.build_burst()
+            produced += len(events)
+            await queue.put(events)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+        started = time.monotonic()
+        interval = self.burst / rate if rate else 0.0
+
+        async with aiohttp.ClientSession() as session:
+            async def worker(index):
+                sent_bursts = 0
+                while True:
+                    events = await queue.get()
+                    if events is None:
+                        return
+                    if interval:
+                        target = started + (sent_bursts * concurrency + index) * interval
+                        await asyncio.sleep(max(0.0, target - time.monotonic()))
+                    sent_bursts += 1
+                    if self._history and self.random.random() < self.redelivery_ratio:
+                        await self._redeliver(session)
+                    now = time.monotonic()
+                    for event in events:
+                        self.sent[event['message']['id']] = now
+                    await self._post(session, events)
+                    self._history.append(events)
+
+            await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        return time.monotonic() - started
+
+    async def _redeliver(self, session):
+        """重送先前的一批事件（相同 webhookEventId，標記為 redelivery）"""
+        events = json.loads(json.dumps(self.random.choice(self._history)))
+        for event in events:
+            event['deliveryContext'] = {'isRedelivery': True}
+        self.redeliveries += len(events)
+        await self._post(session, events)
@@ -0,0 +1,335 @@
+"""
+離線端對端壓測：假的 Line API 與 Discord API + webhook 負載產生器
+
+用法（在專案根目錄執行）：
+    python -m bench.run --events 2000 --groups 20 --media-ratio 0.1
+
+假伺服器在另一個行程中執行；機器人（LineDiscordBot + LineCog）在本行程中啟動，
+透過 LINE_API_BASE / LINE_DATA_API_BASE 與 Discord 的 API 位址指向假伺服器，
+不連線 Discord gateway。結束時輸出事件吞吐量、端對端延遲百分位、記憶體與檔案描述元用量。
+
+加上 --split 時以拆分部署執行：Webhook 入口（ingress.py）與假伺服器在同一個子行程中，
+事件經由暫存目錄中的 SQLite 事件日誌交給本行程的機器人（BRIDGE_MODE=consumer）。
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import asyncio
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from pathlib import Path
+
+import aiohttp
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+GUILD_ID = 300000000000000001
+CHANNEL_ID = 300000000000000002
+CHANNEL_SECRET = 'bench-channel-secret'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_fakes(line_port, discord_port, line_latency, discord_latency, group_size, ingress_port=None):
+    """在子行程中執行假的 Line 與 Discord 伺服器（拆分部署時也執行 Webhook 入口）"""
+    from aiohttp import web
+    from bench.fake_line import create_app as create_line_app
+    from bench.fake_discord import create_app as create_discord_app
+
+    async def main():
+        apps = [
+            (create_line_app(latency=line_latency, group_size=group_size), line_port),
+            (create_discord_app(GUILD_ID, CHANNEL_ID, latency=discord_latency), discord_port),
+        ]
+        if ingress_port:
+            import logging
+            from config import EVENT_LOG_URL
+            from ingress import WebhookIngress
+            from utils.event_log import open_event_log
+            apps.append((WebhookIngress(open_event_log(EVENT_LOG_URL), logging.getLogger('bench.ingress')).app,
+                         ingress_port))
+        runners = []
+        for app, port in apps:
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, '127.0.0.1', port).start()
+            runners.append(runner)
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+def configure_environment(args, workdir, line_port, bot_port):
+    """匯入 config 之前設定環境變數；已在環境中設定的值優先"""
+    defaults = {
+        'DISCORD_TOKEN': 'bench-token',
+        'DISCORD_CHANNEL_ID': str(CHANNEL_ID),
+        'LINE_CHANNEL_ACCESS_TOKEN': 'bench-access-token',
+        'LINE_CHANNEL_SECRET': CHANNEL_SECRET,
+        'LINE_GROUP_ID': 'Cbench',
+        'LINE_API_BASE': f"http://127.0.0.1:{line_port}",
+        'LINE_DATA_API_BASE': f"http://127.0.0.1:{line_port}",
+        'STICKER_CDN_BASE': f"http://127.0.0.1:{line_port}/stickershop/v1/sticker",
+        'DATA_DIR': str(workdir / 'data'),
+        # 預設放寬發送速率，量測的是橋接本身；加上 --realistic-rates 則使用 config 的預設值
+        'DISCORD_SEND_RATE': '10000',
+        'DISCORD_SEND_BURST': '10000',
+        'SEND_QUEUE_MAX': '100000',
+        # 降級後的媒體通知不含壓測標記，會被算成未到達；需要觀察降級行為時以環境變數開啟
+        'ADMISSION_CONTROL': 'false',
+    }
+    if args.realistic_rates:
+        for key in ('DISCORD_SEND_RATE', 'DISCORD_SEND_BURST', 'SEND_QUEUE_MAX'):
+            defaults.pop(key)
+    if args.split:
+        defaults['BRIDGE_MODE'] = 'consumer'
+        defaults['EVENT_LOG_URL'] = f"sqlite:///{workdir / 'data' / 'events.sqlite3'}"
+        defaults['EVENT_LOG_POLL_INTERVAL'] = '0.02'
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+    os.environ['PORT'] = str(bot_port)
+
+
+class ResourceSampler:
+    """定期取樣本行程的 RSS 與檔案描述元數量"""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.rss = []
+        self.fds = []
+
+    @staticmethod
+    def read_rss():
+        try:
+            with open('/proc/self/status') as fd:
+                for line in fd:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    @staticmethod
+    def count_fds():
+        try:
+            return len(os.listdir('/proc/self/fd'))
+        except OSError:
+            return None
+
+    async def run(self):
+        while True:
+            self.rss.append(self.read_rss())
+            fds = self.count_fds()
+            if fds is not None:
+                self.fds.append(fds)
+            await asyncio.sleep(self.interval)
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def wait_for_deliveries(discord_url, expected, timeout):
+    """輪詢假 Discord 直到所有預期的訊息都到達或逾時，回傳 {訊息ID: 到達時間}"""
+    deadline = time.monotonic() + timeout
+    arrived = {}
+    async with aiohttp.ClientSession() as session:
+        while True:
+            async with session.get(f"{discord_url}/bench/deliveries") as response:
+                data = await response.json()
+            arrived = {}
+            for marker, received in data['deliveries']:
+                arrived.setdefault(marker, received)
+            if expected.issubset(arrived) or time.monotonic() >= deadline:
+                return arrived, data['counters']
+            await asyncio.sleep(0.2)
+
+
+async def run_bench(args, discord_url, webhook_port, bot_port):
+    # 這些匯入依賴上面設定的環境變數
+    from discord.http import Route
+    from main import LineDiscordBot, start_webhook_server
+    from bench.loadgen import LoadGenerator
+
+    Route.API_BASE_URL = f"{discord_url}/api/v{{API_VERSION}}"
+
+    bot = LineDiscordBot()
+    if not args.verbose:
+        # 每則訊息的 INFO 日誌會干擾量測
+        logging.getLogger().setLevel(logging.WARNING)
+    await bot.load_extensions()
+    if bot.loop_watchdog:
+        bot.loop_watchdog.start()
+    temp_task = asyncio.create_task(bot.temp_files.run())
+    archive_task = asyncio.create_task(bot.archive.run()) if bot.archive else None
+    await bot.login(os.environ['DISCORD_TOKEN'])
+
+    # 不連線 gateway：直接以 REST 取得伺服器與頻道
+    guild = await bot.fetch_guild(GUILD_ID)
+    bot._connection._add_guild(guild)
+    channel = await bot.fetch_channel(CHANNEL_ID)
+    bot.routes.bind(channel)
+    if bot.webhook_sender is not None:
+        await bot.webhook_sender.prepare(channel, bot.user)
+    line_cog = bot.get_cog('LineCog')
+    await line_cog.fetch_line_bot_info()
+    runner = await start_webhook_server(line_cog.app)
+
+    sampler = ResourceSampler()
+    sampler_task = asyncio.create_task(sampler.run())
+    baseline_rss = ResourceSampler.read_rss()
+    baseline_fds = ResourceSampler.count_fds()
+
+    generator = LoadGenerator(
+        f"http://127.0.0.1:{webhook_port}/callback",
+        CHANNEL_SECRET,
+        groups=args.groups,
+        media_ratio=args.media_ratio,
+        redelivery_ratio=args.redelivery_ratio,
+        burst=args.burst,
+        seed=args.seed,
+    )
+    try:
+        send_seconds = await generator.run(args.events, concurrency=args.concurrency, rate=args.rate)
+        if bot.coalescer is not None:
+            await bot.coalescer.flush_all()
+        arrived, discord_counters = await wait_for_deliveries(discord_url, set(generator.sent), args.timeout)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{bot_port}/stats") as response:
+                bot_stats = await response.json()
+    finally:
+        sampler_task.cancel()
+        temp_task.cancel()
+        if bot.loop_watchdog:
+            bot.loop_watchdog.stop()
+        await runner.cleanup()
+        await bot.close()
+        bot.outbox.close()
+        if bot.media_cache:
+            bot.media_cache.close()
+        if archive_task:
+            archive_task.cancel()
+            await bot.archive.flush()
+            bot.archive.close()
+
+    latencies = [arrived[key] - sent for key, sent in generator.sent.items() if key in arrived]
+    first_sent = min(generator.sent.values())
+    last_arrival = max((arrived[key] for key in generator.sent if key in arrived), default=first_sent)
+    elapsed = max(last_arrival - first_sent, 1e-9)
+    return {
+        'events_sent': len(generator.sent),
+        'events_delivered': len(latencies),
+        'redelivered_events': generator.redeliveries,
+        'webhook_requests': generator.requests,
+        'webhook_errors': generator.errors,
+        'send_seconds': round(send_seconds, 3),
+        'events_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': _ms(percentile(latencies, 0.50)),
+            'p90': _ms(percentile(latencies, 0.90)),
+            'p99': _ms(percentile(latencies, 0.99)),
+            'max': _ms(max(latencies) if latencies else None),
+            'mean': _ms(statistics.fmean(latencies) if latencies else None),
+        },
+        'rss_mb': {
+            'baseline': _mb(baseline_rss),
+            'peak': _mb(max(sampler.rss, default=baseline_rss)),
+        },
+        'fds': {
+            'baseline': baseline_fds,
+            'peak': max(sampler.fds, default=baseline_fds),
+        },
+        'discord': discord_counters,
+        'duplicates_skipped': bot_stats['dedup']['duplicates'],
+        'dispatcher_dropped': bot_stats['dispatcher']['dropped'],
+        'loop_lag_max_ms': (bot_stats['loop_watchdog'] or {}).get('max_lag_ms'),
+        'loop_stalls': (bot_stats['loop_watchdog'] or {}).get('stalls'),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def _mb(size):
+    return round(size / (1024 * 1024), 1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Line-Discord 橋接離線壓測')
+    parser.add_argument('--events', type=int, default=2000, help='送出的訊息事件總數')
+    parser.add_argument('--groups', type=int, default=20, help='模擬的 Line 群組數')
+    parser.add_argument('--burst', type=int, default=5, help='每個 webhook 請求包含的事件數')
+    parser.add_argument('--media-ratio', type=float, default=0.1, help='媒體訊息比例')
+    parser.add_argument('--redelivery-ratio', type=float, default=0.05, help='重送請求比例')
+    parser.add_argument('--concurrency', type=int, default=8, help='同時進行的 webhook 請求數')
+    parser.add_argument('--rate', type=float, default=None, help='每秒事件數上限（預設不限）')
+    parser.add_argument('--line-latency-ms', type=float, default=0.0, help='假 Line API 的回應延遲')
+    parser.add_argument('--discord-latency-ms', type=float, default=0.0, help='假 Discord API 的回應延遲')
+    parser.add_argument('--group-size', type=int, default=0, help='假群組成員 ID 清單的人數（預載用）')
+    parser.add_argument('--timeout', type=float, default=120.0, help='等待所有訊息到達的秒數')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--realistic-rates', action='store_true', help='使用 config 預設的 Discord 發送速率')
+    parser.add_argument('--json', action='store_true', help='以 JSON 輸出結果')
+    parser.add_argument('--verbose', action='store_true', help='保留機器人的 INFO 日誌')
+    parser.add_argument('--split', action='store_true', help='以拆分部署執行（Webhook 入口 + 事件日誌 + consumer）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    line_port, discord_port, webhook_port = free_port(), free_port(), free_port()
+    # 單一行程時 webhook 直接送到機器人；拆分部署時送到子行程中的入口
+    bot_port = free_port() if args.split else webhook_port
+
+    # 在暫存目錄中執行，temp_images / data 不會寫進專案目錄
+    workdir = Path(tempfile.mkdtemp(prefix='line-dc-bench-'))
+    sys.path.insert(0, str(REPO_ROOT))
+    os.chdir(workdir)
+    configure_environment(args, workdir, line_port, bot_port)
+
+    fakes = multiprocessing.Process(
+        target=serve_fakes,
+        args=(line_port, discord_port, args.line_latency_ms / 1000, args.discord_latency_ms / 1000,
+              args.group_size, webhook_port if args.split else None),
+        daemon=True,
+    )
+    fakes.start()
+    try:
+        time.sleep(0.5)
+        report = asyncio.run(run_bench(args, f"http://127.0.0.1:{discord_port}", webhook_port, bot_port))
+    finally:
+        fakes.terminate()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    latency = report['latency_ms']
+    print(f"事件：送出 {report['events_sent']}，到達 {report['events_delivered']}，"
+          f"重送 {report['redelivered_events']}（略過 {report['duplicates_skipped']}）")
+    print(f"吞吐量：{report['events_per_second']} events/s")
+    print(f"端對端延遲：p50 {latency['p50']} ms，p90 {latency['p90']} ms，p99 {latency['p99']} ms，"
+          f"max {latency['max']} ms")
+    print(f"記憶體：RSS {report['rss_mb']['baseline']} → 峰值 {report['rss_mb']['peak']} MB")
+    print(f"檔案描述元：{report['fds']['baseline']} → 峰值 {report['fds']['peak']}")
+    print(f"Discord：{report['discord']['messages']} 則訊息（webhook {report['discord']['webhook_messages']} 則），"
+          f"{report['discord']['attachments']} 個附件")
+    if report['loop_lag_max_ms'] is not None:
+        print(f"事件循環：最大延遲 {report['loop_lag_max_ms']} ms，超過門檻 {report['loop_stalls']} 次")
+
+
+if __name__ == '__main__':
+    main()
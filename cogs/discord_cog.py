@@ -1,44 +1,167 @@
+import time
 import asyncio
+from datetime import datetime
+import pytz
 import discord
 from discord.commands import Option
 from discord.ext import commands
-from config import DISCORD_CHANNEL_ID, LINE_GROUP_ID
-from linebot.models import TextSendMessage
+from config import LINE_PUSH_BATCH_WINDOW_MS, TIMEZONE_NAME
+from utils.rate_limit import SchedulerOverloaded
+from utils.push_batcher import PushBatcher
+from utils.metrics import LINE_PUSH
+from utils.logging_utils import truncate_payload
+from utils.archive import DIRECTION_DISCORD_TO_LINE, DIRECTION_LINE_TO_DISCORD, parse_time_bound
+from utils.line_client import new_retry_key
+
+# Line 文字訊息的長度上限
+LINE_TEXT_LIMIT = 5000
+# Line 圖片訊息只接受 JPEG / PNG、最大 10MB；其他圖片改以連結附在文字中，
+# 否則同一次 push 中的其他訊息會一起被拒絕
+LINE_IMAGE_TYPES = ('image/jpeg', 'image/png')
+LINE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+# Discord 訊息的長度上限，以及搜尋結果中每則訊息最多顯示的字數
+DISCORD_TEXT_LIMIT = 2000
+SEARCH_TEXT_PREVIEW = 150
+
+_SEARCH_KIND_LABELS = {
+    'image': '[圖片]',
+    'sticker': '[貼圖]',
+    'video': '[影片]',
+    'audio': '[語音]',
+    'file': '[檔案]',
+    'attachment': '[附件]',
+}
 
 class DiscordCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.logger = bot.logger
-        self.discord_channel = None
-        self.discord_channel_id = DISCORD_CHANNEL_ID
+        self.routes = bot.routes
+        
+        # Discord → Line 轉發：多則訊息打包成一次 push
+        self.push_batcher = None
+        if any(bridge.relay_to_line for bridge in self.routes):
+            self.push_batcher = PushBatcher(
+                self._push_to_line,
+                window=LINE_PUSH_BATCH_WINDOW_MS / 1000,
+                on_failure=self._report_push_failure,
+            )
+    
+    async def _push_to_line(self, to, messages):
+        line_cog = self.bot.get_cog('LineCog')
+        started = time.perf_counter()
+        # 排程遇到 429 重試時沿用同一個重送鍵
+        retry_key = new_retry_key()
+        await self.bot.line_scheduler.submit(
+            'push', lambda: line_cog.line_api.push_message(to, messages, retry_key=retry_key)
+        )
+        LINE_PUSH.observe_since(started)
+        self.logger.info(f"已推送 {len(messages)} 則訊息到Line")
+    
+    async def _report_push_failure(self, to, origins, error):
+        """Discord → Line 為盡力轉發：重試後仍失敗時，標記原訊息並通知發送者重新發送"""
+        if not origins:
+            return
+        for origin in origins:
+            try:
+                await origin.add_reaction('⚠️')
+            except discord.DiscordException as e:
+                self.logger.warning(f"無法在訊息上標記推送失敗: {e}")
+        # 同一批次都送往同一個 Line 目標，因此來自同一個橋接頻道
+        channel = origins[0].channel
+        mentions = ' '.join(dict.fromkeys(origin.author.mention for origin in origins))
+        notice = f"⚠️ {mentions} 有 {len(origins)} 則訊息未能轉發到 Line，請稍後重新發送"
+        await self.bot.discord_scheduler.submit(
+            channel.id,
+            lambda: channel.send(notice, allowed_mentions=discord.AllowedMentions(users=True)),
+        )
     
     @commands.Cog.listener()
     async def on_ready(self):
         """Discord Bot 啟動完成時執行"""
         self.logger.info(f'Discord Bot {self.bot.user} 已連接！')
         
-        # 初始化頻道
-        self.discord_channel = self.bot.get_channel(self.discord_channel_id)
-        if self.discord_channel is None:
-            self.logger.error(f"無法找到指定的Discord頻道 ID: {self.discord_channel_id}")
+        # 解析並快取所有橋接的頻道
+        missing = self.routes.resolve(self.bot.get_channel)
+        for channel_id in missing:
+            self.logger.error(f"無法找到指定的Discord頻道 ID: {channel_id}")
+        if len(missing) == len(self.routes):
             return
-        self.logger.info(f"已連接到Discord頻道: {self.discord_channel.name}")
+        self.logger.info(f"已連接到 {len(self.routes) - len(missing)} 個Discord頻道")
+        
+        # webhook 發送模式：每個頻道建立或取得一次 webhook
+        if self.bot.webhook_sender is not None:
+            for bridge in self.routes:
+                if bridge.channel is not None:
+                    await self.bot.webhook_sender.prepare(bridge.channel, self.bot.user)
         
         # 獲取 Line Bot ID
         line_cog = self.bot.get_cog('LineCog')
         if line_cog:
             await line_cog.fetch_line_bot_info()
         
-        # 重發未發送的訊息
-        if self.bot.unsent_messages:
-            self.logger.info(f"重新發送 {len(self.bot.unsent_messages)} 則暫存訊息")
-            for msg in self.bot.unsent_messages:
-                try:
-                    await self.discord_channel.send(msg)
-                    self.logger.info(f"成功重新發送訊息: {msg}")
-                except Exception as e:
-                    self.logger.error(f"重新發送訊息時發生錯誤: {e}")
-            self.bot.unsent_messages.clear()
+        # 重發待送佇列中的訊息
+        if self.bot.outbox_pending:
+            self.logger.info(f"重新發送 {await self.bot.outbox.count()} 則暫存訊息")
+            self.bot.kick_outbox_replay()
+    
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """轉發橋接頻道中的一般訊息與附件到 Line 群組"""
+        if self.push_batcher is None:
+            return
+        bridge = self.routes.for_channel(message.channel.id)
+        if bridge is None or not bridge.relay_to_line or not bridge.line_id:
+            return
+        # 忽略機器人與 webhook（包含本機器人轉發過來的 Line 訊息）
+        if message.author.bot or message.webhook_id:
+            return
+        
+        line_messages = self.build_line_messages(message)
+        if line_messages:
+            bridge.to_line += 1
+            self.push_batcher.add(bridge.line_id, line_messages, origin=message)
+            if self.bot.archive is not None:
+                names = ' '.join(attachment.filename for attachment in message.attachments)
+                self.bot.archive.record(
+                    DIRECTION_DISCORD_TO_LINE,
+                    'text' if message.clean_content else 'attachment',
+                    ' '.join(filter(None, (message.clean_content, names))),
+                    author=message.author.display_name,
+                    author_id=str(message.author.id),
+                    line_id=bridge.line_id,
+                    channel_id=bridge.channel_id,
+                )
+    
+    @staticmethod
+    def build_line_messages(message):
+        """將一則 Discord 訊息轉成 Line 訊息物件：文字一則、每張 JPEG / PNG 圖片一則，其他附件以連結附在文字中"""
+        author = message.author.display_name
+        lines = [message.clean_content] if message.clean_content else []
+        images = []
+        for attachment in message.attachments:
+            content_type = (attachment.content_type or '').split(';')[0].strip().lower()
+            if content_type in LINE_IMAGE_TYPES and attachment.size <= LINE_IMAGE_MAX_BYTES:
+                images.append({
+                    'type': 'image',
+                    'originalContentUrl': attachment.url,
+                    'previewImageUrl': attachment.proxy_url or attachment.url,
+                })
+            else:
+                lines.append(f"{attachment.filename}: {attachment.url}")
+        
+        line_messages = []
+        if lines:
+            text = f"[Discord] {author}: " + "\n".join(lines)
+            line_messages.append({'type': 'text', 'text': text[:LINE_TEXT_LIMIT]})
+        elif images:
+            line_messages.append({'type': 'text', 'text': f"[Discord] {author} 傳送了圖片"})
+        return line_messages + images
+    
+    def upload_limit(self, channel_id=None):
+        """取得頻道所屬伺服器的附件上傳上限（依伺服器加成等級）"""
+        guild = getattr(self.routes.channel(channel_id), 'guild', None)
+        return getattr(guild, 'filesize_limit', None)
     
     @commands.slash_command(name="say_line", description="發送訊息到Line群組")
     async def say_line(self, ctx, message: Option(str, "要發送到Line的訊息")):
@@ -49,20 +172,106 @@ class DiscordCog(commands.Cog):
                 await ctx.respond("錯誤：Line 功能尚未初始化", ephemeral=True)
                 return
                 
-            if not LINE_GROUP_ID:
-                await ctx.respond("錯誤：未設定LINE_GROUP_ID環境變數", ephemeral=True)
+            # 在橋接頻道中使用時送往對應的 Line 群組，否則送往預設橋接
+            bridge = self.routes.for_channel(ctx.channel_id) or self.routes.default
+            if bridge is None or not bridge.line_id:
+                await ctx.respond("錯誤：這個頻道沒有對應的Line群組（請設定LINE_GROUP_ID或橋接設定檔）", ephemeral=True)
                 return
             
-            line_cog.line_bot_api.push_message(
-                LINE_GROUP_ID, 
-                TextSendMessage(text=f"[Discord] {ctx.author.display_name}: {message}")
+            text_message = {'type': 'text', 'text': f"[Discord] {ctx.author.display_name}: {message}"}
+            retry_key = new_retry_key()
+            await self.bot.line_scheduler.submit(
+                'push',
+                lambda: line_cog.line_api.push_message(bridge.line_id, [text_message], retry_key=retry_key),
             )
+            bridge.to_line += 1
+            if self.bot.archive is not None:
+                self.bot.archive.record(
+                    DIRECTION_DISCORD_TO_LINE, 'text', message,
+                    author=ctx.author.display_name,
+                    author_id=str(ctx.author.id),
+                    line_id=bridge.line_id,
+                    channel_id=bridge.channel_id,
+                )
             
             await ctx.respond(f"已成功發送訊息到Line: {message}", ephemeral=False)
-            self.logger.info(f"Discord用戶 {ctx.author.display_name} 發送訊息到Line: {message}")
+            self.logger.info(
+                "Discord用戶 %s 發送訊息到Line: %s", ctx.author.display_name, truncate_payload(message)
+            )
+        except SchedulerOverloaded:
+            self.logger.warning("Line 發送佇列已滿，拒絕這次發送")
+            await ctx.respond("Line 發送忙碌中，請稍後再試", ephemeral=True)
         except Exception as e:
             self.logger.error(f"發送訊息到Line時發生錯誤: {e}")
             await ctx.respond(f"發送訊息到Line時發生錯誤: {str(e)}", ephemeral=True)
 
+    @commands.slash_command(name="search", description="搜尋這個橋接頻道的轉發紀錄")
+    async def search(
+        self,
+        ctx,
+        keyword: Option(str, "關鍵字（以空白分隔，需全部符合）", required=False, default=''),
+        author: Option(str, "發送者名稱", required=False, default=''),
+        since: Option(str, "開始時間：7d、12h 或 2024-01-31", required=False, default=''),
+        until: Option(str, "結束時間：1d 或 2024-01-31（含當天）", required=False, default=''),
+        limit: Option(int, "顯示筆數", required=False, default=10, min_value=1, max_value=25),
+    ):
+        """處理 Discord 斜線指令：以關鍵字、發送者與時間範圍搜尋訊息存檔"""
+        archive = self.bot.archive
+        if archive is None:
+            await ctx.respond("訊息存檔未啟用（請設定 ARCHIVE=true）", ephemeral=True)
+            return
+        # 只能搜尋所在橋接頻道的紀錄，避免看到其他群組的訊息
+        bridge = self.routes.for_channel(ctx.channel_id)
+        if bridge is None:
+            await ctx.respond("請在橋接頻道中使用這個指令", ephemeral=True)
+            return
+        
+        tz = pytz.timezone(TIMEZONE_NAME)
+        try:
+            since_ts = parse_time_bound(since, tz)
+            until_ts = parse_time_bound(until, tz, end=True)
+        except ValueError as e:
+            await ctx.respond(str(e), ephemeral=True)
+            return
+        
+        try:
+            started = time.perf_counter()
+            results = await archive.search(
+                keyword, author, since=since_ts, until=until_ts, channel_id=bridge.channel_id, limit=limit
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        except Exception as e:
+            self.logger.error(f"搜尋訊息存檔時發生錯誤: {e}")
+            await ctx.respond(f"搜尋時發生錯誤: {str(e)}", ephemeral=True)
+            return
+        
+        if not results:
+            await ctx.respond("找不到符合條件的訊息", ephemeral=True)
+            return
+        header = f"找到 {len(results)} 則（{elapsed_ms:.0f} ms，最新的在前）："
+        lines = [header]
+        used = len(header)
+        for result in results:
+            line = self.format_search_result(result, tz)
+            if used + len(line) + 1 > DISCORD_TEXT_LIMIT:
+                break
+            lines.append(line)
+            used += len(line) + 1
+        await ctx.respond("\n".join(lines), ephemeral=True)
+    
+    @staticmethod
+    def format_search_result(result, tz):
+        """[時間] 方向 發送者: 內容"""
+        when = datetime.fromtimestamp(result.ts, tz).strftime('%Y-%m-%d %H:%M')
+        direction = 'Line→DC' if result.direction == DIRECTION_LINE_TO_DISCORD else 'DC→Line'
+        text = result.text or ''
+        if len(text) > SEARCH_TEXT_PREVIEW:
+            text = text[:SEARCH_TEXT_PREVIEW] + '…'
+        label = _SEARCH_KIND_LABELS.get(result.kind)
+        if label:
+            text = f"{label} {text}".rstrip()
+        text = discord.utils.escape_mentions(discord.utils.escape_markdown(text.replace('\n', ' ')))
+        return f"`{when}` {direction} **{discord.utils.escape_markdown(result.author or '')}**: {text}"
+
 def setup(bot):
     bot.add_cog(DiscordCog(bot))
\ No newline at end of file
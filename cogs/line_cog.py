@@ -1,241 +1,835 @@
-import os
-import uuid
-import json
+import time
+import logging
 import asyncio
-import discord
-import mimetypes
-import os
-import json
-import uuid
 import mimetypes
 from pathlib import Path
-from collections import deque
-from flask import Flask, request, abort
+from aiohttp import web
 from discord.ext import commands
 
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
-from linebot.models import (
-    MessageEvent, TextMessage, ImageMessage, VideoMessage, AudioMessage,
-    FileMessage, StickerMessage
-)
 
 from config import (
     LINE_CHANNEL_ACCESS_TOKEN,
     LINE_CHANNEL_SECRET,
-    LINE_GROUP_ID,
-    TEMP_DIR,
+    LINE_WORKER_SHARDS,
+    LINE_SHARD_QUEUE_SIZE,
+    PROFILE_CACHE_SIZE,
+    PROFILE_CACHE_TTL,
+    PROFILE_CACHE_NEGATIVE_TTL,
+    PROFILE_PREFETCH,
+    MEDIA_SPOOL_THRESHOLD,
+    MEDIA_READ_CHUNK_SIZE,
+    MEDIA_MAX_BYTES,
+    DATA_DIR,
+    DEDUP_CAPACITY,
+    DEDUP_SNAPSHOT_INTERVAL,
+    LINE_LIGHTWEIGHT_EVENTS,
+    LINE_API_BASE,
+    LINE_DATA_API_BASE,
+    LINE_API_TIMEOUT,
+    LINE_API_MAX_RETRIES,
+    LINE_API_CONCURRENCY,
+    MEDIA_SHAPING,
+    MEDIA_SHAPER_WORKERS,
+    MEDIA_SHAPER_CONCURRENCY,
+    MEDIA_SHAPER_TIMEOUT,
+    MEDIA_SHAPER_CPU_BUDGET,
+    MEDIA_IMAGE_TARGET_BYTES,
+    MEDIA_IMAGE_MAX_DIMENSION,
+    MEDIA_SPLIT_MAX_BYTES,
+    MEDIA_SHRINK_MAX_BYTES,
+    STICKER_IMAGES,
+    STICKER_CDN_BASE,
+    STICKER_CACHE_MAX_BYTES,
+    STICKER_MEMORY_ENTRIES,
+    STICKER_FETCH_TIMEOUT,
+    BRIDGE_MODE,
+    EVENT_LOG_URL,
+    EVENT_LOG_RETENTION_HOURS,
+    EVENT_LOG_BATCH,
+    EVENT_LOG_POLL_INTERVAL,
+    COALESCE_WINDOW_MS,
+    ADMISSION_CONTROL,
+    ADMISSION_QUEUE_HIGH,
+    ADMISSION_AGE_HIGH,
+    ADMISSION_429_HIGH,
+    ADMISSION_RECOVER_SECONDS,
+    ADMISSION_COALESCE_WINDOW_MS,
+)
+from utils.event_dispatcher import ShardedDispatcher, conversation_key
+from utils.profile_cache import ProfileCache, LineProfile
+from utils.file_utils import spool_stream, MediaTooLargeError, SpooledMedia
+from utils.line_client import AsyncLineClient
+from utils.media_shaper import MediaShaper
+from utils.sticker_cache import StickerCache
+from utils.dedup import EventDeduplicator
+from utils.event_log import open_event_log, EventLogConsumer
+from utils.admission import AdmissionController, MODE_COALESCE
+from utils.archive import DIRECTION_LINE_TO_DISCORD
+from utils.line_events import verify_signature, loads, build_events
+from utils.logging_utils import should_log_payload, truncate_payload
+from utils.metrics import (
+    REGISTRY, gauge_callback, WEBHOOK_VERIFY, WEBHOOK_PARSE, PROFILE_LOOKUP, MEDIA_DOWNLOAD,
+    EVENTS_ACCEPTED, EVENTS_DUPLICATE, EVENTS_REJECTED,
 )
 
 
 class LineCog(commands.Cog):
     """
     Line 事件處理 Cog：
-    - 建立 Flask Webhook 端點
+    - 建立 aiohttp Webhook 端點（與 Discord 共用同一個事件循環）
     - 針對文字/圖片/貼圖/媒體(MessageEvent) 轉發到 Discord
-    - Redelivery 去重，避免重複轉發
-    - 對於媒體檔案，<=25MB 直接轉傳到 Discord，否則僅通知文字
+    - 事件依對話分片排入工作池，同一對話依序、不同對話平行處理
+    - 以 webhookEventId 逐筆去重（含 Redelivery），去重索引會快照到磁碟
+    - 媒體檔案在下載前依大小判斷，未超過 Discord 上傳上限才轉傳，否則僅通知文字
+    - 啟用媒體整形時，過大的圖片會縮小、過大的檔案會切成分割壓縮檔後轉傳
+    - 下載時同時計算內容雜湊，轉傳過的相同媒體改為回覆原訊息
+    - BRIDGE_MODE=consumer 時不提供 /callback，改從 ingress 寫入的事件日誌依序讀取事件
+    - 准入控制：過載時媒體只通知不下載、名稱只查快取、文字以較長視窗合併，壓力解除後自動恢復
     """
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = bot.logger
 
-        # Line SDK 初始化
-        self.line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
-        self.handler = WebhookHandler(LINE_CHANNEL_SECRET)
+        # Line API 用戶端（非同步、共用連線池）
+        self.line_api = AsyncLineClient(
+            LINE_CHANNEL_ACCESS_TOKEN,
+            api_base=LINE_API_BASE,
+            data_base=LINE_DATA_API_BASE,
+            timeout=LINE_API_TIMEOUT,
+            max_retries=LINE_API_MAX_RETRIES,
+            concurrency=LINE_API_CONCURRENCY,
+        )
+        self.channel_secret = (LINE_CHANNEL_SECRET or '').encode('utf-8')
 
         # 狀態/快取
-        self.processed_message_ids = deque(maxlen=200)
+        self.deduplicator = EventDeduplicator(
+            capacity=DEDUP_CAPACITY,
+            snapshot_path=Path(DATA_DIR) / "dedup.json",
+        )
+        self.deduplicator.load()
+        self._dedup_task = None
         self.line_bot_id = None
+        self.profile_cache = ProfileCache(
+            max_size=PROFILE_CACHE_SIZE,
+            ttl=PROFILE_CACHE_TTL,
+            negative_ttl=PROFILE_CACHE_NEGATIVE_TTL,
+        )
+        self.media_stats = {
+            'admitted': 0,
+            'rejected_by_size': 0,
+            'aborted_mid_stream': 0,
+            'bytes_avoided': 0,
+        }
+        self.media_shaper = None
+        if MEDIA_SHAPING:
+            self.media_shaper = MediaShaper(
+                workers=MEDIA_SHAPER_WORKERS,
+                concurrency=MEDIA_SHAPER_CONCURRENCY,
+                timeout=MEDIA_SHAPER_TIMEOUT,
+                cpu_budget_per_minute=MEDIA_SHAPER_CPU_BUDGET,
+                image_target_bytes=MEDIA_IMAGE_TARGET_BYTES,
+                image_max_dimension=MEDIA_IMAGE_MAX_DIMENSION,
+                max_input_bytes=MEDIA_SHRINK_MAX_BYTES,
+            )
+        self.sticker_cache = None
+        if STICKER_IMAGES:
+            self.sticker_cache = StickerCache(
+                Path(DATA_DIR) / "sticker_cache",
+                STICKER_CDN_BASE,
+                max_bytes=STICKER_CACHE_MAX_BYTES,
+                memory_entries=STICKER_MEMORY_ENTRIES,
+                timeout=STICKER_FETCH_TIMEOUT,
+            )
+        self.unrouted_events = 0
+        self.webhook_stats = {
+            'requests': 0,
+            'events': 0,
+            'cpu_seconds': 0.0,
+        }
+
+        # 事件工作池（隨 Web 應用啟動/關閉）
+        self.dispatcher = ShardedDispatcher(
+            self.dispatch_event,
+            shards=LINE_WORKER_SHARDS,
+            queue_size=LINE_SHARD_QUEUE_SIZE,
+        )
 
-        # Flask 應用 (供 main.py 啟動)
-        self.app = Flask(__name__)
+        # 准入控制（依佇列深度、事件等待時間與 Discord 429 頻率切換降級模式）
+        self.admission = None
+        self._admission_task = None
+        if ADMISSION_CONTROL:
+            self.admission = AdmissionController(
+                self._admission_probe,
+                queue_high=ADMISSION_QUEUE_HIGH,
+                age_high=ADMISSION_AGE_HIGH,
+                throttle_high=ADMISSION_429_HIGH,
+                recover_seconds=ADMISSION_RECOVER_SECONDS,
+                on_change=self._on_admission_change,
+            )
+
+        # 拆分部署時的事件日誌消費者
+        self.consumer = None
+        self._consumer_task = None
+        if BRIDGE_MODE == 'consumer':
+            self.consumer = EventLogConsumer(
+                open_event_log(EVENT_LOG_URL, retention_seconds=EVENT_LOG_RETENTION_HOURS * 3600),
+                self.dispatcher,
+                batch=EVENT_LOG_BATCH,
+                poll_interval=EVENT_LOG_POLL_INTERVAL,
+                lightweight=LINE_LIGHTWEIGHT_EVENTS,
+            )
+
+        # aiohttp 應用 (供 main.py 啟動)
+        self.app = web.Application()
+        self.app.on_startup.append(self._on_app_startup)
+        self.app.on_cleanup.append(self._on_app_cleanup)
         self._setup_routes()
-
-        # 註冊 Line 事件處理
-        self._setup_line_handlers()
-
-        # 確保暫存資料夾存在
-        Path(TEMP_DIR).mkdir(exist_ok=True, parents=True)
+        self._register_metrics()
 
     # -----------------------------
-    # Flask Routes
+    # Web Routes
     # -----------------------------
     def _setup_routes(self):
-        @self.app.route("/callback", methods=['POST'])
-        def callback():
-            signature = request.headers.get('X-Line-Signature')
-            body = request.get_data(as_text=True)
-            self.logger.info("收到Line訊息: %s", body)
-
-            # Redelivery 去重：先試著從 body 取出 message id，避免重入
-            try:
-                payload = json.loads(body)
-                for ev in payload.get('events', []):
-                    msg = ev.get('message') or {}
-                    msg_id = msg.get('id')
-                    if msg_id and msg_id in self.processed_message_ids:
-                        self.logger.info(f"跳過重複訊息 ID: {msg_id}")
-                        return 'OK'
-            except Exception as e:
-                self.logger.warning(f"Webhook payload 預解析失敗：{e}")
+        if self.consumer is None:
+            self.app.router.add_post("/callback", self.callback)
+        self.app.router.add_get("/", self.index)
+        self.app.router.add_get("/stats", self.stats)
+        self.app.router.add_get("/metrics", self.metrics)
+
+    async def _on_app_startup(self, app):
+        self.dispatcher.start()
+        self._dedup_task = asyncio.create_task(self._dedup_snapshot_loop())
+        if self.consumer is not None:
+            self._consumer_task = asyncio.create_task(self.consumer.run())
+        if self.admission is not None:
+            self._admission_task = asyncio.create_task(self.admission.run())
+
+    async def _on_app_cleanup(self, app):
+        if self._admission_task:
+            self._admission_task.cancel()
+        if self._consumer_task:
+            self._consumer_task.cancel()
+            await asyncio.gather(self._consumer_task, return_exceptions=True)
+            await self.consumer.event_log.close()
+        await self.dispatcher.stop()
+        if self._dedup_task:
+            self._dedup_task.cancel()
+        await self._save_dedup_snapshot()
+        await self.line_api.close()
+        if self.sticker_cache:
+            await self.sticker_cache.close()
+        if self.media_shaper:
+            self.media_shaper.shutdown()
+
+    async def _dedup_snapshot_loop(self):
+        """定期將去重索引寫入磁碟（只有變動時才寫）"""
+        while True:
+            await asyncio.sleep(DEDUP_SNAPSHOT_INTERVAL)
+            await self._save_dedup_snapshot()
+
+    async def _save_dedup_snapshot(self):
+        if not self.deduplicator.dirty:
+            return
+        try:
+            await asyncio.to_thread(self.deduplicator.save, self.deduplicator.snapshot())
+        except Exception as e:
+            self.logger.warning(f"寫入去重快照失敗: {e}")
+
+    async def callback(self, request: web.Request) -> web.Response:
+        signature = request.headers.get('X-Line-Signature', '')
+        body = await request.read()
+        started = time.thread_time()
+
+        # 在原始 bytes 上驗證簽名，之後只解析一次，去重與分派共用同一份結果
+        stage_started = time.perf_counter()
+        if not verify_signature(self.channel_secret, body, signature):
+            self.logger.error("無效的簽名")
+            raise web.HTTPBadRequest()
+        WEBHOOK_VERIFY.observe_since(stage_started)
+        stage_started = time.perf_counter()
+        try:
+            payload = loads(body)
+            events = build_events(payload, lightweight=LINE_LIGHTWEIGHT_EVENTS)
+        except Exception as e:
+            self.logger.exception(f"處理 Webhook 時發生未預期錯誤: {e}")
+            raise web.HTTPInternalServerError()
+        WEBHOOK_PARSE.observe_since(stage_started)
+        self.logger.info(f"收到Line webhook：{len(events)} 則訊息事件")
+        if self.logger.isEnabledFor(logging.DEBUG) and should_log_payload():
+            self.logger.debug("Webhook 內容（抽樣）: %s", truncate_payload(body))
+
+        # 逐筆去重後排入工作池，先回應 Line
+        rejected = 0
+        for event in events:
+            key = self._dedup_key(event)
+            if key and self.deduplicator.is_duplicate(key):
+                redelivery = getattr(getattr(event, 'delivery_context', None), 'is_redelivery', False)
+                self.logger.info(f"跳過重複事件: {key}（redelivery={redelivery}）")
+                EVENTS_DUPLICATE.inc()
+                continue
+            if not self.dispatcher.submit(event):
+                rejected += 1
+                EVENTS_REJECTED.inc()
+                continue
+            EVENTS_ACCEPTED.inc()
+            if key:
+                self.deduplicator.add(key)
+
+        self.webhook_stats['requests'] += 1
+        self.webhook_stats['events'] += len(events)
+        self.webhook_stats['cpu_seconds'] += time.thread_time() - started
+
+        if rejected:
+            # 工作池已滿：要求 Line 重送，已排入的事件在重送時會被去重略過
+            raise web.HTTPServiceUnavailable()
+        return web.Response(text='OK')
+
+    async def index(self, request: web.Request) -> web.Response:
+        return web.Response(text='Line-Discord Bot 運行中。Webhook 請指向 /callback')
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'dispatcher': self.dispatcher.stats(),
+            'profile_cache': self.profile_cache.stats(),
+            'media': self.media_stats,
+            'media_shaper': self.media_shaper.stats() if self.media_shaper else None,
+            'media_cache': self.bot.media_cache.stats() if self.bot.media_cache else None,
+            'sticker_cache': self.sticker_cache.stats() if self.sticker_cache else None,
+            'temp_files': self.bot.temp_files.stats(),
+            'webhook': self._webhook_summary(),
+            'dedup': {'size': len(self.deduplicator), 'duplicates': self.deduplicator.duplicates},
+            'coalescer': self.bot.coalescer.stats() if self.bot.coalescer else None,
+            'discord_scheduler': self.bot.discord_scheduler.stats(),
+            'line_scheduler': self.bot.line_scheduler.stats(),
+            'line_api': self.line_api.stats(),
+            'line_push_batcher': self._push_batcher_summary(),
+            'webhook_sender': self.bot.webhook_sender.stats() if self.bot.webhook_sender else None,
+            'routes': self.bot.routes.stats(),
+            'unrouted_events': self.unrouted_events,
+            'event_log_consumer': self.consumer.stats() if self.consumer else None,
+            'admission': self.admission.stats() if self.admission else None,
+            'archive': self.bot.archive.stats() if self.bot.archive else None,
+            'loop_watchdog': self.bot.loop_watchdog.stats() if self.bot.loop_watchdog else None,
+        })
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Prometheus 文字格式的指標"""
+        return web.Response(
+            text=REGISTRY.render(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
 
-            try:
-                self.handler.handle(body, signature)
-            except InvalidSignatureError:
-                self.logger.error("無效的簽名")
-                abort(400)
-            except Exception as e:
-                self.logger.exception(f"處理 Webhook 時發生未預期錯誤: {e}")
-                abort(500)
+    def _register_metrics(self):
+        """各元件已有的計數與佇列深度在抓取時才讀取"""
+        bot = self.bot
+        gauge_callback(
+            'bridge_queue_depth', '各佇列目前的長度', ('queue',),
+            lambda: [
+                (('dispatcher',), self.dispatcher.queue_depth()),
+                (('discord_scheduler',), bot.discord_scheduler.queue_depth()),
+                (('line_scheduler',), bot.line_scheduler.queue_depth()),
+            ],
+        )
+        gauge_callback(
+            'bridge_cache_lookups_total', '快取查詢次數（依結果）', ('cache', 'result'),
+            lambda: [
+                (('profile', 'hit'), self.profile_cache.hits),
+                (('profile', 'negative_hit'), self.profile_cache.negative_hits),
+                (('profile', 'miss'), self.profile_cache.misses),
+                (('profile', 'coalesced'), self.profile_cache.coalesced),
+                (('media', 'hit'), bot.media_cache.hits if bot.media_cache else None),
+                (('media', 'miss'), bot.media_cache.misses if bot.media_cache else None),
+                (('sticker', 'hit'), self.sticker_cache.memory.hits if self.sticker_cache else None),
+                (('sticker', 'disk_hit'), self.sticker_cache.disk_hits if self.sticker_cache else None),
+                (('sticker', 'miss'), self.sticker_cache.fetched if self.sticker_cache else None),
+            ],
+            type='counter',
+        )
+        gauge_callback(
+            'bridge_scheduler_events_total', '發送排程的計數', ('scheduler', 'event'),
+            lambda: [
+                ((scheduler.name, event), getattr(scheduler, event))
+                for scheduler in (bot.discord_scheduler, bot.line_scheduler)
+                for event in ('sent', 'shed', 'throttled')
+            ],
+            type='counter',
+        )
+        gauge_callback(
+            'bridge_dispatcher_dropped_total', '工作池已滿而拒收的事件數', (),
+            lambda: [((), self.dispatcher.dropped)],
+            type='counter',
+        )
+        gauge_callback(
+            'bridge_media_total', '媒體下載的計數', ('result',),
+            lambda: [((key,), value) for key, value in self.media_stats.items() if key != 'bytes_avoided'],
+            type='counter',
+        )
+        gauge_callback(
+            'bridge_media_bytes_avoided_total', '因超過大小上限而未下載的位元組數', (),
+            lambda: [((), self.media_stats['bytes_avoided'])],
+            type='counter',
+        )
+        gauge_callback(
+            'bridge_route_messages_total', '各橋接轉發的訊息數', ('route', 'direction'),
+            lambda: [
+                item
+                for bridge in bot.routes
+                for item in (
+                    ((bridge.name, 'line_to_discord'), bridge.to_discord),
+                    ((bridge.name, 'discord_to_line'), bridge.to_line),
+                )
+            ],
+            type='counter',
+        )
+        gauge_callback(
+            'bridge_route_queue_depth', '各橋接在 Discord 發送排程中等待的訊息數', ('route',),
+            lambda: [
+                ((bridge.name,), bot.discord_scheduler.queue_depth(bridge.channel_id)
+                 + bot.discord_scheduler.queue_depth(('webhook', bridge.channel_id)))
+                for bridge in bot.routes
+            ],
+        )
+        if self.admission is not None:
+            gauge_callback(
+                'bridge_admission_mode', '准入控制目前的降級等級（0 = 正常）', (),
+                lambda: [((), self.admission.mode)],
+            )
+            gauge_callback(
+                'bridge_admission_pressure', '准入控制的壓力值（1 = 達到門檻）', (),
+                lambda: [((), round(self.admission.pressure, 3))],
+            )
+            gauge_callback(
+                'bridge_admission_shed_total', '降級時略過的工作數', ('action',),
+                lambda: [((action,), count) for action, count in self.admission.shed.items()],
+                type='counter',
+            )
+        if bot.archive is not None:
+            gauge_callback(
+                'bridge_archive_messages_total', '訊息存檔的計數', ('result',),
+                lambda: [((key,), value) for key, value in bot.archive.stats().items() if key != 'pending'],
+                type='counter',
+            )
+            gauge_callback(
+                'bridge_archive_pending', '等待寫入訊息存檔的筆數', (),
+                lambda: [((), bot.archive.stats()['pending'])],
+            )
+        if self.consumer is not None:
+            gauge_callback(
+                'bridge_event_log_consumed_total', '從事件日誌讀取並交給工作池的事件數', (),
+                lambda: [((), self.consumer.consumed)],
+                type='counter',
+            )
+            gauge_callback(
+                'bridge_event_log_inflight', '已讀取但尚未處理完成（未提交位置）的事件數', (),
+                lambda: [((), self.consumer.stats()['inflight'])],
+            )
+        gauge_callback(
+            'bridge_outbox_pending', '待送佇列中是否有訊息', (),
+            lambda: [((), int(bot.outbox_pending))],
+        )
+        gauge_callback(
+            'bridge_temp_bytes', '暫存檔目前使用的位元組數', (),
+            lambda: [((), bot.temp_files.stats()['used_bytes'])],
+        )
 
-            return 'OK'
+    def _admission_probe(self):
+        """准入控制的取樣：（事件與發送佇列深度, 最舊事件等待秒數, Discord 累計被限流次數）"""
+        bot = self.bot
+        depth = self.dispatcher.queue_depth() + bot.discord_scheduler.queue_depth()
+        return depth, self.dispatcher.oldest_age(), bot.discord_scheduler.throttled
 
-        @self.app.route("/", methods=['GET'])
-        def index():
-            return 'Line-Discord Bot 運行中。Webhook 請指向 /callback'
+    def _on_admission_change(self, mode):
+        coalescer = self.bot.coalescer
+        if coalescer is None:
+            return
+        base = COALESCE_WINDOW_MS / 1000
+        coalescer.window = max(base, ADMISSION_COALESCE_WINDOW_MS / 1000) if mode >= MODE_COALESCE else base
+
+    def _push_batcher_summary(self):
+        discord_cog = self.bot.get_cog('DiscordCog')
+        if discord_cog and discord_cog.push_batcher:
+            return discord_cog.push_batcher.stats()
+        return None
+
+    def _webhook_summary(self):
+        stats = dict(self.webhook_stats)
+        requests = stats['requests']
+        stats['avg_cpu_ms_per_request'] = round(stats['cpu_seconds'] * 1000 / requests, 3) if requests else 0.0
+        stats['lightweight_events'] = LINE_LIGHTWEIGHT_EVENTS
+        return stats
 
     # -----------------------------
-    # LINE Handlers 註冊
+    # LINE 事件分派
     # -----------------------------
-    def _setup_line_handlers(self):
-        @self.handler.add(MessageEvent, message=TextMessage)
-        def _on_text(event):
-            self._remember_message_id(event)
-            self.handle_line_text_message(event)
-
-        @self.handler.add(MessageEvent, message=ImageMessage)
-        def _on_image(event):
-            self._remember_message_id(event)
-            self.handle_line_image_message(event)
-
-        @self.handler.add(MessageEvent, message=StickerMessage)
-        def _on_sticker(event):
-            self._remember_message_id(event)
-            self.handle_line_sticker_message(event)
-
-        @self.handler.add(MessageEvent, message=(VideoMessage, AudioMessage, FileMessage))
-        def _on_media(event):
-            self._remember_message_id(event)
-            self.handle_line_media_message(event)
-
-    def _remember_message_id(self, event):
+    async def dispatch_event(self, event):
+        """依訊息類型將事件交給對應的處理函式"""
+        if getattr(event, 'type', None) != 'message':
+            return
+        source_id = conversation_key(event)
+        bridge = self.bot.routes.for_line(source_id)
+        if bridge is None:
+            self.unrouted_events += 1
+            self.logger.warning(f"Line 來源 {source_id} 沒有對應的橋接，略過事件")
+            return
+        bridge.to_discord += 1
+        channel_id = bridge.channel_id
+        message_type = getattr(event.message, 'type', None)
         try:
-            msg_id = getattr(event.message, 'id', None)
-            if msg_id:
-                self.processed_message_ids.append(msg_id)
-        except Exception:
-            pass
+            if message_type == 'text':
+                await self.handle_line_text_message(event, channel_id)
+            elif message_type == 'image':
+                await self.handle_line_image_message(event, channel_id)
+            elif message_type == 'sticker':
+                await self.handle_line_sticker_message(event, channel_id)
+            elif message_type in ('video', 'audio', 'file'):
+                await self.handle_line_media_message(event, channel_id)
+        except Exception as e:
+            self.logger.exception(f"處理 Line 事件時發生未預期錯誤: {e}")
+
+    @staticmethod
+    def _dedup_key(event):
+        """去重鍵：優先使用 webhookEventId，舊格式事件則退回 message id"""
+        event_id = getattr(event, 'webhook_event_id', None)
+        if event_id:
+            return event_id
+        msg_id = getattr(getattr(event, 'message', None), 'id', None)
+        return f"message:{msg_id}" if msg_id else None
 
     # -----------------------------
     # 公用工具
     # -----------------------------
-    def get_user_display_name(self, event) -> str:
-        user_id = event.source.user_id
-        source_type = getattr(event.source, 'type', None)
+    @staticmethod
+    def _idem_key(event):
+        """待送佇列用的去重鍵，同一則 Line 訊息只會排入一次"""
+        return f"line:{event.message.id}"
+
+    def _archive(self, event, author, kind, text='', channel_id=None):
+        """記錄到訊息存檔（未啟用時略過；只放進記憶體佇列，不會拖慢轉發）"""
+        if self.bot.archive is None:
+            return
+        self.bot.archive.record(
+            DIRECTION_LINE_TO_DISCORD, kind, text,
+            author=author.display_name,
+            author_id=event.source.user_id or '',
+            line_id=conversation_key(event),
+            channel_id=channel_id,
+        )
+
+    @staticmethod
+    def _profile_key(source):
+        """快取鍵：群組/聊天室內的暱稱可能與個人資料不同，因此帶上來源"""
+        source_type = getattr(source, 'type', None)
+        if source_type == 'group':
+            return (source.group_id, source.user_id)
+        if source_type == 'room':
+            return (source.room_id, source.user_id)
+        return ('', source.user_id)
+
+    @staticmethod
+    def _to_profile(data):
+        return LineProfile(data['displayName'], data.get('pictureUrl'))
+
+    async def _load_profile(self, source):
+        """向 Line API 查詢顯示名稱與頭像，失敗回傳 None"""
+        user_id = source.user_id
+        source_type = getattr(source, 'type', None)
         try:
             if source_type == 'group':
-                group_id = event.source.group_id
                 try:
-                    member_profile = self.line_bot_api.get_group_member_profile(group_id, user_id)
-                    return member_profile.display_name
+                    member_profile = await self.line_api.get_group_member_profile(source.group_id, user_id)
+                    return self._to_profile(member_profile)
                 except Exception:
                     pass
-                profile = self.line_bot_api.get_profile(user_id)
-                return profile.display_name
+                return self._to_profile(await self.line_api.get_profile(user_id))
+            elif source_type == 'room':
+                return self._to_profile(await self.line_api.get_room_member_profile(source.room_id, user_id))
             elif source_type == 'user':
-                profile = self.line_bot_api.get_profile(user_id)
-                return profile.display_name
+                return self._to_profile(await self.line_api.get_profile(user_id))
         except Exception:
             pass
-        return f"Line用戶({user_id[-6:]})"
+        return None
+
+    async def get_user_profile(self, event) -> LineProfile:
+        """取得發送者的 LineProfile；查詢失敗時以使用者 ID 末碼作為名稱、沒有頭像"""
+        source = event.source
+        user_id = source.user_id
+        if self.admission is not None and self.admission.cached_profiles_only:
+            # 過載：不呼叫 Line API，只用快取中的資料
+            profile = self.profile_cache.peek(self._profile_key(source))
+            if profile is None:
+                self.admission.record_shed('profile')
+            return profile or LineProfile(f"Line用戶({user_id[-6:]})")
+        started = time.perf_counter()
+        profile = await self.profile_cache.get(
+            self._profile_key(source),
+            lambda: self._load_profile(source),
+        )
+        PROFILE_LOOKUP.observe_since(started)
+        return profile or LineProfile(f"Line用戶({user_id[-6:]})")
 
     async def fetch_line_bot_info(self):
         try:
-            bot_profile = self.line_bot_api.get_bot_info()
-            self.line_bot_id = bot_profile.user_id
+            bot_profile = await self.line_api.get_bot_info()
+            self.line_bot_id = bot_profile.get('userId')
             self.logger.info(f"Line機器人ID: {self.line_bot_id}")
         except Exception as e:
             self.logger.warning(f"獲取Line機器人資訊時發生錯誤: {e}")
             self.line_bot_id = None
 
+        if PROFILE_PREFETCH:
+            for bridge in self.bot.routes:
+                if bridge.line_id.startswith('C'):
+                    await self.prefetch_group_profiles(bridge.line_id)
+
+    async def _load_group_member_ids(self, group_id):
+        """分頁取得群組所有成員 ID"""
+        member_ids = []
+        start = None
+        while True:
+            result = await self.line_api.get_group_member_ids(group_id, start=start)
+            member_ids.extend(result.get('memberIds', []))
+            start = result.get('next')
+            if not start:
+                return member_ids
+
+    async def prefetch_group_profiles(self, group_id, concurrency=4):
+        """預先將群組成員的顯示名稱與頭像載入快取"""
+        try:
+            member_ids = await self._load_group_member_ids(group_id)
+        except Exception as e:
+            self.logger.warning(f"無法取得群組成員清單，略過名稱預載: {e}")
+            return
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load(user_id):
+            async with semaphore:
+                try:
+                    profile = await self.line_api.get_group_member_profile(group_id, user_id)
+                    self.profile_cache.put((group_id, user_id), self._to_profile(profile))
+                except Exception:
+                    pass
+
+        await asyncio.gather(*(load(uid) for uid in member_ids))
+        self.logger.info(f"已預載 {len(member_ids)} 位群組成員的顯示名稱")
+
+    def media_size_limit(self, channel_id=None):
+        """允許轉傳的媒體大小上限：目標頻道所屬伺服器的上限與 MEDIA_MAX_BYTES 取較小者"""
+        limit = 25 * 1024 * 1024
+        discord_cog = self.bot.get_cog('DiscordCog')
+        if discord_cog:
+            limit = discord_cog.upload_limit(channel_id) or limit
+        if MEDIA_MAX_BYTES > 0:
+            limit = min(limit, MEDIA_MAX_BYTES)
+        return limit
+
+    def download_size_limit(self, upload_limit):
+        """允許下載的大小上限：啟用媒體整形時可下載超過上傳上限的檔案再縮小或分割"""
+        if self.media_shaper:
+            return max(upload_limit, MEDIA_SPLIT_MAX_BYTES)
+        return upload_limit
+
+    async def download_message_content(self, message_id, declared_size=None, limit=None):
+        """
+        下載 Line 訊息內容，回傳 (SpooledMedia, Content-Type)
+
+        先依 declared_size（例如 FileMessage.file_size）或 Content-Length 判斷大小，
+        超過上限時不下載；下載途中超過上限也會立即中止。兩者皆拋出 MediaTooLargeError
+        """
+        limit = limit or self.media_size_limit()
+        if declared_size and declared_size > limit:
+            self.media_stats['rejected_by_size'] += 1
+            self.media_stats['bytes_avoided'] += declared_size
+            raise MediaTooLargeError(declared_size, limit)
+
+        started = time.perf_counter()
+        async with await self.line_api.get_message_content(message_id) as content:
+            content_length = content.content_length
+            if content_length and content_length > limit:
+                self.media_stats['rejected_by_size'] += 1
+                self.media_stats['bytes_avoided'] += content_length
+                raise MediaTooLargeError(content_length, limit)
+
+            try:
+                media = await spool_stream(
+                    content.iter_chunked(MEDIA_READ_CHUNK_SIZE), MEDIA_SPOOL_THRESHOLD, limit,
+                    digest=self.bot.media_cache is not None,
+                    store=self.bot.temp_files, owner=f"line:{message_id}",
+                )
+            except MediaTooLargeError as e:
+                self.media_stats['aborted_mid_stream'] += 1
+                if content_length:
+                    self.media_stats['bytes_avoided'] += max(content_length - e.size, 0)
+                raise
+            self.media_stats['admitted'] += 1
+            MEDIA_DOWNLOAD.observe_since(started)
+            return media, content.content_type
+
+    async def shape_image(self, media, upload_limit):
+        """圖片超過目標大小時在子行程中縮小，仍超過上傳上限則拋出 MediaTooLargeError"""
+        if self.media_shaper:
+            target = min(MEDIA_IMAGE_TARGET_BYTES, upload_limit)
+            if media.size > target:
+                shrunk = await self.media_shaper.shrink_image(media, target)
+                if shrunk is not None:
+                    media.close()
+                    media = shrunk
+        if media.size > upload_limit:
+            media.close()
+            raise MediaTooLargeError(media.size, upload_limit)
+        return media
+
+    async def send_if_cached(self, author, media, message_type, channel_id=None):
+        """相同內容先前已轉傳過時回覆原訊息並關閉 media，回傳是否已處理"""
+        if await self.bot.send_cached_media(author, media.digest, message_type, channel_id=channel_id):
+            media.close()
+            return True
+        return False
+
+    async def send_sticker_image(self, event, author, package_id, sticker_id, channel_id=None):
+        """以圖片轉發貼圖；取不到圖片時回傳 False，由呼叫端改送文字說明"""
+        if self.sticker_cache is None:
+            return False
+        # 過載降級時只用已快取的貼圖，不連線下載
+        shed = self.admission is not None and self.admission.shed_media
+        image = await self.sticker_cache.get(package_id, sticker_id, fetch=not shed)
+        if image is None:
+            if shed:
+                self.admission.record_shed('media')
+            return False
+        media = SpooledMedia(len(image) + 1)
+        media.write(image)
+        await self.bot.send_to_discord_with_attachment(
+            author, media, f"sticker_{sticker_id}.png", "貼圖", idem_key=self._idem_key(event), channel_id=channel_id,
+        )
+        return True
+
+    async def send_split_archive(self, author, media, filename, message_type, upload_limit, idem_key,
+                                 channel_id=None):
+        """將過大的檔案切成分割壓縮檔，逐一轉傳（索引記錄在第一個分割檔）"""
+        # 預留 multipart 與訊息內容所需的空間
+        part_size = max(upload_limit - 512 * 1024, 1024 * 1024)
+        digest = media.digest
+        try:
+            parts = await self.media_shaper.split_archive(
+                media, filename, part_size, MEDIA_SPOOL_THRESHOLD, store=self.bot.temp_files
+            )
+        finally:
+            media.close()
+        total = len(parts)
+        for index, (part_name, part) in enumerate(parts, start=1):
+            await self.bot.send_to_discord_with_attachment(
+                author, part, part_name, f"{message_type}（分割檔 {index}/{total}）",
+                idem_key=f"{idem_key}:{index}", digest=digest if index == 1 else None, channel_id=channel_id,
+            )
+
     # -----------------------------
     # 各類訊息處理
     # -----------------------------
-    def handle_line_text_message(self, event):
+    async def handle_line_text_message(self, event, channel_id=None):
         user_id = event.source.user_id
         if self.line_bot_id and user_id == self.line_bot_id:
             self.logger.info("忽略Line機器人自己發送的訊息")
             return
-        user_name = self.get_user_display_name(event)
+        author = await self.get_user_profile(event)
         message = event.message.text
-        self.bot.send_to_discord(f"**{user_name}**:\n{message}")
+        self._archive(event, author, 'text', message, channel_id)
+        await self.bot.relay_text(author, message, idem_key=self._idem_key(event), channel_id=channel_id)
 
-    def handle_line_image_message(self, event):
+    async def handle_line_image_message(self, event, channel_id=None):
         user_id = event.source.user_id
         if self.line_bot_id and user_id == self.line_bot_id:
             self.logger.info("忽略Line機器人自己發送的圖片")
             return
-        user_name = self.get_user_display_name(event)
+        author = await self.get_user_profile(event)
+        self._archive(event, author, 'image', channel_id=channel_id)
         message_id = event.message.id
+        if self.admission is not None and self.admission.shed_media:
+            self.admission.record_shed('media')
+            await self.bot.send_as(
+                author, "發送了一張圖片（系統忙碌中，未轉傳）", idem_key=self._idem_key(event), channel_id=channel_id
+            )
+            return
         try:
-            content = self.line_bot_api.get_message_content(message_id)
-            file_path = Path(TEMP_DIR) / f"{uuid.uuid4()}.jpg"
-            with open(file_path, 'wb') as fd:
-                for chunk in content.iter_content():
-                    fd.write(chunk)
-            self.bot.send_to_discord_with_attachment(user_name, str(file_path), "圖片")
+            upload_limit = self.media_size_limit(channel_id)
+            media, _ = await self.download_message_content(
+                message_id, limit=self.download_size_limit(upload_limit)
+            )
+            if await self.send_if_cached(author, media, "圖片", channel_id):
+                return
+            # 索引以原始內容的雜湊為準，縮圖後的內容不同
+            digest = media.digest
+            media = await self.shape_image(media, upload_limit)
+            await self.bot.send_to_discord_with_attachment(
+                author, media, f"{message_id}.jpg", "圖片", idem_key=self._idem_key(event), digest=digest,
+                channel_id=channel_id,
+            )
+        except MediaTooLargeError as e:
+            await self.bot.send_as(
+                author, f"發送了一張圖片（超過{e.limit // (1024 * 1024)}MB，未轉傳）",
+                channel_id=channel_id,
+            )
         except Exception as e:
             self.logger.error(f"處理圖片時發生錯誤: {e}")
-            self.bot.send_to_discord(f"**{user_name}**:\n發送了一張圖片，但處理失敗: {str(e)}")
+            await self.bot.send_as(
+                author, f"發送了一張圖片，但處理失敗: {str(e)}", channel_id=channel_id
+            )
 
-    def handle_line_sticker_message(self, event):
+    async def handle_line_sticker_message(self, event, channel_id=None):
         user_id = event.source.user_id
         if self.line_bot_id and user_id == self.line_bot_id:
             self.logger.info("忽略Line機器人自己發送的貼圖")
             return
-        user_name = self.get_user_display_name(event)
+        author = await self.get_user_profile(event)
         sticker_id = getattr(event.message, 'sticker_id', None)
         package_id = getattr(event.message, 'package_id', None)
         keywords = getattr(event.message, 'keywords', []) or []
         kw_text = f"，關鍵詞：{', '.join(keywords)}" if keywords else ""
-        self.bot.send_to_discord(
-            f"**{user_name}**:\n發送了一個貼圖 (貼圖ID: {sticker_id}, 包ID: {package_id}{kw_text})"
+        self._archive(event, author, 'sticker', ' '.join(keywords), channel_id)
+        if await self.send_sticker_image(event, author, package_id, sticker_id, channel_id):
+            return
+        await self.bot.send_as(
+            author, f"發送了一個貼圖 (貼圖ID: {sticker_id}, 包ID: {package_id}{kw_text})",
+            idem_key=self._idem_key(event),
+            channel_id=channel_id,
         )
 
-    def handle_line_media_message(self, event):
+    async def handle_line_media_message(self, event, channel_id=None):
         user_id = event.source.user_id
         if self.line_bot_id and user_id == self.line_bot_id:
             self.logger.info("忽略Line機器人自己發送的媒體")
             return
-        user_name = self.get_user_display_name(event)
+        author = await self.get_user_profile(event)
 
         # 類型判斷
-        if isinstance(event.message, VideoMessage):
-            message_type = "影片"
-        elif isinstance(event.message, AudioMessage):
-            message_type = "語音"
-        elif isinstance(event.message, FileMessage):
-            message_type = "檔案"
-        else:
-            message_type = "媒體"
+        message_type = {
+            'video': "影片",
+            'audio': "語音",
+            'file': "檔案",
+        }.get(event.message.type, "媒體")
+        self._archive(event, author, event.message.type, getattr(event.message, 'file_name', None) or '', channel_id)
 
         message_id = event.message.id
+        if self.admission is not None and self.admission.shed_media:
+            self.admission.record_shed('media')
+            await self.bot.send_as(
+                author, f"發送了一個{message_type}（系統忙碌中，未轉傳）",
+                idem_key=self._idem_key(event),
+                channel_id=channel_id,
+            )
+            return
         try:
-            content = self.line_bot_api.get_message_content(message_id)
+            declared_size = getattr(event.message, 'file_size', None)
+            upload_limit = self.media_size_limit(channel_id)
+            media, mime_type = await self.download_message_content(
+                message_id, declared_size, limit=self.download_size_limit(upload_limit)
+            )
 
             # FileMessage 優先用原始檔名
-            if isinstance(event.message, FileMessage) and hasattr(event.message, 'file_name'):
-                orig = event.message.file_name
-                file_path = Path(TEMP_DIR) / f"{uuid.uuid4()}_{orig}"
+            if event.message.type == 'file' and getattr(event.message, 'file_name', None):
+                filename = event.message.file_name
             else:
-                mime_type = None
-                try:
-                    hdr = getattr(content, 'headers', {})
-                    mime_type = hdr.get('Content-Type')
-                except Exception:
-                    mime_type = None
                 if not mime_type:
                     mime_type = {
                         '影片': 'video/mp4',
@@ -244,193 +838,30 @@ class LineCog(commands.Cog):
                         '媒體': 'application/octet-stream',
                     }.get(message_type, 'application/octet-stream')
                 ext = mimetypes.guess_extension(mime_type) or '.bin'
-                file_path = Path(TEMP_DIR) / f"{uuid.uuid4()}{ext}"
-
-            with open(file_path, 'wb') as fd:
-                for chunk in content.iter_content():
-                    fd.write(chunk)
-
-            # 大小判斷 25MB
-            try:
-                size = file_path.stat().st_size
-            except Exception:
-                size = 0
-            max_size = 25 * 1024 * 1024
-            if size <= max_size:
-                self.bot.send_to_discord_with_attachment(user_name, str(file_path), message_type)
-            else:
-                self.bot.send_to_discord(f"**{user_name}**:\n發送了一個{message_type}（超過25MB，未轉傳）")
-                try:
-                    os.remove(file_path)
-                except Exception:
-                    pass
+                filename = f"{message_id}{ext}"
+
+            if await self.send_if_cached(author, media, message_type, channel_id):
+                return
+            if media.size > upload_limit:
+                await self.send_split_archive(
+                    author, media, filename, message_type, upload_limit, self._idem_key(event), channel_id
+                )
+                return
+            await self.bot.send_to_discord_with_attachment(
+                author, media, filename, message_type, idem_key=self._idem_key(event), digest=media.digest,
+                channel_id=channel_id,
+            )
+        except MediaTooLargeError as e:
+            await self.bot.send_as(
+                author, f"發送了一個{message_type}（超過{e.limit // (1024 * 1024)}MB，未轉傳）",
+                channel_id=channel_id,
+            )
         except Exception as e:
             self.logger.error(f"處理{message_type}時發生錯誤: {e}")
-            self.bot.send_to_discord(f"**{user_name}**:\n發送了一個{message_type}，但處理失敗: {str(e)}")
+            await self.bot.send_as(
+                author, f"發送了一個{message_type}，但處理失敗: {str(e)}", channel_id=channel_id
+            )
 
 
 def setup(bot: commands.Bot):
     bot.add_cog(LineCog(bot))
-
-from config import (
-    LINE_CHANNEL_ACCESS_TOKEN, LINE_CHANNEL_SECRET, 
-    LINE_GROUP_ID, TEMP_DIR
-)
-
-class LineCog(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
-        self.logger = bot.logger
-        self.line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
-        self.handler = WebhookHandler(LINE_CHANNEL_SECRET)
-        self.line_group_id = LINE_GROUP_ID
-        self.processed_message_ids = deque(maxlen=100)
-        self.line_bot_id = None
-        
-        # 設定 Flask 應用
-        self.app = Flask(__name__)
-        self.setup_routes()
-        self.setup_line_handlers()
-    
-    def setup_routes(self):
-        """設置 Flask 路由"""
-        @self.app.route("/callback", methods=['POST'])
-        def callback():
-            """處理來自 Line 平台的 Webhook 事件"""
-            signature = request.headers['X-Line-Signature']
-            body = request.get_data(as_text=True)
-            self.logger.info("收到Line訊息: %s", body)
-            
-            # 檢查是否為重複訊息
-            try:
-                webhook_data = json.loads(body)
-                if 'events' in webhook_data and webhook_data['events']:
-                    for event in webhook_data['events']:
-                        # 檢查訊息ID是否已處理過
-                        if 'message' in event and 'id' in event['message']:
-                            message_id = event['message']['id']
-                            if message_id in self.processed_message_ids:
-                                self.logger.info(f"跳過重複訊息 ID: {message_id}")
-                                return 'OK'  # 已處理過，直接返回成功
-                            
-                            # 添加新訊息ID到已處理集合
-                            self.processed_message_ids.append(message_id)
-            except Exception as e:
-                self.logger.error(f"解析訊息ID時發生錯誤: {e}")
-            
-            # 處理訊息
-            try:
-                self.handler.handle(body, signature)
-            except InvalidSignatureError:
-                self.logger.error("無效的簽名")
-                abort(400)
-            
-            return 'OK'
-        
-        @self.app.route("/", methods=['GET', 'POST'])
-        def index():
-            """首頁路由，顯示服務狀態"""
-            return 'Line-Discord Bot運行中！請將Webhook設置為/callback路徑。'
-    
-    def setup_line_handlers(self):
-        """設置 Line 訊息處理器"""
-        # 文字訊息處理
-        @self.handler.add(MessageEvent, message=TextMessage)
-        def handle_text_message(event):
-            self.handle_line_text_message(event)
-        
-        # 圖片訊息處理
-        @self.handler.add(MessageEvent, message=ImageMessage)
-        def handle_image_message(event):
-            self.handle_line_image_message(event)
-        
-        # 貼圖訊息處理
-        @self.handler.add(MessageEvent, message=StickerMessage)
-        def handle_sticker_message(event):
-            self.handle_line_sticker_message(event)
-        
-        # 媒體訊息處理
-        @self.handler.add(MessageEvent, message=(VideoMessage, AudioMessage, FileMessage))
-        def handle_media_message(event):
-            self.handle_line_media_message(event)
-    
-    def handle_line_text_message(self, event):
-        """處理 Line 文字訊息"""
-        user_id = event.source.user_id
-        
-        # 忽略機器人自己的訊息
-        if self.line_bot_id and user_id == self.line_bot_id:
-            self.logger.info("忽略Line機器人自己發送的訊息")
-            return
-        
-        user_name = self.get_user_display_name(event)
-        message = event.message.text
-        self.bot.send_to_discord(f"**{user_name}**:\n{message}")
-    
-    def handle_line_image_message(self, event):
-        """處理 Line 圖片訊息"""
-        user_id = event.source.user_id
-        
-        # 忽略機器人自己的訊息
-        if self.line_bot_id and user_id == self.line_bot_id:
-            self.logger.info("忽略Line機器人自己發送的圖片")
-            return
-        
-        user_name = self.get_user_display_name(event)
-        message_id = event.message.id
-        
-        try:
-            message_content = self.line_bot_api.get_message_content(message_id)
-            file_path = TEMP_DIR / f"{uuid.uuid4()}.jpg"
-            
-            with open(file_path, 'wb') as fd:
-                for chunk in message_content.iter_content():
-                    fd.write(chunk)
-            
-            self.bot.send_to_discord_with_attachment(user_name, str(file_path), "圖片")
-        except Exception as e:
-            self.logger.error(f"處理圖片時發生錯誤: {e}")
-            self.bot.send_to_discord(f"**{user_name}**:\n發送了一張圖片，但處理失敗: {str(e)}")
-    
-    # 其餘方法保持相同，只是將 self.send_to_discord 改為 self.bot.send_to_discord
-    # ...
-
-    def get_user_display_name(self, event):
-        """獲取 Line 用戶的顯示名稱"""
-        user_id = event.source.user_id
-        source_type = getattr(event.source, 'type', None)
-        
-        if source_type == 'group':
-            group_id = event.source.group_id
-            try:
-                member_profile = self.line_bot_api.get_group_member_profile(group_id, user_id)
-                return member_profile.display_name
-            except Exception:
-                pass
-            try:
-                user_profile = self.line_bot_api.get_profile(user_id)
-                return user_profile.display_name
-            except Exception:
-                pass
-        elif source_type == 'user':
-            try:
-                user_profile = self.line_bot_api.get_profile(user_id)
-                return user_profile.display_name
-            except Exception:
-                pass
-        
-        return f"Line用戶({user_id[-6:]})"
-
-    async def fetch_line_bot_info(self):
-        """獲取 Line Bot 資訊"""
-        try:
-            bot_profile = self.line_bot_api.get_bot_info()
-            self.line_bot_id = bot_profile.user_id
-            self.logger.info(f"Line機器人ID: {self.line_bot_id}")
-        except Exception as e:
-            self.logger.warning(f"獲取Line機器人資訊時發生錯誤: {e}")
-            self.line_bot_id = None
-            self.logger.info("將繼續運行，但無法過濾機器人自己的訊息")
-
-def setup(bot):
-    bot.add_cog(LineCog(bot))
\ No newline at end of file
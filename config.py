@@ -22,6 +22,11 @@ TIMEZONE_NAME = 'Asia/Taipei'  # 預設台北時區
 # TIMEZONE_NAME = 'Europe/London'  # 英國（UTC+0）
 # TIMEZONE_NAME = 'Asia/Tokyo'    # 日本（UTC+9）
 
+# 日誌設定
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text 或 json
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv('LOG_PAYLOAD_MAX_CHARS', 200))  # 訊息內容在日誌中最多保留的字元數
+LOG_PAYLOAD_SAMPLE_EVERY = int(os.getenv('LOG_PAYLOAD_SAMPLE_EVERY', 100))  # webhook 內容每幾筆記錄一筆（0 為不記錄）
+
 # Line Bot 設定
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN')
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET')
@@ -31,9 +36,128 @@ LINE_GROUP_ID = os.getenv('LINE_GROUP_ID', '')
 DISCORD_TOKEN = os.getenv('DISCORD_TOKEN')
 DISCORD_CHANNEL_ID = int(os.getenv('DISCORD_CHANNEL_ID', 0))
 
+# Line → Discord 的發送方式：bot = 機器人帳號（名稱寫在內容開頭）；webhook = 頻道 webhook，以 Line 使用者的名稱與頭像發送
+DISCORD_DELIVERY = os.getenv('DISCORD_DELIVERY', 'bot').lower()
+DISCORD_WEBHOOK_NAME = os.getenv('DISCORD_WEBHOOK_NAME', 'Line Bridge')
+DISCORD_WEBHOOK_CONNECTIONS = int(os.getenv('DISCORD_WEBHOOK_CONNECTIONS', 20))
+
+# 多組橋接設定檔（JSON）；未設定時使用上面的 DISCORD_CHANNEL_ID 與 LINE_GROUP_ID 作為單一橋接
+BRIDGES_FILE = os.getenv('BRIDGES_FILE', '')
+
 # 檔案設定
 TEMP_DIR = Path("temp_images")
 TEMP_DIR.mkdir(exist_ok=True)
+TEMP_QUOTA_BYTES = int(os.getenv('TEMP_QUOTA_BYTES', 1024 * 1024 * 1024))  # 暫存檔合計上限
+TEMP_FILE_TTL = int(os.getenv('TEMP_FILE_TTL', 3600))  # 暫存檔最長保留秒數
+TEMP_WAIT_TIMEOUT = float(os.getenv('TEMP_WAIT_TIMEOUT', 30))  # 暫存空間不足時最多等待秒數
+
+# Webhook 伺服器設定
+PORT = int(os.environ.get("PORT", 8000))
+
+# Line 事件工作池設定
+LINE_WORKER_SHARDS = int(os.getenv('LINE_WORKER_SHARDS', 8))
+LINE_SHARD_QUEUE_SIZE = int(os.getenv('LINE_SHARD_QUEUE_SIZE', 200))
+
+# Line 使用者名稱快取設定
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 2048))
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', 3600))
+PROFILE_CACHE_NEGATIVE_TTL = int(os.getenv('PROFILE_CACHE_NEGATIVE_TTL', 300))
+PROFILE_PREFETCH = os.getenv('PROFILE_PREFETCH', 'false').lower() in ('1', 'true', 'yes')
+
+# 媒體下載設定
+MEDIA_SPOOL_THRESHOLD = int(os.getenv('MEDIA_SPOOL_THRESHOLD', 8 * 1024 * 1024))  # 超過此大小才寫入磁碟
+MEDIA_READ_CHUNK_SIZE = int(os.getenv('MEDIA_READ_CHUNK_SIZE', 256 * 1024))
+MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_BYTES', 0))  # 0 = 依 Discord 伺服器的上傳上限
+
+# 資料目錄（持久化狀態，例如待送佇列）
+DATA_DIR = Path(os.getenv('DATA_DIR', 'data'))
+DATA_DIR.mkdir(exist_ok=True)
+
+# 部署模式：all = 單一行程（預設）；ingress = 只接收 webhook 並寫入事件日誌；consumer = 從事件日誌讀取並轉發到 Discord
+BRIDGE_MODE = os.getenv('BRIDGE_MODE', 'all').lower()
+# 事件日誌位置：sqlite:///相對路徑、sqlite:////絕對路徑，或 redis://主機:埠/資料庫（需安裝 redis 套件）
+EVENT_LOG_URL = os.getenv('EVENT_LOG_URL', f"sqlite:///{DATA_DIR / 'events.sqlite3'}")
+EVENT_LOG_RETENTION_HOURS = float(os.getenv('EVENT_LOG_RETENTION_HOURS', 24))
+EVENT_LOG_BATCH = int(os.getenv('EVENT_LOG_BATCH', 200))
+EVENT_LOG_POLL_INTERVAL = float(os.getenv('EVENT_LOG_POLL_INTERVAL', 0.2))
+
+# Discord 待送佇列設定
+OUTBOX_MAX_ROWS = int(os.getenv('OUTBOX_MAX_ROWS', 10000))
+OUTBOX_MAX_BLOB_BYTES = int(os.getenv('OUTBOX_MAX_BLOB_BYTES', 512 * 1024 * 1024))
+OUTBOX_RETENTION_HOURS = float(os.getenv('OUTBOX_RETENTION_HOURS', 48))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_REPLAY_BATCH = int(os.getenv('OUTBOX_REPLAY_BATCH', 50))
+OUTBOX_REPLAY_INTERVAL = float(os.getenv('OUTBOX_REPLAY_INTERVAL', 1.0))  # 重送時每次發送的間隔秒數
+OUTBOX_RETRY_INTERVAL = float(os.getenv('OUTBOX_RETRY_INTERVAL', 30))
+
+# 文字合併設定（0 = 停用；啟用後同頻道在視窗內的多則文字會合併成一則送出）
+COALESCE_WINDOW_MS = int(os.getenv('COALESCE_WINDOW_MS', 0))
+
+# 准入控制（過載時依序降級：媒體只通知 → 名稱只查快取 → 文字以較長視窗合併；恢復後自動回到正常）
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_QUEUE_HIGH = int(os.getenv('ADMISSION_QUEUE_HIGH', 200))  # 事件與發送佇列合計的門檻
+ADMISSION_AGE_HIGH = float(os.getenv('ADMISSION_AGE_HIGH', 10))  # 最舊事件等待秒數的門檻
+ADMISSION_429_HIGH = float(os.getenv('ADMISSION_429_HIGH', 0.5))  # 每秒 Discord 429 次數的門檻
+ADMISSION_RECOVER_SECONDS = float(os.getenv('ADMISSION_RECOVER_SECONDS', 30))  # 壓力持續偏低多久後降一級
+ADMISSION_COALESCE_WINDOW_MS = int(os.getenv('ADMISSION_COALESCE_WINDOW_MS', 2000))
+
+# 訊息存檔（可選；SQLite 全文索引，供 /search 查詢；0 天 = 永久保存）
+ARCHIVE = os.getenv('ARCHIVE', 'false').lower() in ('1', 'true', 'yes')
+ARCHIVE_RETENTION_DAYS = float(os.getenv('ARCHIVE_RETENTION_DAYS', 365))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 200))
+ARCHIVE_FLUSH_INTERVAL = float(os.getenv('ARCHIVE_FLUSH_INTERVAL', 1.0))
+ARCHIVE_MAX_PENDING = int(os.getenv('ARCHIVE_MAX_PENDING', 10000))  # 寫入跟不上時最多暫存的筆數，超過即捨棄
+
+# 事件循環監測（延遲超過門檻時記錄卡住循環的程式碼堆疊）
+LOOP_WATCHDOG = os.getenv('LOOP_WATCHDOG', 'true').lower() in ('1', 'true', 'yes')
+LOOP_WATCHDOG_INTERVAL = float(os.getenv('LOOP_WATCHDOG_INTERVAL', 0.1))
+LOOP_LAG_THRESHOLD_MS = int(os.getenv('LOOP_LAG_THRESHOLD_MS', 250))
+
+# 發送排程設定（權杖桶：每秒補充數量 / 最大累積數量）
+DISCORD_SEND_RATE = float(os.getenv('DISCORD_SEND_RATE', 1.0))
+DISCORD_SEND_BURST = int(os.getenv('DISCORD_SEND_BURST', 5))
+LINE_PUSH_RATE = float(os.getenv('LINE_PUSH_RATE', 10.0))
+LINE_PUSH_BURST = int(os.getenv('LINE_PUSH_BURST', 20))
+SEND_QUEUE_MAX = int(os.getenv('SEND_QUEUE_MAX', 500))
+
+# Webhook 事件去重設定
+DEDUP_CAPACITY = int(os.getenv('DEDUP_CAPACITY', 10000))
+DEDUP_SNAPSHOT_INTERVAL = float(os.getenv('DEDUP_SNAPSHOT_INTERVAL', 5))
+
+# Webhook 解析設定（true = 以輕量檢視物件分派事件，不建立完整的 SDK 模型）
+LINE_LIGHTWEIGHT_EVENTS = os.getenv('LINE_LIGHTWEIGHT_EVENTS', 'false').lower() in ('1', 'true', 'yes')
+
+# Line API 用戶端設定
+LINE_API_BASE = os.getenv('LINE_API_BASE', 'https://api.line.me')
+LINE_DATA_API_BASE = os.getenv('LINE_DATA_API_BASE', 'https://api-data.line.me')
+LINE_API_TIMEOUT = float(os.getenv('LINE_API_TIMEOUT', 10))
+LINE_API_MAX_RETRIES = int(os.getenv('LINE_API_MAX_RETRIES', 3))
+LINE_API_CONCURRENCY = int(os.getenv('LINE_API_CONCURRENCY', 16))
+
+# Discord → Line 轉發設定（預設只用 /say_line；開啟後頻道內的一般訊息也會轉發）
+DISCORD_TO_LINE_RELAY = os.getenv('DISCORD_TO_LINE_RELAY', 'false').lower() in ('1', 'true', 'yes')
+LINE_PUSH_BATCH_WINDOW_MS = int(os.getenv('LINE_PUSH_BATCH_WINDOW_MS', 1000))
+
+# 貼圖圖片設定（以圖片顯示 Line 貼圖；圖片從貼圖 CDN 下載後快取在磁碟與記憶體）
+STICKER_IMAGES = os.getenv('STICKER_IMAGES', 'true').lower() in ('1', 'true', 'yes')
+STICKER_CDN_BASE = os.getenv('STICKER_CDN_BASE', 'https://stickershop.line-scdn.net/stickershop/v1/sticker')
+STICKER_CACHE_MAX_BYTES = int(os.getenv('STICKER_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+STICKER_MEMORY_ENTRIES = int(os.getenv('STICKER_MEMORY_ENTRIES', 128))
+STICKER_FETCH_TIMEOUT = float(os.getenv('STICKER_FETCH_TIMEOUT', 10))
+
+# 媒體整形設定（縮小過大的圖片、將過大的檔案切成分割壓縮檔）
+MEDIA_SHAPING = os.getenv('MEDIA_SHAPING', 'false').lower() in ('1', 'true', 'yes')
+MEDIA_SHAPER_WORKERS = int(os.getenv('MEDIA_SHAPER_WORKERS', 2))
+MEDIA_SHAPER_CONCURRENCY = int(os.getenv('MEDIA_SHAPER_CONCURRENCY', 2))
+MEDIA_SHAPER_TIMEOUT = float(os.getenv('MEDIA_SHAPER_TIMEOUT', 30))
+MEDIA_SHAPER_CPU_BUDGET = float(os.getenv('MEDIA_SHAPER_CPU_BUDGET', 30))  # 每分鐘可用的子行程 CPU 秒數
+MEDIA_IMAGE_TARGET_BYTES = int(os.getenv('MEDIA_IMAGE_TARGET_BYTES', 8 * 1024 * 1024))
+MEDIA_IMAGE_MAX_DIMENSION = int(os.getenv('MEDIA_IMAGE_MAX_DIMENSION', 4096))
+MEDIA_SHRINK_MAX_BYTES = int(os.getenv('MEDIA_SHRINK_MAX_BYTES', 32 * 1024 * 1024))  # 超過此大小的圖片不縮圖（整份讀入記憶體）
+MEDIA_SPLIT_MAX_BYTES = int(os.getenv('MEDIA_SPLIT_MAX_BYTES', 200 * 1024 * 1024))  # 超過此大小仍不轉傳
 
-# Flask 設定
-PORT = int(os.environ.get("PORT", 8000))
\ No newline at end of file
+# 媒體索引設定（以內容雜湊找出重複轉傳的媒體）
+MEDIA_CACHE = os.getenv('MEDIA_CACHE', 'true').lower() in ('1', 'true', 'yes')
+MEDIA_CACHE_MAX_ENTRIES = int(os.getenv('MEDIA_CACHE_MAX_ENTRIES', 5000))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+MEDIA_CACHE_TTL_HOURS = float(os.getenv('MEDIA_CACHE_TTL_HOURS', 168))
@@ -0,0 +1,108 @@
+import time
+import asyncio
+import logging
+from aiohttp import web
+
+# 匯入配置
+from config import (
+    LINE_CHANNEL_SECRET, PORT, EVENT_LOG_URL, EVENT_LOG_RETENTION_HOURS,
+    LOOP_WATCHDOG, LOOP_WATCHDOG_INTERVAL, LOOP_LAG_THRESHOLD_MS,
+)
+from utils.logging_utils import setup_logging, should_log_payload, truncate_payload
+from utils.line_events import verify_signature, loads
+from utils.event_log import open_event_log
+from utils.loop_watchdog import LoopWatchdog
+from utils.metrics import (
+    REGISTRY, WEBHOOK_VERIFY, WEBHOOK_PARSE, EVENT_LOG_APPEND,
+    EVENTS_ACCEPTED, EVENTS_DUPLICATE, EVENTS_REJECTED,
+)
+
+
+class WebhookIngress:
+    """
+    無狀態的 Webhook 入口（BRIDGE_MODE=ingress）：
+    - 驗證簽名後把訊息事件寫入共用的事件日誌就回應 Line，不連線 Discord
+    - 去重由事件日誌的唯一鍵完成，可以同時執行多個副本
+    - 寫入失敗時回應 503，由 Line 稍後重送
+    """
+
+    def __init__(self, event_log, logger):
+        self.event_log = event_log
+        self.logger = logger
+        self.channel_secret = (LINE_CHANNEL_SECRET or '').encode('utf-8')
+
+        self.app = web.Application()
+        self.app.router.add_post("/callback", self.callback)
+        self.app.router.add_get("/", self.index)
+        self.app.router.add_get("/metrics", self.metrics)
+
+    async def callback(self, request: web.Request) -> web.Response:
+        signature = request.headers.get('X-Line-Signature', '')
+        body = await request.read()
+
+        stage_started = time.perf_counter()
+        if not verify_signature(self.channel_secret, body, signature):
+            self.logger.error("無效的簽名")
+            raise web.HTTPBadRequest()
+        WEBHOOK_VERIFY.observe_since(stage_started)
+        stage_started = time.perf_counter()
+        try:
+            payload = loads(body)
+            events = [data for data in payload.get('events', ()) if data.get('type') == 'message']
+        except Exception as e:
+            self.logger.exception(f"處理 Webhook 時發生未預期錯誤: {e}")
+            raise web.HTTPInternalServerError()
+        WEBHOOK_PARSE.observe_since(stage_started)
+        if self.logger.isEnabledFor(logging.DEBUG) and should_log_payload():
+            self.logger.debug("Webhook 內容（抽樣）: %s", truncate_payload(body))
+
+        stage_started = time.perf_counter()
+        try:
+            added = await self.event_log.append(events)
+        except Exception as e:
+            self.logger.error(f"寫入事件日誌時發生錯誤，要求 Line 重送: {e}")
+            EVENTS_REJECTED.inc(len(events))
+            raise web.HTTPServiceUnavailable()
+        EVENT_LOG_APPEND.observe_since(stage_started)
+        EVENTS_ACCEPTED.inc(added)
+        EVENTS_DUPLICATE.inc(len(events) - added)
+        self.logger.info(f"收到Line webhook：{len(events)} 則訊息事件，新增 {added} 則")
+        return web.Response(text='OK')
+
+    async def index(self, request: web.Request) -> web.Response:
+        return web.Response(text='Line-Discord Webhook 入口運行中。Webhook 請指向 /callback')
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Prometheus 文字格式的指標"""
+        return web.Response(
+            text=REGISTRY.render(),
+            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+        )
+
+
+async def main():
+    logger = setup_logging()
+    event_log = open_event_log(EVENT_LOG_URL, retention_seconds=EVENT_LOG_RETENTION_HOURS * 3600)
+    ingress = WebhookIngress(event_log, logger)
+    watchdog = None
+    if LOOP_WATCHDOG:
+        # 延遲只匯出到 /metrics 的直方圖，卡住時的堆疊寫入日誌
+        watchdog = LoopWatchdog(interval=LOOP_WATCHDOG_INTERVAL, threshold=LOOP_LAG_THRESHOLD_MS / 1000)
+        watchdog.start()
+
+    runner = web.AppRunner(ingress.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
+    await site.start()
+    logger.info(f"Webhook 入口已啟動（埠 {PORT}），事件日誌: {EVENT_LOG_URL.split('://', 1)[0]}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if watchdog:
+            watchdog.stop()
+        await runner.cleanup()
+        await event_log.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,15 +1,37 @@
-import os
-import threading
+import time
+import logging
 import asyncio
 import discord
+from aiohttp import web
 from discord.ext import commands
-from collections import deque
-import time
 
 # 匯入配置
-from config import DISCORD_TOKEN, DISCORD_CHANNEL_ID, PORT
-from utils.logging_utils import setup_logging
-from utils.file_utils import cleanup_temp_files
+from config import (
+    DISCORD_TOKEN, DISCORD_CHANNEL_ID, LINE_GROUP_ID, DISCORD_TO_LINE_RELAY, BRIDGES_FILE, PORT, DATA_DIR,
+    BRIDGE_MODE, DISCORD_DELIVERY, DISCORD_WEBHOOK_NAME, DISCORD_WEBHOOK_CONNECTIONS,
+    OUTBOX_MAX_ROWS, OUTBOX_MAX_BLOB_BYTES, OUTBOX_RETENTION_HOURS, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_REPLAY_BATCH, OUTBOX_REPLAY_INTERVAL, OUTBOX_RETRY_INTERVAL,
+    COALESCE_WINDOW_MS, ADMISSION_CONTROL,
+    DISCORD_SEND_RATE, DISCORD_SEND_BURST, LINE_PUSH_RATE, LINE_PUSH_BURST, SEND_QUEUE_MAX,
+    MEDIA_CACHE, MEDIA_CACHE_MAX_ENTRIES, MEDIA_CACHE_MAX_BYTES, MEDIA_CACHE_TTL_HOURS,
+    ARCHIVE, ARCHIVE_RETENTION_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_FLUSH_INTERVAL, ARCHIVE_MAX_PENDING,
+    LOOP_WATCHDOG, LOOP_WATCHDOG_INTERVAL, LOOP_LAG_THRESHOLD_MS,
+    TEMP_DIR, TEMP_QUOTA_BYTES, TEMP_FILE_TTL, TEMP_WAIT_TIMEOUT,
+)
+from utils.logging_utils import setup_logging, truncate_payload
+from utils.file_utils import TempFileManager
+from utils.outbox import Outbox, pack_text_entries
+from utils.coalescer import TextCoalescer
+from utils.media_cache import MediaCache
+from utils.archive import MessageArchive
+from utils.loop_watchdog import LoopWatchdog
+from utils.routing import load_routes
+from utils.webhook_sender import WebhookSender
+from utils.metrics import DISCORD_SEND, DISCORD_UPLOAD
+from utils.rate_limit import (
+    SendScheduler, DiscordRateLimitListener, PRIORITY_TEXT, PRIORITY_ATTACHMENT,
+    discord_retry_after, line_retry_after,
+)
 
 class LineDiscordBot(commands.Bot):
     """整合 Line 與 Discord 的主要機器人類別"""
@@ -22,9 +44,79 @@ class LineDiscordBot(commands.Bot):
         # 初始化日誌
         self.logger = setup_logging()
         
-        # 初始化變數
-        self.unsent_messages = []
-        self.discord_channel = None
+        # 橋接路由表：Line 來源 ↔ Discord 頻道
+        self.routes = load_routes(BRIDGES_FILE, DISCORD_CHANNEL_ID, LINE_GROUP_ID, DISCORD_TO_LINE_RELAY)
+        
+        # 暫存檔管理：啟動時清掉上次留下的檔案，之後依期限與使用完畢即時刪除
+        self.temp_files = TempFileManager(
+            TEMP_DIR, quota_bytes=TEMP_QUOTA_BYTES, ttl=TEMP_FILE_TTL, wait_timeout=TEMP_WAIT_TIMEOUT
+        )
+        self.temp_files.reconcile()
+        
+        # 持久化待送佇列：Discord 無法送出時暫存，恢復後依序重送
+        self.outbox = Outbox(
+            DATA_DIR / "outbox.sqlite3",
+            DATA_DIR / "outbox_blobs",
+            max_rows=OUTBOX_MAX_ROWS,
+            max_blob_bytes=OUTBOX_MAX_BLOB_BYTES,
+            retention_seconds=OUTBOX_RETENTION_HOURS * 3600,
+        )
+        self.outbox_pending = self.outbox.pending() > 0
+        self._outbox_generation = 0  # 每次寫入待送佇列遞增，重送判斷佇列已清空前用來確認期間沒有新訊息
+        self._replay_task = None
+        
+        # 發送排程：Discord 每個頻道、Line push API 各自有權杖桶
+        self.discord_scheduler = SendScheduler(
+            "Discord", DISCORD_SEND_RATE, DISCORD_SEND_BURST,
+            max_queue=SEND_QUEUE_MAX, retry_after=discord_retry_after,
+        )
+        self.line_scheduler = SendScheduler(
+            "Line push", LINE_PUSH_RATE, LINE_PUSH_BURST,
+            max_queue=SEND_QUEUE_MAX, retry_after=line_retry_after,
+        )
+        logging.getLogger('discord.http').addHandler(DiscordRateLimitListener(self.discord_scheduler))
+        
+        # webhook 發送（可選）：以 Line 使用者的名稱與頭像發送，走各頻道 webhook 自己的限流額度
+        self.webhook_sender = None
+        if DISCORD_DELIVERY == 'webhook':
+            self.webhook_sender = WebhookSender(DISCORD_WEBHOOK_NAME, connections=DISCORD_WEBHOOK_CONNECTIONS)
+        
+        # 文字合併（可選；啟用准入控制時一律建立，過載時才以較長的視窗合併）
+        self.coalescer = None
+        if COALESCE_WINDOW_MS > 0 or ADMISSION_CONTROL:
+            self.coalescer = TextCoalescer(
+                self._deliver_coalesced,
+                window=COALESCE_WINDOW_MS / 1000,
+                per_author=self.webhook_sender is not None,
+            )
+        
+        # 媒體索引（可選）：同一份媒體再次轉傳時改為回覆原訊息，不重新上傳
+        self.media_cache = None
+        if MEDIA_CACHE:
+            self.media_cache = MediaCache(
+                DATA_DIR / "media_cache.sqlite3",
+                max_entries=MEDIA_CACHE_MAX_ENTRIES,
+                max_bytes=MEDIA_CACHE_MAX_BYTES,
+                ttl=MEDIA_CACHE_TTL_HOURS * 3600,
+            )
+        
+        # 訊息存檔（可選）：轉發的訊息由背景工作批次寫入全文索引，供 /search 查詢
+        self.archive = None
+        if ARCHIVE:
+            self.archive = MessageArchive(
+                DATA_DIR / "archive.sqlite3",
+                batch_size=ARCHIVE_BATCH_SIZE,
+                flush_interval=ARCHIVE_FLUSH_INTERVAL,
+                max_pending=ARCHIVE_MAX_PENDING,
+                retention_days=ARCHIVE_RETENTION_DAYS,
+            )
+        
+        # 事件循環監測（可選）：延遲超過門檻時記錄卡住循環的堆疊，於 main() 中啟動
+        self.loop_watchdog = None
+        if LOOP_WATCHDOG:
+            self.loop_watchdog = LoopWatchdog(
+                interval=LOOP_WATCHDOG_INTERVAL, threshold=LOOP_LAG_THRESHOLD_MS / 1000
+            )
     
     async def load_extensions(self):
         """載入所有 Cog"""
@@ -33,66 +125,265 @@ class LineDiscordBot(commands.Bot):
         self.load_extension("cogs.line_cog")
         self.logger.info("已載入所有 Cog")
     
-    def send_to_discord(self, message):
-        """發送文字訊息到 Discord 頻道"""
-        discord_cog = self.get_cog('DiscordCog')
-        if discord_cog and discord_cog.discord_channel:
+    def _ready_channel(self, channel_id=None):
+        """取得已解析的 Discord 頻道（未指定時為預設橋接的頻道）"""
+        return self.routes.channel(channel_id)
+    
+    @staticmethod
+    def _is_permanent_failure(error, via_webhook=False):
+        """
+        4xx（429 除外）代表重送也不會成功，例如權限不足或檔案過大
+
+        webhook 被刪除（404）時改由待送佇列以機器人帳號重送
+        """
+        if via_webhook and isinstance(error, discord.NotFound):
+            return False
+        return (
+            isinstance(error, discord.HTTPException)
+            and 400 <= error.status < 500
+            and error.status != 429
+        )
+    
+    def _webhook_ready(self, channel, author):
+        """這則訊息是否以 webhook 身分發送（需有作者且頻道的 webhook 已就緒）"""
+        return (
+            author is not None
+            and channel is not None
+            and self.webhook_sender is not None
+            and self.webhook_sender.ready(channel.id)
+        )
+    
+    @staticmethod
+    def _bot_content(author, text):
+        """以機器人帳號發送時，把作者名稱放在內容開頭"""
+        if author is None:
+            return text
+        return f"**{author.display_name}**:\n{text}"
+    
+    async def relay_text(self, author, text, idem_key=None, channel_id=None):
+        """轉發一則使用者文字（author 為 LineProfile）；啟用合併時會先暫存，與同頻道的後續訊息一起送出"""
+        if self.coalescer is None or self.coalescer.window <= 0:
+            await self.send_as(author, text, idem_key=idem_key, channel_id=channel_id)
+            return
+        await self.coalescer.add(channel_id, author, text, idem_key)
+    
+    async def _flush_coalesced(self, channel_id=None):
+        """送出其他訊息前先清空該頻道暫存的文字，維持訊息順序"""
+        if self.coalescer is not None:
+            await self.coalescer.flush(channel_id)
+    
+    async def _deliver_coalesced(self, channel_id, content, idem_key, author=None):
+        await self._deliver_text(content, idem_key, channel_id, author)
+    
+    async def send_to_discord(self, message, idem_key=None, channel_id=None):
+        """以機器人帳號發送文字訊息到 Discord 頻道；無法送出時排入待送佇列"""
+        await self._flush_coalesced(channel_id)
+        await self._deliver_text(message, idem_key, channel_id)
+    
+    async def send_as(self, author, text, idem_key=None, channel_id=None):
+        """以 Line 使用者的身分發送文字（webhook 模式用名稱與頭像，否則在內容開頭加上名稱）"""
+        await self._flush_coalesced(channel_id)
+        await self._deliver_text(text, idem_key, channel_id, author)
+    
+    async def _deliver_text(self, text, idem_key=None, channel_id=None, author=None):
+        channel = self._ready_channel(channel_id)
+        message = self._bot_content(author, text)
+        if channel is None:
+            self.logger.error("Discord 頻道未初始化，訊息已排入待送佇列")
+        elif self.outbox_pending:
+            # 佇列中還有舊訊息，排在後面以維持順序
+            pass
+        else:
+            via_webhook = self._webhook_ready(channel, author)
             try:
-                asyncio.run_coroutine_threadsafe(discord_cog.discord_channel.send(message), self.loop)
-                self.logger.info(f"成功發送訊息到 Discord: {message}")
+                started = time.perf_counter()
+                if via_webhook:
+                    await self.discord_scheduler.submit(
+                        ('webhook', channel.id), lambda: self.webhook_sender.send(channel.id, text, author)
+                    )
+                else:
+                    await self.discord_scheduler.submit(channel.id, lambda: channel.send(message))
+                DISCORD_SEND.observe_since(started)
+                self.logger.info("成功發送訊息到 Discord: %s", truncate_payload(message))
+                return
             except Exception as e:
                 self.logger.error(f"發送訊息到 Discord 時發生錯誤: {e}")
-                self.unsent_messages.append(message)
-        else:
-            self.logger.error("Discord 頻道未初始化")
-            self.unsent_messages.append(message)
+                if self._is_permanent_failure(e, via_webhook):
+                    return
+        # 待送佇列一律以機器人帳號重送，因此保存帶名稱的內容
+        await self._enqueue(message, idem_key, channel_id=channel_id)
     
-    def send_to_discord_with_attachment(self, user_name, file_path, message_type="圖片"):
-        """發送附件到 Discord 頻道"""
-        discord_cog = self.get_cog('DiscordCog')
-        
-        async def send_attachment():
-            try:
-                # 確保檔案路徑是字串格式
-                path_str = str(file_path)
-                await discord_cog.discord_channel.send(
-                    f"**{user_name}**:\n發送了{message_type}", 
-                    file=discord.File(path_str)
+    async def send_cached_media(self, author, digest, message_type="圖片", channel_id=None):
+        """
+        媒體先前已轉傳到同一個頻道時，改為回覆原訊息並附上連結
+
+        成功回傳 True；沒有索引、頻道未就緒或回覆失敗時回傳 False，由呼叫端照常上傳
+        """
+        if self.media_cache is None or digest is None:
+            return False
+        channel = self._ready_channel(channel_id)
+        if channel is None or self.outbox_pending:
+            return False
+        # 只回覆同一個頻道中的原訊息，不同橋接之間不互相引用
+        entry = await self.media_cache.lookup(digest, channel.id)
+        if entry is None:
+            return False
+        await self._flush_coalesced(channel_id)
+        text = f"發送了{message_type}（與先前相同）{entry.jump_url}"
+        reference = discord.MessageReference(
+            message_id=entry.message_id, channel_id=entry.channel_id, fail_if_not_exists=False
+        )
+        try:
+            if self._webhook_ready(channel, author):
+                # webhook 無法回覆訊息，只附上原訊息連結
+                await self.discord_scheduler.submit(
+                    ('webhook', channel.id), lambda: self.webhook_sender.send(channel.id, text, author)
                 )
-                # 發送成功後刪除暫存檔
-                os.remove(path_str)
-                self.logger.info(f"已成功發送{message_type}到Discord並刪除臨時文件: {path_str}")
-            except discord.errors.DiscordException as e:
-                self.logger.error(f"Discord API 錯誤: {e}")
+            else:
+                content = self._bot_content(author, text)
+                await self.discord_scheduler.submit(
+                    channel.id, lambda: channel.send(content, reference=reference, mention_author=False)
+                )
+        except Exception as e:
+            self.logger.error(f"回覆重複的{message_type}時發生錯誤，改為重新上傳: {e}")
+            return False
+        self.logger.info(f"{message_type}與先前轉傳的內容相同，已回覆原訊息: {entry.jump_url}")
+        return True
+    
+    async def send_to_discord_with_attachment(self, author, media, filename, message_type="圖片", idem_key=None,
+                                              digest=None, channel_id=None):
+        """
+        發送附件到 Discord 頻道（media 為 SpooledMedia，直接串流進上傳內容）
+
+        提供 digest 時，上傳成功後會記錄到媒體索引，之後相同內容只需回覆原訊息
+        """
+        await self._flush_coalesced(channel_id)
+        text = f"發送了{message_type}"
+        content = self._bot_content(author, text)
+        channel = self._ready_channel(channel_id)
+        try:
+            if channel is None:
+                self.logger.error("Discord 頻道未初始化，附件已排入待送佇列")
+            elif self.outbox_pending:
+                pass
+            else:
+                via_webhook = self._webhook_ready(channel, author)
                 try:
-                    os.remove(str(file_path))
-                except:
-                    pass
-            except Exception as e:
-                self.logger.error(f"發送{message_type}到Discord時發生錯誤: {e}")
+                    started = time.perf_counter()
+                    if via_webhook:
+                        sent = await self.discord_scheduler.submit(
+                            ('webhook', channel.id),
+                            lambda: self.webhook_sender.send(
+                                channel.id, text, author, file=discord.File(media.rewind(), filename=filename)
+                            ),
+                            priority=PRIORITY_ATTACHMENT,
+                        )
+                    else:
+                        sent = await self.discord_scheduler.submit(
+                            channel.id,
+                            lambda: channel.send(content, file=discord.File(media.rewind(), filename=filename)),
+                            priority=PRIORITY_ATTACHMENT,
+                        )
+                    DISCORD_UPLOAD.observe_since(started)
+                    self.logger.info(f"已成功發送{message_type}到Discord: {filename} ({media.size} bytes)")
+                    if self.media_cache is not None and digest is not None:
+                        try:
+                            await self.media_cache.remember(digest, sent, media.size)
+                        except Exception as e:
+                            self.logger.warning(f"寫入媒體索引時發生錯誤: {e}")
+                    return
+                except discord.errors.DiscordException as e:
+                    self.logger.error(f"Discord API 錯誤: {e}")
+                    if self._is_permanent_failure(e, via_webhook):
+                        return
+                except Exception as e:
+                    self.logger.error(f"發送{message_type}到Discord時發生錯誤: {e}")
+            await self._enqueue(content, idem_key, media=media, filename=filename, channel_id=channel_id)
+        finally:
+            media.close()
+    
+    async def _enqueue(self, content, idem_key=None, media=None, filename=None, channel_id=None):
+        try:
+            await self.outbox.enqueue(
+                content, idem_key=idem_key, channel_id=channel_id, media=media, filename=filename
+            )
+        except Exception as e:
+            self.logger.error(f"寫入待送佇列時發生錯誤: {e}")
+            return
+        self.outbox_pending = True
+        self._outbox_generation += 1
+        self.kick_outbox_replay()
+    
+    def kick_outbox_replay(self):
+        """有頻道可用時在背景啟動一次重送（同時只會有一個）"""
+        if not any(bridge.channel is not None for bridge in self.routes):
+            return
+        if self._replay_task is None or self._replay_task.done():
+            self._replay_task = asyncio.create_task(self.replay_outbox())
+    
+    async def replay_outbox(self):
+        """
+        依序重送待送佇列：連續的文字會合併成一則訊息送出，
+        每次發送之間間隔 OUTBOX_REPLAY_INTERVAL 秒；遇到暫時性錯誤或頻道尚未就緒就停下等待下次重試
+        """
+        replayed = 0
+        while True:
+            generation = self._outbox_generation
+            entries = await self.outbox.fetch(OUTBOX_REPLAY_BATCH)
+            if not entries:
+                if generation != self._outbox_generation:
+                    # 讀取期間有新訊息寫入（其觸發的重送因本工作仍在執行而略過），再讀一次
+                    continue
+                self.outbox_pending = False
+                if replayed:
+                    self.logger.info(f"待送佇列已清空，共重送 {replayed} 則訊息")
+                return True
+            for group, content in pack_text_entries(entries):
+                entry = group[0]
+                if entry.channel_id is not None and self.routes.for_channel(entry.channel_id) is None:
+                    self.logger.error(f"頻道 {entry.channel_id} 已不在橋接設定中，捨棄 {len(group)} 則待送訊息")
+                    await self.outbox.ack(group)
+                    continue
+                channel = self._ready_channel(entry.channel_id)
+                if channel is None:
+                    return False
                 try:
-                    os.remove(str(file_path))
-                except:
-                    pass
-                
-        if discord_cog and discord_cog.discord_channel:
-            # 在 Discord 事件循環中執行發送操作
-            asyncio.run_coroutine_threadsafe(send_attachment(), self.loop)
-        else:
-            self.logger.error("Discord 頻道未初始化")
-            # 頻道未初始化時也要清理檔案
-            try:
-                os.remove(str(file_path))
-            except:
-                pass
-            # 記錄一條訊息，表示有媒體未發送
-            self.unsent_messages.append(f"**{user_name}**:\n發送了{message_type}，但Discord頻道未初始化")
+                    if entry.has_attachment:
+                        await self.discord_scheduler.submit(
+                            channel.id,
+                            lambda: channel.send(content, file=discord.File(entry.blob_path, filename=entry.filename)),
+                            priority=PRIORITY_ATTACHMENT,
+                        )
+                    else:
+                        await self.discord_scheduler.submit(
+                            channel.id, lambda: channel.send(content), priority=PRIORITY_TEXT
+                        )
+                except Exception as e:
+                    if self._is_permanent_failure(e) or entry.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                        self.logger.error(f"重送訊息失敗且無法重試，已捨棄 {len(group)} 則: {e}")
+                        await self.outbox.ack(group)
+                        continue
+                    self.logger.warning(f"重送訊息時發生錯誤，稍後再試: {e}")
+                    await self.outbox.mark_failed(group)
+                    return False
+                await self.outbox.ack(group)
+                replayed += len(group)
+                await asyncio.sleep(OUTBOX_REPLAY_INTERVAL)
+    
+    async def outbox_retry_loop(self):
+        """定期檢查待送佇列，Discord 恢復後自動重送"""
+        while True:
+            await asyncio.sleep(OUTBOX_RETRY_INTERVAL)
+            if self.outbox_pending:
+                self.kick_outbox_replay()
 
-def schedule_cleanup():
-    """定期清理暫存檔案的排程任務"""
-    while True:
-        time.sleep(3600)  # 每小時執行一次
-        cleanup_temp_files()
+async def start_webhook_server(app):
+    """在目前的事件循環上啟動 aiohttp Webhook 伺服器"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=PORT)
+    await site.start()
+    return runner
 
 async def main():
     # 初始化機器人
@@ -101,25 +392,55 @@ async def main():
     # 載入擴展
     await bot.load_extensions()
     
-    # 啟動清理任務
-    cleanup_thread = threading.Thread(target=schedule_cleanup)
-    cleanup_thread.daemon = True
-    cleanup_thread.start()
+    # 啟動事件循環監測
+    if bot.loop_watchdog:
+        bot.loop_watchdog.start()
+    
+    # 啟動暫存檔期限管理
+    temp_task = asyncio.create_task(bot.temp_files.run())
+    
+    # 啟動訊息存檔的背景寫入
+    archive_task = asyncio.create_task(bot.archive.run()) if bot.archive else None
     
     # 獲取 Line Cog 實例
     line_cog = bot.get_cog('LineCog')
     
-    # 在另一個執行緒中啟動 Flask 應用
-    def run_flask():
-        line_cog.app.run(host="0.0.0.0", port=PORT)
+    # 啟動待送佇列重試任務
+    outbox_task = asyncio.create_task(bot.outbox_retry_loop())
     
-    flask_thread = threading.Thread(target=run_flask)
-    flask_thread.daemon = True
-    flask_thread.start()
+    # 在同一個事件循環中啟動 Webhook 伺服器
+    runner = await start_webhook_server(line_cog.app)
     
     # 啟動 Discord Bot
-    await bot.start(DISCORD_TOKEN)
+    try:
+        await bot.start(DISCORD_TOKEN)
+    finally:
+        # 尚未送出的合併文字會寫入待送佇列
+        if bot.coalescer is not None:
+            await bot.coalescer.flush_all()
+        discord_cog = bot.get_cog('DiscordCog')
+        if discord_cog and discord_cog.push_batcher:
+            await discord_cog.push_batcher.flush_all()
+        outbox_task.cancel()
+        temp_task.cancel()
+        if bot.loop_watchdog:
+            bot.loop_watchdog.stop()
+        await runner.cleanup()
+        if archive_task:
+            archive_task.cancel()
+            await bot.archive.flush()
+            bot.archive.close()
+        if bot.webhook_sender:
+            await bot.webhook_sender.close()
+        bot.outbox.close()
+        if bot.media_cache:
+            bot.media_cache.close()
 
 if __name__ == "__main__":
-    # 啟動主程式
-    asyncio.run(main())
\ No newline at end of file
+    if BRIDGE_MODE == 'ingress':
+        # 拆分部署：只執行 Webhook 入口，不連線 Discord
+        from ingress import main as ingress_main
+        asyncio.run(ingress_main())
+    else:
+        # 啟動主程式（all 或 consumer）
+        asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,66 @@
+import asyncio
+
+from utils.admission import AdmissionController, MODE_SHED_MEDIA, MODE_COALESCE
+from utils.coalescer import TextCoalescer
+from utils.profile_cache import LineProfile
+
+
+class Probe:
+    def __init__(self):
+        self.depth = 0
+
+    def __call__(self):
+        return self.depth, 0.0, 0
+
+
+def test_escalates_one_level_per_interval_and_recovers_with_hysteresis():
+    probe = Probe()
+    modes = []
+    controller = AdmissionController(probe, queue_high=10, escalate_interval=5, recover_seconds=30,
+                                     on_change=modes.append)
+    probe.depth = 50
+    assert controller.evaluate(now=0) == MODE_SHED_MEDIA
+    # 升級之間至少間隔 escalate_interval 秒
+    assert controller.evaluate(now=1) == MODE_SHED_MEDIA
+    for now in (5, 10, 15, 20):
+        controller.evaluate(now=now)
+    assert controller.mode == MODE_COALESCE
+
+    probe.depth = 0
+    controller.evaluate(now=21)
+    assert controller.evaluate(now=50) == MODE_COALESCE
+    assert controller.evaluate(now=51) == MODE_COALESCE - 1
+    assert modes == [1, 2, 3, 2]
+
+    # 壓力介於 recover_ratio 與門檻之間時不降級
+    probe.depth = 7
+    assert controller.evaluate(now=200) == MODE_COALESCE - 1
+
+
+def test_coalesce_mode_under_concurrent_load_keeps_every_message():
+    async def scenario():
+        delivered = []
+
+        async def deliver(key, content, idem_key, author):
+            await asyncio.sleep(0.002)
+            delivered.extend(content.split('\n'))
+
+        coalescer = TextCoalescer(deliver, window=0.0, limit=60, per_author=True)
+        authors = [LineProfile(name) for name in 'AB']
+
+        def on_change(mode):
+            coalescer.window = 0.02 if mode >= MODE_COALESCE else 0.0
+
+        controller = AdmissionController(lambda: (100, 0.0, 0), queue_high=10, escalate_interval=0,
+                                         on_change=on_change)
+        while controller.evaluate() != MODE_COALESCE:
+            pass
+        await asyncio.gather(*(coalescer.add(1, authors[i // 3 % 2], f"m{i}")
+                               for i in range(100)))
+        await asyncio.sleep(0.05)
+        await coalescer.flush_all()
+        return controller.mode, delivered
+
+    mode, delivered = asyncio.run(scenario())
+    assert mode == MODE_COALESCE
+    assert delivered == [f"m{i}" for i in range(100)]
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytz
+import pytest
+
+from utils.archive import (
+    MessageArchive, DIRECTION_LINE_TO_DISCORD, DIRECTION_DISCORD_TO_LINE, build_match, parse_time_bound,
+)
+
+
+def test_build_match_segments_cjk_into_phrases():
+    assert build_match('午餐 pizza') == '" 午  餐 " AND "pizza"'
+    assert build_match('', 'Amy') == 'author : "Amy"'
+    assert build_match('', '') is None
+
+
+def test_parse_time_bound():
+    tz = pytz.timezone('Asia/Taipei')
+    now = 1_700_000_000
+    assert parse_time_bound('2h', tz, now=now) == now - 7200
+    assert parse_time_bound('', tz) is None
+    start = parse_time_bound('2024-01-31', tz)
+    end = parse_time_bound('2024-01-31', tz, end=True)
+    assert 86399 < end - start < 86400
+    with pytest.raises(ValueError):
+        parse_time_bound('昨天', tz)
+
+
+def test_search_by_keyword_author_channel_and_time(tmp_path):
+    async def scenario():
+        archive = MessageArchive(tmp_path / 'archive.sqlite3')
+        archive.record(DIRECTION_LINE_TO_DISCORD, 'text', '今天午餐吃什麼', author='小明', channel_id=1)
+        archive.record(DIRECTION_DISCORD_TO_LINE, 'text', 'pizza 可以', author='Amy', channel_id=1)
+        archive.record(DIRECTION_LINE_TO_DISCORD, 'text', '午餐在別的頻道', author='小華', channel_id=2)
+        await archive.flush()
+        cutoff = time.time()
+        await asyncio.sleep(0.01)
+        archive.record(DIRECTION_LINE_TO_DISCORD, 'text', '晚餐也吃午餐', author='小明', channel_id=1)
+        await archive.flush()
+
+        results = {
+            'lunch_1': await archive.search('午餐', channel_id=1),
+            'author': await archive.search(author='Amy', channel_id=1),
+            'after': await archive.search('午餐', since=cutoff, channel_id=1),
+            'before': await archive.search('午餐', until=cutoff, channel_id=1),
+            'recent': await archive.search(channel_id=1, limit=2),
+        }
+        stats = archive.stats()
+        archive.close()
+        return results, stats
+
+    results, stats = asyncio.run(scenario())
+    texts = {name: [m.text for m in found] for name, found in results.items()}
+    assert texts['lunch_1'] == ['晚餐也吃午餐', '今天午餐吃什麼']
+    assert texts['author'] == ['pizza 可以']
+    assert texts['after'] == ['晚餐也吃午餐']
+    assert texts['before'] == ['今天午餐吃什麼']
+    assert texts['recent'] == ['晚餐也吃午餐', 'pizza 可以']
+    assert stats['written'] == 4
+
+
+def test_prune_removes_old_messages_from_index(tmp_path):
+    async def scenario():
+        archive = MessageArchive(tmp_path / 'archive.sqlite3')
+        for i in range(5):
+            archive.record(DIRECTION_LINE_TO_DISCORD, 'text', f'舊訊息 {i}', channel_id=1)
+        await archive.flush()
+        await asyncio.sleep(0.01)
+        cutoff = time.time()
+        archive.record(DIRECTION_LINE_TO_DISCORD, 'text', '新訊息', channel_id=1)
+        await archive.flush()
+        removed = await asyncio.to_thread(archive._prune, cutoff, 2)
+        found = await archive.search('訊息')
+        archive.close()
+        return removed, [m.text for m in found]
+
+    removed, found = asyncio.run(scenario())
+    assert removed == 5
+    assert found == ['新訊息']
+
+
+def test_pending_queue_is_bounded(tmp_path):
+    archive = MessageArchive(tmp_path / 'archive.sqlite3', max_pending=2)
+    for i in range(3):
+        archive.record(DIRECTION_LINE_TO_DISCORD, 'text', str(i))
+    assert archive.stats()['pending'] == 2
+    assert archive.stats()['dropped'] == 1
+    archive.close()
@@ -0,0 +1,72 @@
+import asyncio
+
+from utils.coalescer import TextCoalescer
+from utils.profile_cache import LineProfile
+
+A = LineProfile('A')
+B = LineProfile('B')
+
+
+class Recorder:
+    """記錄送出的內容；每次送出都會讓出事件循環，模擬實際的網路延遲"""
+
+    def __init__(self):
+        self.delivered = []
+
+    async def __call__(self, key, content, idem_key, author):
+        await asyncio.sleep(0.01)
+        self.delivered.append(content)
+
+
+def test_concurrent_add_during_author_flush_keeps_every_message():
+    async def scenario():
+        deliver = Recorder()
+        coalescer = TextCoalescer(deliver, window=0.05, per_author=True)
+        await coalescer.add(1, A, 'm1')
+        # B 觸發送出 m1 的期間，A 的下一則訊息同時進來
+        await asyncio.gather(coalescer.add(1, B, 'm2'), coalescer.add(1, A, 'm3'))
+        await asyncio.sleep(0.1)
+        await coalescer.flush_all()
+        return deliver.delivered
+
+    assert asyncio.run(scenario()) == ['m1', 'm2', 'm3']
+
+
+def test_concurrent_add_during_overflow_flush_keeps_every_message():
+    async def scenario():
+        deliver = Recorder()
+        coalescer = TextCoalescer(deliver, window=0.05, limit=20)
+        await coalescer.add(1, A, 'x' * 10)
+        await asyncio.gather(coalescer.add(1, A, 'y' * 10), coalescer.add(1, A, 'z'))
+        await asyncio.sleep(0.1)
+        await coalescer.flush_all()
+        return ''.join(deliver.delivered)
+
+    delivered = asyncio.run(scenario())
+    for text in ('x' * 10, 'y' * 10, 'z'):
+        assert text in delivered
+    assert delivered.index('x') < delivered.index('y') < delivered.index('z')
+
+
+def test_per_author_shared_channel_delivers_each_author_in_order():
+    async def scenario():
+        delivered = []
+
+        async def deliver(key, content, idem_key, author):
+            await asyncio.sleep(0.005)
+            delivered.append((author.display_name, content))
+
+        coalescer = TextCoalescer(deliver, window=0.02, per_author=True)
+        authors = [LineProfile(name) for name in 'ABC']
+        # 多位作者同時在同一個頻道發言，每則訊息都會觸發換人送出
+        await asyncio.gather(*(
+            coalescer.add(1, authors[i % 3], f"{authors[i % 3].display_name}{i}") for i in range(30)
+        ))
+        await asyncio.sleep(0.05)
+        await coalescer.flush_all()
+        return delivered
+
+    delivered = asyncio.run(scenario())
+    lines = [(name, line) for name, content in delivered for line in content.split('\n')]
+    assert all(line.startswith(name) for name, line in lines)
+    assert [int(line[1:]) for _, line in lines] == list(range(30))
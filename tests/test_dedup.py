@@ -0,0 +1,45 @@
+from utils.dedup import EventDeduplicator
+
+
+def test_oldest_keys_are_evicted_at_capacity():
+    dedup = EventDeduplicator(capacity=3)
+    for key in ('a', 'b', 'c', 'd'):
+        dedup.add(key)
+    assert 'a' not in dedup
+    assert all(key in dedup for key in ('b', 'c', 'd'))
+    assert len(dedup) == 3
+
+
+def test_duplicates_are_counted():
+    dedup = EventDeduplicator()
+    dedup.add('a')
+    dedup.add('a')
+    assert dedup.is_duplicate('a')
+    assert not dedup.is_duplicate('b')
+    assert dedup.duplicates == 1
+    assert len(dedup) == 1
+
+
+def test_snapshot_survives_restart(tmp_path):
+    path = tmp_path / 'dedup.json'
+    dedup = EventDeduplicator(capacity=10, snapshot_path=path)
+    for key in ('a', 'b', 'c'):
+        dedup.add(key)
+    assert dedup.dirty
+    dedup.save(dedup.snapshot())
+    assert not dedup.dirty
+
+    restored = EventDeduplicator(capacity=2, snapshot_path=path)
+    restored.load()
+    # 容量變小時只保留最新的鍵
+    assert 'a' not in restored
+    assert restored.is_duplicate('b') and restored.is_duplicate('c')
+    assert not restored.dirty
+
+
+def test_corrupt_snapshot_starts_empty(tmp_path):
+    path = tmp_path / 'dedup.json'
+    path.write_text('{not json', encoding='utf-8')
+    dedup = EventDeduplicator(snapshot_path=path)
+    dedup.load()
+    assert len(dedup) == 0
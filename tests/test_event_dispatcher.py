@@ -0,0 +1,79 @@
+import random
+import asyncio
+from types import SimpleNamespace
+
+from utils.event_dispatcher import ShardedDispatcher, conversation_key
+
+
+def event(group, seq):
+    return SimpleNamespace(source=SimpleNamespace(group_id=group, room_id=None, user_id='U1'), seq=seq)
+
+
+def test_conversation_key_prefers_group_then_room_then_user():
+    assert conversation_key(event('G1', 0)) == 'G1'
+    assert conversation_key(SimpleNamespace(source=SimpleNamespace(group_id=None, room_id='R1'))) == 'R1'
+    assert conversation_key(SimpleNamespace(source=SimpleNamespace(user_id='U9'))) == 'U9'
+    assert conversation_key(SimpleNamespace()) == ''
+
+
+def test_events_of_one_conversation_are_handled_in_order():
+    async def scenario():
+        handled = {}
+        rng = random.Random(1)
+
+        async def handler(ev):
+            # 處理時間隨機，後到的事件若能插隊就會打亂順序
+            await asyncio.sleep(rng.random() * 0.003)
+            handled.setdefault(ev.source.group_id, []).append(ev.seq)
+
+        dispatcher = ShardedDispatcher(handler, shards=4, queue_size=100)
+        dispatcher.start()
+        done = asyncio.Event()
+        remaining = 5 * 40
+
+        def on_done():
+            nonlocal remaining
+            remaining -= 1
+            if remaining == 0:
+                done.set()
+
+        for seq in range(40):
+            for group in ('G1', 'G2', 'G3', 'G4', 'G5'):
+                assert dispatcher.submit(event(group, seq), on_done)
+        await asyncio.wait_for(done.wait(), 5)
+        await dispatcher.stop()
+        return handled
+
+    handled = asyncio.run(scenario())
+    assert set(handled) == {'G1', 'G2', 'G3', 'G4', 'G5'}
+    for seqs in handled.values():
+        assert seqs == list(range(40))
+
+
+def test_full_shard_rejects_and_failed_handler_still_completes():
+    async def scenario():
+        gate = asyncio.Event()
+        completed = []
+
+        async def handler(ev):
+            await gate.wait()
+            if ev.seq == 0:
+                raise RuntimeError('boom')
+
+        dispatcher = ShardedDispatcher(handler, shards=1, queue_size=2)
+        dispatcher.start()
+        accepted = [dispatcher.submit(event('G1', seq), lambda seq=seq: completed.append(seq)) for seq in range(2)]
+        await asyncio.sleep(0)
+        # 第一筆已在處理中，佇列剩一筆，還能再排一筆
+        accepted.append(dispatcher.submit(event('G1', 2), lambda: completed.append(2)))
+        accepted.append(dispatcher.submit(event('G1', 3), lambda: completed.append(3)))
+        gate.set()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        await dispatcher.stop()
+        return accepted, completed, dispatcher.dropped
+
+    accepted, completed, dropped = asyncio.run(scenario())
+    assert accepted == [True, True, True, False]
+    assert completed == [0, 1, 2]
+    assert dropped == 1
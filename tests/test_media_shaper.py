@@ -0,0 +1,64 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils import media_shaper
+from utils.file_utils import SpooledMedia
+from utils.media_shaper import MediaShaper
+
+pytestmark = pytest.mark.skipif(not media_shaper.PILLOW_AVAILABLE, reason='需要 Pillow')
+
+
+def make_media(size):
+    media = SpooledMedia(size + 1)
+    media.write(b'x' * size)
+    media.rewind()
+    return media
+
+
+def thread_shaper(**kwargs):
+    """以執行緒代替子行程，測試中可以替換 _shrink_image"""
+    shaper = MediaShaper(**kwargs)
+    shaper._executor = ThreadPoolExecutor(max_workers=1)
+    shaper._semaphore = asyncio.Semaphore(1)
+    return shaper
+
+
+def test_timeout_is_charged_to_cpu_budget(monkeypatch):
+    def slow(*args):
+        time.sleep(0.3)
+        return None, 0.0
+
+    monkeypatch.setattr(media_shaper, '_shrink_image', slow)
+
+    async def scenario():
+        shaper = thread_shaper(timeout=0.05, cpu_budget_per_minute=0.05)
+        first = await shaper.shrink_image(make_media(100), target_bytes=10)
+        second = await shaper.shrink_image(make_media(100), target_bytes=10)
+        shaper._executor.shutdown(wait=True)
+        return first, second, shaper.stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert first is None and second is None
+    assert stats['failures'] == 1
+    assert stats['skipped_cpu_budget'] == 1
+    assert stats['cpu_seconds_last_minute'] >= 0.05
+
+
+def test_oversized_input_is_not_read(monkeypatch):
+    def fail(*args):
+        raise AssertionError('不應送到子行程')
+
+    monkeypatch.setattr(media_shaper, '_shrink_image', fail)
+
+    async def scenario():
+        shaper = thread_shaper(max_input_bytes=50)
+        result = await shaper.shrink_image(make_media(100), target_bytes=10)
+        shaper._executor.shutdown(wait=True)
+        return result, shaper.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result is None
+    assert stats['skipped_too_large'] == 1
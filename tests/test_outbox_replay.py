@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+import main
+from main import LineDiscordBot
+from utils.outbox import Outbox
+from utils.routing import Bridge, RoutingTable
+
+
+class FakeChannel:
+    id = 1
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content, **kwargs):
+        self.sent.append(content)
+
+
+class FakeScheduler:
+    async def submit(self, key, send, priority=None):
+        return await send()
+
+
+class GatedOutbox(Outbox):
+    """第一次讀取完成後停在 gate，模擬讀取還在工作執行緒時另一則訊息寫入"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gate = asyncio.Event()
+        self.fetched = asyncio.Event()
+        self.fetches = 0
+
+    async def fetch(self, limit=50):
+        entries = await super().fetch(limit)
+        self.fetches += 1
+        if self.fetches == 1:
+            self.fetched.set()
+            await self.gate.wait()
+        return entries
+
+
+class Bot:
+    """只帶有待送佇列相關狀態的機器人，方法直接沿用 LineDiscordBot"""
+
+    _enqueue = LineDiscordBot._enqueue
+    kick_outbox_replay = LineDiscordBot.kick_outbox_replay
+    replay_outbox = LineDiscordBot.replay_outbox
+    _ready_channel = LineDiscordBot._ready_channel
+    _is_permanent_failure = LineDiscordBot._is_permanent_failure
+
+    def __init__(self, outbox, channel):
+        bridge = Bridge('default', 'C1', channel.id, default=True)
+        bridge.channel = channel
+        self.routes = RoutingTable([bridge])
+        self.outbox = outbox
+        self.outbox_pending = True
+        self._outbox_generation = 0
+        self._replay_task = None
+        self.discord_scheduler = FakeScheduler()
+        self.logger = logging.getLogger('line_discord_bridge')
+
+
+def test_enqueue_during_empty_fetch_is_replayed(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'OUTBOX_REPLAY_INTERVAL', 0)
+
+    async def scenario():
+        outbox = GatedOutbox(tmp_path / 'outbox.sqlite3', tmp_path / 'blobs')
+        channel = FakeChannel()
+        bot = Bot(outbox, channel)
+        bot.kick_outbox_replay()
+        replay = bot._replay_task
+        # 重送已讀到空佇列但還沒返回時，新訊息寫入並嘗試啟動重送
+        await outbox.fetched.wait()
+        await bot._enqueue('hello', idem_key='m1', channel_id=channel.id)
+        outbox.gate.set()
+        await replay
+        if bot._replay_task is not replay:
+            await bot._replay_task
+        pending = await outbox.count()
+        outbox.close()
+        return channel.sent, bot.outbox_pending, pending
+
+    sent, outbox_pending, pending = asyncio.run(scenario())
+    assert sent == ['hello']
+    assert pending == 0
+    assert outbox_pending is False
+
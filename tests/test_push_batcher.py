@@ -0,0 +1,41 @@
+import asyncio
+
+from utils.push_batcher import PushBatcher
+
+
+def test_failed_push_reports_each_origin_once():
+    async def scenario():
+        reports = []
+
+        async def push(to, messages):
+            raise RuntimeError('HTTP 400')
+
+        async def on_failure(to, origins, error):
+            reports.append((to, list(origins), str(error)))
+
+        batcher = PushBatcher(push, window=0.01, on_failure=on_failure)
+        batcher.add('C1', [{'type': 'text'}, {'type': 'image'}], origin='d1')
+        batcher.add('C1', [{'type': 'text'}], origin='d2')
+        await asyncio.sleep(0.05)
+        await batcher.flush_all()
+        return reports, batcher.stats()
+
+    reports, stats = asyncio.run(scenario())
+    assert reports == [('C1', ['d1', 'd2'], 'HTTP 400')]
+    assert stats['failed_messages'] == 3
+
+
+def test_full_batch_is_sent_without_waiting():
+    async def scenario():
+        pushed = []
+
+        async def push(to, messages):
+            pushed.append(len(messages))
+
+        batcher = PushBatcher(push, window=10, max_messages=5)
+        batcher.add('C1', [{'type': 'text'}] * 6, origin='d1')
+        await asyncio.sleep(0)
+        await batcher.flush_all()
+        return pushed
+
+    assert asyncio.run(scenario()) == [5, 1]
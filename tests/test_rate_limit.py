@@ -0,0 +1,114 @@
+import asyncio
+import logging
+
+import pytest
+
+from utils.rate_limit import (
+    SendScheduler, SchedulerOverloaded, DiscordRateLimitListener, PRIORITY_TEXT, PRIORITY_ATTACHMENT,
+)
+
+
+class RateLimited(Exception):
+    status = 429
+
+
+def retry_after(error):
+    return 0.01 if isinstance(error, RateLimited) else None
+
+
+def test_text_is_sent_before_queued_attachments():
+    async def scenario():
+        order = []
+        scheduler = SendScheduler('test', rate=1000, capacity=1)
+
+        def send(name):
+            async def run():
+                order.append(name)
+            return run
+
+        # 第一筆佔用唯一的權杖，其餘依優先順序排隊
+        await asyncio.gather(
+            scheduler.submit(1, send('first')),
+            scheduler.submit(1, send('attachment'), priority=PRIORITY_ATTACHMENT),
+            scheduler.submit(1, send('text'), priority=PRIORITY_TEXT),
+        )
+        return order
+
+    assert asyncio.run(scenario()) == ['first', 'text', 'attachment']
+
+
+def test_rate_limited_send_is_retried_after_pause():
+    async def scenario():
+        attempts = []
+        scheduler = SendScheduler('test', rate=1000, capacity=10, retry_after=retry_after)
+
+        async def send():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimited()
+            return 'ok'
+
+        result = await scheduler.submit(1, send)
+        return result, len(attempts), scheduler.stats()
+
+    result, attempts, stats = asyncio.run(scenario())
+    assert result == 'ok'
+    assert attempts == 3
+    assert stats['throttled'] == 2
+    assert stats['sent'] == 1
+
+
+def test_retries_are_bounded():
+    async def scenario():
+        scheduler = SendScheduler('test', rate=1000, capacity=10, retry_after=retry_after, max_retries=2)
+
+        async def send():
+            raise RateLimited()
+
+        await scheduler.submit(1, send)
+
+    with pytest.raises(RateLimited):
+        asyncio.run(scenario())
+
+
+def test_full_queue_sheds_lowest_priority_first():
+    async def scenario():
+        scheduler = SendScheduler('test', rate=1000, capacity=1, max_queue=1)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        async def noop():
+            return None
+
+        running = asyncio.create_task(scheduler.submit(1, blocked))
+        await asyncio.sleep(0)
+        attachment = asyncio.create_task(scheduler.submit(1, noop, priority=PRIORITY_ATTACHMENT))
+        await asyncio.sleep(0)
+        text = asyncio.create_task(scheduler.submit(1, noop, priority=PRIORITY_TEXT))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerOverloaded):
+            await scheduler.submit(1, noop, priority=PRIORITY_ATTACHMENT)
+        gate.set()
+        results = await asyncio.gather(running, attachment, text, return_exceptions=True)
+        return results, scheduler.shed
+
+    results, shed = asyncio.run(scenario())
+    assert isinstance(results[1], SchedulerOverloaded)
+    assert results[2] is None
+    assert shed == 2
+
+
+def test_discord_rate_limit_warning_pauses_channel_bucket():
+    scheduler = SendScheduler('Discord', rate=5, capacity=5)
+    listener = DiscordRateLimitListener(scheduler)
+    record = logging.LogRecord(
+        'discord.http', logging.WARNING, __file__, 0,
+        'We are being rate limited. Retrying in %.2f seconds. Handled under the bucket "%s"',
+        (2.5, '123456:None:/channels/{channel_id}/messages'), None,
+    )
+    listener.emit(record)
+    assert scheduler.throttled == 1
+    assert scheduler.bucket(123456).delay() > 2
+    assert scheduler.bucket(654321).delay() == 0
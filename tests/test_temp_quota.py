@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from utils.file_utils import TempFileManager, TempQuotaExceeded, spool_stream
+
+
+async def chunks(count, size):
+    for _ in range(count):
+        await asyncio.sleep(0.01)
+        yield b'x' * size
+
+
+def test_concurrent_downloads_never_exceed_quota(tmp_path):
+    async def scenario():
+        store = TempFileManager(tmp_path, quota_bytes=100, wait_timeout=0.2)
+        runner = asyncio.create_task(store.run())
+        peak = 0
+        charge = store.charge
+
+        def tracking_charge(path, nbytes):
+            nonlocal peak
+            charge(path, nbytes)
+            with store._lock:
+                peak = max(peak, sum(entry[2] for entry in store._files.values()))
+
+        store.charge = tracking_charge
+        results = await asyncio.gather(
+            *(spool_stream(chunks(2, 40), threshold=0, store=store, owner=i) for i in range(2)),
+            return_exceptions=True,
+        )
+        stats = store.stats()
+        for result in results:
+            if not isinstance(result, Exception):
+                result.close()
+        runner.cancel()
+        return results, peak, stats, store.stats()
+
+    results, peak, during, after = asyncio.run(scenario())
+    assert peak <= 100
+    assert any(isinstance(result, TempQuotaExceeded) for result in results)
+    assert during['reserved_bytes'] == 0
+    assert after['used_bytes'] == 0
+
+
+def test_reservation_is_returned_when_write_fails(tmp_path):
+    async def scenario():
+        store = TempFileManager(tmp_path, quota_bytes=100, wait_timeout=0.2)
+
+        async def broken():
+            yield b'x' * 10
+            raise OSError('connection reset')
+
+        with pytest.raises(OSError):
+            await spool_stream(broken(), threshold=0, store=store)
+        return store.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats['used_bytes'] == 0
+    assert stats['reserved_bytes'] == 0
@@ -0,0 +1,112 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger('line_discord_bridge')
+
+# 降級模式（數字越大越保守，每一級都包含前一級的措施）
+MODE_NORMAL = 0
+MODE_SHED_MEDIA = 1       # 媒體不下載，只通知「發送了圖片」
+MODE_CACHED_PROFILES = 2  # 使用者名稱只查快取，未命中時用 ID 末碼
+MODE_COALESCE = 3         # 文字以較長的視窗合併
+MODE_NAMES = ('normal', 'shed_media', 'cached_profiles', 'coalesce')
+
+
+class AdmissionController:
+    """
+    過載時的准入控制：
+    - 定期取樣佇列深度、最舊事件的等待時間與 Discord 429 的頻率，換算成壓力值（1.0 = 達到門檻）
+    - 壓力達到門檻時往上升一級，且每次升級之間至少間隔 escalate_interval 秒，讓前一級的效果先反映出來
+    - 壓力持續低於 recover_ratio 達 recover_seconds 秒後才降一級（遲滯），避免在門檻附近來回切換
+    """
+
+    def __init__(self, probe, queue_high=200, age_high=10.0, throttle_high=0.5, interval=1.0,
+                 escalate_interval=5.0, recover_ratio=0.5, recover_seconds=30.0, on_change=None):
+        """probe() 回傳 (佇列深度, 最舊事件等待秒數, 累計 429 次數)"""
+        self.probe = probe
+        self.queue_high = queue_high
+        self.age_high = age_high
+        self.throttle_high = throttle_high
+        self.interval = interval
+        self.escalate_interval = escalate_interval
+        self.recover_ratio = recover_ratio
+        self.recover_seconds = recover_seconds
+        self.on_change = on_change
+        self.mode = MODE_NORMAL
+        self.pressure = 0.0
+        self.transitions = 0
+        self.shed = {'media': 0, 'profile': 0}
+        self._last_throttled = None
+        self._changed_at = float('-inf')
+        self._calm_since = None
+
+    @property
+    def shed_media(self):
+        return self.mode >= MODE_SHED_MEDIA
+
+    @property
+    def cached_profiles_only(self):
+        return self.mode >= MODE_CACHED_PROFILES
+
+    @property
+    def coalesce_harder(self):
+        return self.mode >= MODE_COALESCE
+
+    def record_shed(self, kind):
+        self.shed[kind] += 1
+
+    def evaluate(self, now=None):
+        """取樣一次並視需要切換模式，回傳目前模式"""
+        now = time.monotonic() if now is None else now
+        depth, age, throttled = self.probe()
+        throttle_rate = 0.0
+        if self._last_throttled is not None:
+            throttle_rate = max(0, throttled - self._last_throttled) / self.interval
+        self._last_throttled = throttled
+
+        self.pressure = max(
+            depth / self.queue_high if self.queue_high else 0.0,
+            age / self.age_high if self.age_high else 0.0,
+            throttle_rate / self.throttle_high if self.throttle_high else 0.0,
+        )
+
+        if self.pressure >= 1.0:
+            self._calm_since = None
+            if self.mode < MODE_COALESCE and now - self._changed_at >= self.escalate_interval:
+                self._set_mode(self.mode + 1, now)
+        elif self.pressure < self.recover_ratio:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif self.mode > MODE_NORMAL and now - self._calm_since >= self.recover_seconds:
+                self._set_mode(self.mode - 1, now)
+                # 每降一級都重新累計平穩時間
+                self._calm_since = now
+        else:
+            self._calm_since = None
+        return self.mode
+
+    def _set_mode(self, mode, now):
+        previous = self.mode
+        self.mode = mode
+        self._changed_at = now
+        self.transitions += 1
+        log = logger.warning if mode > previous else logger.info
+        log(f"准入控制：{MODE_NAMES[previous]} → {MODE_NAMES[mode]}（壓力 {self.pressure:.2f}）")
+        if self.on_change is not None:
+            self.on_change(mode)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.evaluate()
+            except Exception as e:
+                logger.warning(f"准入控制取樣時發生錯誤: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'mode': MODE_NAMES[self.mode],
+            'pressure': round(self.pressure, 3),
+            'transitions': self.transitions,
+            'shed': dict(self.shed),
+        }
@@ -0,0 +1,294 @@
+import re
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+
+logger = logging.getLogger('line_discord_bridge')
+
+DIRECTION_LINE_TO_DISCORD = 'line_to_discord'
+DIRECTION_DISCORD_TO_LINE = 'discord_to_line'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    direction TEXT NOT NULL,
+    line_id TEXT,
+    channel_id INTEGER,
+    author TEXT,
+    author_id TEXT,
+    kind TEXT NOT NULL,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts);
+CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (text, author, content='');
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text, author) VALUES (new.id, segment(new.text), segment(new.author));
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text, author)
+    VALUES ('delete', old.id, segment(old.text), segment(old.author));
+END;
+"""
+
+# 中日韓文字沒有空白分詞，索引時每個字各自成為一個詞，查詢時以片語比對連續的字
+_CJK_RE = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af])')
+
+
+def segment(text):
+    """索引與查詢共用的斷詞前處理"""
+    if not text:
+        return ''
+    return _CJK_RE.sub(r' \1 ', text)
+
+
+def _phrase(value):
+    return '"' + segment(value).replace('"', '""') + '"'
+
+
+def build_match(keywords='', author=''):
+    """將關鍵字（空白分隔，全部都要符合）與作者轉成 FTS5 查詢；兩者皆空時回傳 None"""
+    terms = [_phrase(word) for word in keywords.split() if segment(word).strip()]
+    if author and segment(author).strip():
+        terms.append(f"author : {_phrase(author)}")
+    return ' AND '.join(terms) or None
+
+
+_RELATIVE_RE = re.compile(r'^(\d+)\s*([mhdw])$', re.IGNORECASE)
+_RELATIVE_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+
+def parse_time_bound(value, tz, end=False, now=None):
+    """
+    解析搜尋的時間條件，回傳 Unix 秒；空字串回傳 None
+
+    接受相對時間（30m、12h、7d、2w = 距今多久以前）或 tz 時區的日期（2024-01-31、2024-01-31 18:00）；
+    end=True 且只給日期時取當天結束
+    """
+    value = (value or '').strip()
+    if not value:
+        return None
+    now = time.time() if now is None else now
+    match = _RELATIVE_RE.match(value)
+    if match:
+        return now - int(match.group(1)) * _RELATIVE_UNITS[match.group(2).lower()]
+    for fmt, whole_day in (('%Y-%m-%d %H:%M', False), ('%Y-%m-%d', True), ('%Y/%m/%d', True)):
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if end and whole_day:
+            parsed += timedelta(days=1)
+        return tz.localize(parsed).timestamp() - (1e-6 if end and whole_day else 0)
+    raise ValueError(f"無法解析時間「{value}」，請使用 7d、12h 或 2024-01-31 的格式")
+
+
+class ArchivedMessage:
+    """搜尋結果中的一則訊息"""
+
+    __slots__ = ('id', 'ts', 'direction', 'author', 'kind', 'text')
+
+    def __init__(self, id, ts, direction, author, kind, text):
+        self.id = id
+        self.ts = ts
+        self.direction = direction
+        self.author = author
+        self.kind = kind
+        self.text = text
+
+
+class MessageArchive:
+    """
+    轉發訊息的本機存檔（SQLite + FTS5）：
+    - record() 只把資料放進記憶體佇列，由背景工作批次寫入，不會卡在轉發路徑上
+    - 只新增不修改；全文索引由觸發器隨新增/刪除增量維護（不保存第二份內容）
+    - 依保存天數分批刪除舊訊息，刪除後做小量的索引合併
+    - 搜尋以 rowid 倒序並限制筆數，時間範圍先換算成 rowid 範圍，資料量大時仍只需讀取少量索引
+    """
+
+    def __init__(self, db_path, batch_size=200, flush_interval=1.0, max_pending=10000, retention_days=0,
+                 prune_interval=3600):
+        self.db_path = Path(db_path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retention_seconds = retention_days * 86400
+        self.prune_interval = prune_interval
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # 寫入與查詢各用一個連線（WAL 下讀寫互不阻塞）
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._writer.create_function('segment', 1, segment, deterministic=True)
+        self._writer.executescript(_SCHEMA)
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self.written = 0
+        self.dropped = 0
+        self.pruned = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+    # -----------------------------
+    # 記錄（轉發路徑上呼叫，不做 I/O）
+    # -----------------------------
+    def record(self, direction, kind, text='', author='', author_id='', line_id='', channel_id=None):
+        """記錄一則已轉發的訊息，時間為轉發當下（與 rowid 同樣遞增，時間範圍才能換算成 rowid 範圍）"""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append((
+            time.time(), direction, line_id, channel_id, author, author_id, kind, text or '',
+        ))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    # -----------------------------
+    # 背景寫入
+    # -----------------------------
+    async def run(self):
+        last_prune = time.monotonic()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self.retention_seconds and time.monotonic() - last_prune >= self.prune_interval:
+                last_prune = time.monotonic()
+                try:
+                    await asyncio.to_thread(self._prune, time.time() - self.retention_seconds)
+                except Exception as e:
+                    logger.warning(f"清理訊息存檔時發生錯誤: {e}")
+
+    async def flush(self):
+        """寫入目前佇列中的所有訊息"""
+        while self._pending:
+            rows = [self._pending.popleft() for _ in range(min(len(self._pending), self.batch_size))]
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                self.dropped += len(rows)
+                logger.error(f"寫入訊息存檔時發生錯誤，捨棄 {len(rows)} 則: {e}")
+
+    def _write(self, rows):
+        with self._write_lock:
+            self._writer.execute("BEGIN")
+            try:
+                self._writer.executemany(
+                    "INSERT INTO messages (ts, direction, line_id, channel_id, author, author_id, kind, text)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._writer.execute("COMMIT")
+            except Exception:
+                self._writer.execute("ROLLBACK")
+                raise
+        self.written += len(rows)
+
+    def _prune(self, cutoff, chunk=2000):
+        """分批刪除早於 cutoff 的訊息，每批之間釋放鎖讓寫入可以進行"""
+        removed = 0
+        while True:
+            with self._write_lock:
+                deleted = self._writer.execute(
+                    "DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE ts < ? LIMIT ?)",
+                    (cutoff, chunk),
+                ).rowcount
+            removed += deleted
+            if deleted < chunk:
+                break
+        if removed:
+            with self._write_lock:
+                # 刪除會留下墓碑，做少量的增量合併即可，不需要整個索引重建
+                self._writer.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('merge', 500)")
+            self.pruned += removed
+            logger.info(f"已清理 {removed} 則超過保存期限的存檔訊息")
+        return removed
+
+    # -----------------------------
+    # 搜尋
+    # -----------------------------
+    def _rowid_range(self, since, until):
+        """
+        時間範圍對應的 rowid 範圍：各只需在時間索引上查一筆
+
+        時間隨 rowid 遞增（系統時鐘被調整時可能有少量例外，查詢時仍會再以時間精確過濾）
+        """
+        low, high = 0, None
+        if since is not None:
+            row = self._reader.execute(
+                "SELECT id FROM messages WHERE ts >= ? ORDER BY ts LIMIT 1", (since,)
+            ).fetchone()
+            low = row[0] if row else None
+        if until is not None:
+            row = self._reader.execute(
+                "SELECT id FROM messages WHERE ts <= ? ORDER BY ts DESC LIMIT 1", (until,)
+            ).fetchone()
+            high = row[0] if row else None
+        else:
+            high = self._reader.execute("SELECT MAX(id) FROM messages").fetchone()[0]
+        return low, high
+
+    def _search(self, keywords, author, since, until, channel_id, limit):
+        match = build_match(keywords, author)
+        with self._read_lock:
+            low, high = self._rowid_range(since, until)
+            if low is None or high is None or low > high:
+                return []
+            filters = ["m.ts BETWEEN ? AND ?"]
+            params = [since if since is not None else 0.0, until if until is not None else float('inf')]
+            if channel_id is not None:
+                filters.append("m.channel_id = ?")
+                params.append(channel_id)
+            columns = "m.id, m.ts, m.direction, m.author, m.kind, m.text"
+            if match is None:
+                sql = (
+                    f"SELECT {columns} FROM messages m WHERE m.id BETWEEN ? AND ? AND {' AND '.join(filters)}"
+                    " ORDER BY m.id DESC LIMIT ?"
+                )
+                rows = self._reader.execute(sql, [low, high, *params, limit]).fetchall()
+            else:
+                sql = (
+                    f"SELECT {columns} FROM messages_fts f JOIN messages m ON m.id = f.rowid"
+                    f" WHERE messages_fts MATCH ? AND f.rowid BETWEEN ? AND ? AND {' AND '.join(filters)}"
+                    " ORDER BY f.rowid DESC LIMIT ?"
+                )
+                rows = self._reader.execute(sql, [match, low, high, *params, limit]).fetchall()
+        return [ArchivedMessage(*row) for row in rows]
+
+    async def search(self, keywords='', author='', since=None, until=None, channel_id=None, limit=10):
+        """
+        以關鍵字（空白分隔、全部符合）、作者與時間範圍（Unix 秒）搜尋，最新的在前
+
+        指定 channel_id 時只搜尋該橋接頻道的訊息
+        """
+        return await asyncio.to_thread(self._search, keywords, author, since, until, channel_id, limit)
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'dropped': self.dropped,
+            'pruned': self.pruned,
+        }
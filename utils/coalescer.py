@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('line_discord_bridge')
+
+
+class _Buffer:
+    """單一頻道的暫存內容"""
+
+    __slots__ = ('parts', 'length', 'last_author', 'idem_key', 'timer')
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.last_author = None
+        self.idem_key = None
+        self.timer = None
+
+
+class TextCoalescer:
+    """
+    將短時間內同一頻道的多則文字合併成一則 Discord 訊息：
+    - 第一則訊息進來後最多等待 window 秒就送出（延遲上限）
+    - 合併後長度將超過 limit（Discord 2000 字元）時立即送出
+    - 同一位作者連續的訊息只保留一個 **名稱** 標頭
+    - per_author=True 時（以 webhook 身分發送）只合併同一位作者的訊息且不加標頭，換人時先送出
+
+    deliver(key, content, idem_key, author) 中的 author 只在 per_author 模式下提供，否則為 None
+    """
+
+    def __init__(self, deliver, window=0.5, limit=2000, per_author=False):
+        self.deliver = deliver
+        self.window = window
+        self.limit = limit
+        self.per_author = per_author
+        self._buffers = {}
+        self._locks = {}
+        self._tasks = set()
+        self.merged = 0
+        self.flushed = 0
+
+    def _render(self, buffer, author, text):
+        """回傳加入這則訊息時要附加的片段；author 為 LineProfile"""
+        if buffer.parts and buffer.last_author == author:
+            return f"\n{text}"
+        if self.per_author:
+            return text
+        header = f"**{author.display_name}**:\n{text}"
+        return f"\n{header}" if buffer.parts else header
+
+    async def add(self, key, author, text, idem_key=None):
+        """加入一則文字；key 為目標頻道"""
+        # 與 flush 共用同一把鎖：等待送出時，同頻道的其他訊息不會另建暫存而被覆蓋
+        async with self._lock(key):
+            buffer = self._buffers.get(key)
+            if buffer is not None and self.per_author and buffer.last_author != author:
+                await self._flush_locked(key)
+                buffer = None
+            if buffer is not None:
+                piece = self._render(buffer, author, text)
+                if buffer.length + len(piece) > self.limit:
+                    await self._flush_locked(key)
+                    buffer = None
+                else:
+                    self.merged += 1
+
+            if buffer is None:
+                buffer = _Buffer()
+                buffer.idem_key = idem_key
+                piece = self._render(buffer, author, text)
+                self._buffers[key] = buffer
+                loop = asyncio.get_running_loop()
+                buffer.timer = loop.call_later(self.window, self._schedule_flush, key, buffer)
+
+            buffer.parts.append(piece)
+            buffer.length += len(piece)
+            buffer.last_author = author
+
+    def _lock(self, key):
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    def _schedule_flush(self, key, buffer):
+        if self._buffers.get(key) is buffer:
+            # 保留參照，避免工作在完成前被回收
+            task = asyncio.create_task(self.flush(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, key):
+        """立即送出指定頻道的暫存內容（送出順序與加入順序一致）"""
+        async with self._lock(key):
+            await self._flush_locked(key)
+
+    async def _flush_locked(self, key):
+        buffer = self._buffers.pop(key, None)
+        if buffer is None:
+            return
+        if buffer.timer:
+            buffer.timer.cancel()
+        self.flushed += 1
+        try:
+            author = buffer.last_author if self.per_author else None
+            await self.deliver(key, ''.join(buffer.parts), buffer.idem_key, author)
+        except Exception as e:
+            logger.error(f"送出合併訊息時發生錯誤: {e}")
+
+    async def flush_all(self):
+        for key in list(self._buffers):
+            await self.flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'window_seconds': self.window,
+            'pending_channels': len(self._buffers),
+            'merged': self.merged,
+            'flushed': self.flushed,
+        }
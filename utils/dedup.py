@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+from pathlib import Path
+from collections import deque
+
+logger = logging.getLogger('line_discord_bridge')
+
+
+class EventDeduplicator:
+    """
+    Webhook 事件去重索引：
+    - 以 set 做 O(1) 查詢，以固定長度的 ring 決定淘汰順序
+    - 可快照到磁碟，重啟後仍能辨識重送的事件
+    """
+
+    def __init__(self, capacity=10000, snapshot_path=None):
+        self.capacity = capacity
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self._keys = set()
+        self._ring = deque()
+        self.dirty = False
+        self.duplicates = 0
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key):
+        if key in self._keys:
+            return
+        if len(self._ring) >= self.capacity:
+            self._keys.discard(self._ring.popleft())
+        self._ring.append(key)
+        self._keys.add(key)
+        self.dirty = True
+
+    def is_duplicate(self, key):
+        """key 已處理過時回傳 True 並計數"""
+        if key in self._keys:
+            self.duplicates += 1
+            return True
+        return False
+
+    # -----------------------------
+    # 快照
+    # -----------------------------
+    def load(self):
+        if not self.snapshot_path or not self.snapshot_path.exists():
+            return
+        try:
+            keys = json.loads(self.snapshot_path.read_text(encoding='utf-8'))
+        except Exception as e:
+            logger.warning(f"讀取去重快照失敗，將從空白開始: {e}")
+            return
+        for key in keys[-self.capacity:]:
+            self.add(key)
+        self.dirty = False
+        logger.info(f"已載入 {len(self._keys)} 筆已處理事件 ID")
+
+    def snapshot(self):
+        """取得目前內容的複本（在事件循環中呼叫，寫檔交給工作執行緒）"""
+        self.dirty = False
+        return list(self._ring)
+
+    def save(self, keys):
+        """原子性地寫入快照檔（先寫暫存檔再取代）"""
+        if not self.snapshot_path:
+            return
+        tmp_path = self.snapshot_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as fd:
+            json.dump(keys, fd)
+        os.replace(tmp_path, self.snapshot_path)
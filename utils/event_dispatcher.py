@@ -0,0 +1,159 @@
+import time
+import zlib
+import asyncio
+import logging
+from collections import deque
+
+from utils.metrics import DISPATCH_WAIT, EVENT_TOTAL
+
+logger = logging.getLogger('line_discord_bridge')
+
+
+def conversation_key(event):
+    """取得事件所屬對話的鍵值（群組 > 聊天室 > 使用者）"""
+    source = getattr(event, 'source', None)
+    for attr in ('group_id', 'room_id', 'user_id'):
+        value = getattr(source, attr, None)
+        if value:
+            return value
+    return ''
+
+
+class _Shard:
+    """單一分片：有界佇列 + 一個工作者，保證分片內事件依序處理"""
+
+    def __init__(self, index, max_size):
+        self.index = index
+        self.max_size = max_size
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.busy = False
+        self.busy_seconds = 0.0
+        self.processed = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self.task = None
+
+    def lag(self, now):
+        """目前最舊一筆待處理事件已等待的秒數"""
+        if not self.pending:
+            return 0.0
+        return now - self.pending[0][0]
+
+
+class ShardedDispatcher:
+    """
+    依對話分片的事件工作池：
+    - 以 group/room/user id 決定分片，同一對話的事件依序處理
+    - 不同分片各有一個工作者，彼此平行執行
+    - 每個分片的佇列有上限，滿了就拒收並記錄
+    """
+
+    def __init__(self, handler, shards=8, queue_size=200):
+        self.handler = handler
+        self.shards = [_Shard(i, queue_size) for i in range(max(1, shards))]
+        self.dropped = 0
+        self.started_at = None
+
+    def start(self):
+        """在目前事件循環上啟動所有工作者"""
+        self.started_at = time.monotonic()
+        for shard in self.shards:
+            if shard.task is None:
+                shard.task = asyncio.create_task(self._worker(shard))
+
+    async def stop(self):
+        """停止所有工作者（未處理的事件會被捨棄）"""
+        tasks = [s.task for s in self.shards if s.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for shard in self.shards:
+            shard.task = None
+
+    def shard_for(self, key):
+        return self.shards[zlib.crc32(key.encode('utf-8')) % len(self.shards)]
+
+    def has_room(self, event) -> bool:
+        """事件所屬的分片是否還能排入"""
+        shard = self.shard_for(conversation_key(event))
+        return len(shard.pending) < shard.max_size
+
+    def submit(self, event, on_done=None) -> bool:
+        """
+        將事件放入所屬分片；分片已滿時回傳 False
+
+        on_done 會在事件處理結束後（不論成功與否）呼叫
+        """
+        shard = self.shard_for(conversation_key(event))
+        if len(shard.pending) >= shard.max_size:
+            self.dropped += 1
+            logger.warning(f"事件分片 {shard.index} 已滿（{shard.max_size}），捨棄事件")
+            return False
+        shard.pending.append((time.monotonic(), event, on_done))
+        shard.wakeup.set()
+        return True
+
+    async def _worker(self, shard):
+        while True:
+            if not shard.pending:
+                shard.wakeup.clear()
+                await shard.wakeup.wait()
+                continue
+            enqueued_at, event, on_done = shard.pending.popleft()
+            started = time.monotonic()
+            shard.last_wait = started - enqueued_at
+            shard.max_wait = max(shard.max_wait, shard.last_wait)
+            DISPATCH_WAIT.observe(shard.last_wait)
+            shard.busy = True
+            try:
+                await self.handler(event)
+            except asyncio.CancelledError:
+                # 處理到一半被停止的事件不算完成
+                on_done = None
+                raise
+            except Exception as e:
+                logger.exception(f"分片 {shard.index} 處理事件時發生錯誤: {e}")
+            finally:
+                finished = time.monotonic()
+                shard.busy = False
+                shard.busy_seconds += finished - started
+                shard.processed += 1
+                EVENT_TOTAL.observe(finished - enqueued_at)
+                if on_done is not None:
+                    on_done()
+
+    # -----------------------------
+    # 統計資訊
+    # -----------------------------
+    def queue_depth(self) -> int:
+        return sum(len(s.pending) for s in self.shards)
+
+    def oldest_age(self) -> float:
+        """所有分片中最舊一筆待處理事件已等待的秒數"""
+        now = time.monotonic()
+        return max(s.lag(now) for s in self.shards)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        uptime = (now - self.started_at) if self.started_at else 0.0
+        busy_workers = sum(1 for s in self.shards if s.busy)
+        return {
+            'shards': len(self.shards),
+            'queue_depth': self.queue_depth(),
+            'busy_workers': busy_workers,
+            'utilisation': busy_workers / len(self.shards),
+            'dropped': self.dropped,
+            'per_shard': [
+                {
+                    'index': s.index,
+                    'depth': len(s.pending),
+                    'lag_seconds': round(s.lag(now), 3),
+                    'last_wait_seconds': round(s.last_wait, 3),
+                    'max_wait_seconds': round(s.max_wait, 3),
+                    'processed': s.processed,
+                    'busy_ratio': round(s.busy_seconds / uptime, 3) if uptime else 0.0,
+                }
+                for s in self.shards
+            ],
+        }
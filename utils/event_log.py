@@ -0,0 +1,321 @@
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import deque
+from pathlib import Path
+
+from utils.line_events import loads, dumps, build_events
+
+logger = logging.getLogger('line_discord_bridge')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT UNIQUE,
+    body BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_created_at ON events (created_at);
+CREATE TABLE IF NOT EXISTS cursors (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+# 原子地「沒看過這個事件 ID 才寫入」：去重鍵與串流項目同時成立或同時不成立
+_REDIS_APPEND_SCRIPT = """
+if redis.call('SET', KEYS[1], '1', 'NX', 'EX', ARGV[2]) then
+    return redis.call('XADD', KEYS[2], '*', 'data', ARGV[1])
+end
+return false
+"""
+
+
+def event_key(data):
+    """事件日誌的去重鍵：優先使用 webhookEventId，舊格式事件則退回 message id"""
+    event_id = data.get('webhookEventId')
+    if event_id:
+        return event_id
+    message_id = (data.get('message') or {}).get('id')
+    return f"message:{message_id}" if message_id else None
+
+
+class SqliteEventLog:
+    """
+    以 SQLite（WAL）實作的共用事件日誌：
+    - 多個 ingress 行程可同時寫入同一個檔案（需位於同一台主機的共用磁碟）
+    - 以事件 ID 的唯一索引跨副本去重，重送的事件只會寫入一次
+    - 消費者以 seq 依序讀取，並把讀取位置存在同一個檔案中
+    """
+
+    def __init__(self, path, retention_seconds=24 * 3600):
+        self.path = Path(path)
+        self.retention_seconds = retention_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # timeout：其他行程正在寫入時最多等待的秒數
+        self._conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -----------------------------
+    # 同步操作（於工作執行緒中執行）
+    # -----------------------------
+    def _append(self, events):
+        now = time.time()
+        rows = [(event_key(data), dumps(data), now) for data in events]
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO events (event_id, body, created_at) VALUES (?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def _read(self, after, limit):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, body FROM events WHERE seq > ? ORDER BY seq LIMIT ?", (after or 0, limit)
+            ).fetchall()
+
+    def _load_cursor(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT seq FROM cursors WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _commit(self, name, seq):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO cursors (name, seq) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET seq = excluded.seq",
+                (name, seq),
+            )
+
+    def _trim(self):
+        """刪除超過保存期限、且所有消費者都已處理過的事件"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(seq) FROM cursors").fetchone()
+            if row[0] is None:
+                return 0
+            return self._conn.execute(
+                "DELETE FROM events WHERE created_at < ? AND seq <= ?", (cutoff, row[0])
+            ).rowcount
+
+    # -----------------------------
+    # 非同步介面
+    # -----------------------------
+    async def append(self, events):
+        """寫入一批事件（dict），回傳實際新增的筆數（其餘為重複）"""
+        if not events:
+            return 0
+        return await asyncio.to_thread(self._append, events)
+
+    async def read(self, after, limit, timeout=0.0):
+        """
+        讀取 after 之後的最多 limit 筆 (seq, body)
+
+        目前沒有新事件時每隔一小段時間重查一次，最多等待 timeout 秒
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            rows = await asyncio.to_thread(self._read, after, limit)
+            remaining = deadline - time.monotonic()
+            if rows or remaining <= 0:
+                return rows
+            await asyncio.sleep(min(0.05, remaining))
+
+    async def load_cursor(self, name):
+        return await asyncio.to_thread(self._load_cursor, name)
+
+    async def commit(self, name, seq):
+        await asyncio.to_thread(self._commit, name, seq)
+
+    async def trim(self):
+        return await asyncio.to_thread(self._trim)
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+
+class RedisEventLog:
+    """
+    以 Redis Stream 實作的共用事件日誌（需安裝 redis 套件），適合 ingress 分散在多台主機時使用：
+    - 以 SET NX 記錄事件 ID 並設定保存期限，與 XADD 在同一個腳本中原子完成
+    - 讀取位置為串流項目 ID，存在另一個 key 中
+    """
+
+    def __init__(self, url, stream='line_events', retention_seconds=24 * 3600):
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("使用 redis:// 事件日誌需要安裝 redis 套件（pip install redis）")
+        self.stream = stream
+        self.retention_seconds = retention_seconds
+        self._redis = aioredis.from_url(url)
+        self._append_script = self._redis.register_script(_REDIS_APPEND_SCRIPT)
+
+    async def close(self):
+        await self._redis.close()
+
+    async def append(self, events):
+        added = 0
+        ttl = int(self.retention_seconds)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for data in events:
+                key = event_key(data)
+                body = dumps(data)
+                if key:
+                    await self._append_script(keys=[f"{self.stream}:seen:{key}", self.stream], args=[body, ttl],
+                                              client=pipe)
+                else:
+                    pipe.xadd(self.stream, {'data': body})
+            results = await pipe.execute()
+        for result in results:
+            if result:
+                added += 1
+        return added
+
+    async def read(self, after, limit, timeout=0.0):
+        response = await self._redis.xread(
+            {self.stream: after or '0-0'}, count=limit, block=int(timeout * 1000) or None
+        )
+        rows = []
+        for _, items in response or ():
+            for entry_id, fields in items:
+                rows.append((entry_id.decode('ascii'), fields[b'data']))
+        return rows
+
+    async def load_cursor(self, name):
+        value = await self._redis.get(f"{self.stream}:cursor:{name}")
+        return value.decode('ascii') if value else '0-0'
+
+    async def commit(self, name, seq):
+        await self._redis.set(f"{self.stream}:cursor:{name}", seq)
+
+    async def trim(self):
+        # 串流項目 ID 的前半段是毫秒時間戳，直接以保存期限換算最小 ID
+        min_id = int((time.time() - self.retention_seconds) * 1000)
+        return await self._redis.xtrim(self.stream, minid=min_id, approximate=True)
+
+
+def open_event_log(url, retention_seconds=24 * 3600):
+    """依網址建立事件日誌：sqlite:///相對路徑、sqlite:////絕對路徑，或 redis://主機:埠/資料庫"""
+    if url.startswith('redis://') or url.startswith('rediss://'):
+        return RedisEventLog(url, retention_seconds=retention_seconds)
+    if url.startswith('sqlite:///'):
+        return SqliteEventLog(url[len('sqlite:///'):], retention_seconds=retention_seconds)
+    raise ValueError(f"不支援的事件日誌網址: {url}")
+
+
+class EventLogConsumer:
+    """
+    從事件日誌依序讀取事件並交給工作池：
+    - 工作池分片已滿時暫停讀取（背壓），不會捨棄事件
+    - 某筆事件與它之前的所有事件都處理完後才提交讀取位置，重啟後從該位置繼續（at-least-once）
+    """
+
+    def __init__(self, event_log, dispatcher, name='gateway', batch=200, poll_interval=0.2,
+                 commit_interval=1.0, trim_interval=300.0, lightweight=False):
+        self.event_log = event_log
+        self.dispatcher = dispatcher
+        self.name = name
+        self.batch = batch
+        self.poll_interval = poll_interval
+        self.commit_interval = commit_interval
+        self.trim_interval = trim_interval
+        self.lightweight = lightweight
+        self.read_position = None
+        self.committed = None
+        self._completed = None
+        self._last_commit = 0.0
+        self._inflight = deque()
+        self._done = set()
+        self.consumed = 0
+        self.backpressure_waits = 0
+        self.malformed = 0
+
+    async def run(self):
+        self.read_position = self.committed = self._completed = await self.event_log.load_cursor(self.name)
+        logger.info(f"事件日誌消費者 {self.name} 從位置 {self.committed} 開始讀取")
+        last_trim = time.monotonic()
+        try:
+            while True:
+                rows = await self.event_log.read(self.read_position, self.batch, timeout=self.poll_interval)
+                for seq, body in rows:
+                    await self._submit(seq, body)
+                    self.read_position = seq
+                await self._maybe_commit()
+                now = time.monotonic()
+                if now - last_trim >= self.trim_interval:
+                    last_trim = now
+                    try:
+                        await self.event_log.trim()
+                    except Exception as e:
+                        logger.warning(f"清理事件日誌時發生錯誤: {e}")
+        finally:
+            await self._commit()
+
+    async def _submit(self, seq, body):
+        try:
+            events = build_events({'events': [loads(body)]}, lightweight=self.lightweight)
+        except Exception as e:
+            self.malformed += 1
+            logger.error(f"事件日誌中第 {seq} 筆事件無法解析，略過: {e}")
+            events = []
+        self._inflight.append(seq)
+        if not events:
+            self._finish(seq)
+            return
+        event = events[0]
+        while not self.dispatcher.has_room(event):
+            self.backpressure_waits += 1
+            await asyncio.sleep(self.poll_interval)
+            await self._maybe_commit()
+        self.consumed += 1
+        self.dispatcher.submit(event, on_done=lambda: self._finish(seq))
+
+    def _finish(self, seq):
+        """記錄處理完成，並把可提交的位置往前推到連續完成的最後一筆"""
+        self._done.add(seq)
+        while self._inflight and self._inflight[0] in self._done:
+            self._completed = self._inflight.popleft()
+            self._done.discard(self._completed)
+
+    async def _maybe_commit(self):
+        now = time.monotonic()
+        if now - self._last_commit >= self.commit_interval:
+            self._last_commit = now
+            await self._commit()
+
+    async def _commit(self):
+        if self._completed == self.committed:
+            return
+        try:
+            await self.event_log.commit(self.name, self._completed)
+            self.committed = self._completed
+        except Exception as e:
+            logger.warning(f"提交事件日誌位置時發生錯誤: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'read_position': self.read_position,
+            'committed': self.committed,
+            'inflight': len(self._inflight),
+            'consumed': self.consumed,
+            'backpressure_waits': self.backpressure_waits,
+            'malformed': self.malformed,
+        }
@@ -1,21 +1,293 @@
+import io
 import os
+import heapq
+import asyncio
 import time
 import uuid
+import hashlib
 import logging
+import tempfile
+import threading
+from pathlib import Path
 from config import TEMP_DIR
 
 logger = logging.getLogger('line_discord_bridge')
 
-def cleanup_temp_files():
-    """清理超過1小時的暫存圖片檔案"""
-    try:
-        for file in TEMP_DIR.glob("*"):
-            if (time.time() - file.stat().st_mtime) > 3600:
-                file.unlink()
-                logger.info(f"已刪除過期臨時文件: {file}")
-    except Exception as e:
-        logger.error(f"清理臨時文件時發生錯誤: {e}")
-
-def generate_temp_file_path(extension):
+def generate_temp_file_path(extension, directory=TEMP_DIR):
     """生成臨時檔案路徑"""
-    return TEMP_DIR / f"{uuid.uuid4()}{extension}"
\ No newline at end of file
+    return Path(directory) / f"{uuid.uuid4()}{extension}"
+
+class TempQuotaExceeded(Exception):
+    """暫存空間已滿且在等待時間內沒有釋出"""
+
+
+class TempFileManager:
+    """
+    暫存檔管理：
+    - 檔案路徑由 generate_temp_file_path 產生，並記錄擁有者與期限（以 min-heap 依期限排序）
+    - 使用完畢（release）立即刪除；忘記釋放的檔案在期限到時由背景任務刪除
+    - 所有暫存檔合計有硬性上限，空間不足時新的下載會等待（backpressure），逾時則拋出 TempQuotaExceeded
+    - 寫入前先以 wait_for_room 預留空間，寫入後再 unreserve，同時進行的下載合計也不會超過上限
+    - 啟動時只做一次孤兒檔案清理，之後不再掃描整個資料夾
+    """
+
+    def __init__(self, temp_dir=TEMP_DIR, quota_bytes=1024 * 1024 * 1024, ttl=3600, wait_timeout=30):
+        self.temp_dir = Path(temp_dir)
+        self.quota_bytes = quota_bytes
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._files = {}  # path -> [owner, deadline, size]
+        self._heap = []  # (deadline, path)
+        self._used = 0  # 已寫入加上預留中的位元組數
+        self._reserved = 0
+        self._loop = None
+        self._room = None
+        self._wakeup = None
+        self.expired = 0
+        self.waits = 0
+        self.rejected = 0
+
+    def reconcile(self):
+        """刪除上次執行留下的孤兒暫存檔（只在啟動時呼叫一次）"""
+        removed = 0
+        for file in self.temp_dir.iterdir():
+            if file.is_file() and file not in self._files:
+                try:
+                    file.unlink()
+                    removed += 1
+                except OSError as e:
+                    logger.error(f"刪除孤兒暫存檔 {file} 時發生錯誤: {e}")
+        if removed:
+            logger.info(f"已刪除 {removed} 個上次執行留下的暫存檔")
+
+    # -----------------------------
+    # 檔案登記（可在工作執行緒中呼叫）
+    # -----------------------------
+    def new_path(self, extension='', owner=None, ttl=None):
+        """產生新的暫存檔路徑並登記擁有者與期限"""
+        path = generate_temp_file_path(extension, self.temp_dir)
+        deadline = time.monotonic() + (ttl or self.ttl)
+        with self._lock:
+            self._files[path] = [owner, deadline, 0]
+            heapq.heappush(self._heap, (deadline, str(path)))
+            earliest = self._heap[0][0] == deadline
+        if earliest:
+            self._notify(self._wakeup)
+        return path
+
+    def charge(self, path, nbytes):
+        """記錄寫入暫存檔的位元組數（不等待，空間由 wait_for_room 事先預留）"""
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is not None:
+                entry[2] += nbytes
+                self._used += nbytes
+
+    def release(self, path):
+        """檔案已使用完畢：立即刪除並釋出空間"""
+        with self._lock:
+            entry = self._files.pop(path, None)
+            if entry is not None:
+                self._used -= entry[2]
+        Path(path).unlink(missing_ok=True)
+        if entry is not None and entry[2]:
+            self._notify(self._room)
+
+    def release_owner(self, owner):
+        """刪除某個擁有者的所有暫存檔"""
+        with self._lock:
+            paths = [path for path, entry in self._files.items() if entry[0] == owner]
+        for path in paths:
+            self.release(path)
+
+    def _notify(self, event):
+        if self._loop is not None and event is not None:
+            self._loop.call_soon_threadsafe(event.set)
+
+    # -----------------------------
+    # 事件循環
+    # -----------------------------
+    async def wait_for_room(self, nbytes):
+        """
+        等待暫存空間足夠寫入 nbytes 並預留下來；逾時拋出 TempQuotaExceeded
+
+        寫入完成（已 charge）或失敗後都要呼叫 unreserve(nbytes)
+        """
+        if nbytes > self.quota_bytes:
+            self.rejected += 1
+            raise TempQuotaExceeded(f"需要 {nbytes} bytes，超過暫存空間上限 {self.quota_bytes} bytes")
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            # 檢查與預留在同一把鎖內完成，其他下載不會在兩者之間插入
+            with self._lock:
+                if self._used + nbytes <= self.quota_bytes:
+                    self._used += nbytes
+                    self._reserved += nbytes
+                    return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._room is None:
+                self.rejected += 1
+                raise TempQuotaExceeded(f"暫存空間已滿（{self._used}/{self.quota_bytes} bytes）")
+            if not waited:
+                waited = True
+                self.waits += 1
+            self._room.clear()
+            try:
+                await asyncio.wait_for(self._room.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def unreserve(self, nbytes):
+        """釋出 wait_for_room 預留的空間"""
+        with self._lock:
+            self._used -= nbytes
+            self._reserved -= nbytes
+        self._notify(self._room)
+
+    async def run(self):
+        """依期限刪除逾期未釋放的暫存檔；只在最近的期限到達或有更早的期限加入時醒來"""
+        self._loop = asyncio.get_running_loop()
+        self._room = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        while True:
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                while self._heap and self._heap[0][0] <= now:
+                    deadline, path = heapq.heappop(self._heap)
+                    entry = self._files.get(Path(path))
+                    # 已釋放或期限已延後的項目直接略過
+                    if entry is not None and entry[1] == deadline:
+                        expired.append((Path(path), entry[0]))
+                timeout = self._heap[0][0] - now if self._heap else None
+            for path, owner in expired:
+                self.expired += 1
+                logger.warning(f"暫存檔逾期未釋放，已刪除: {path}（擁有者: {owner}）")
+                self.release(path)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            files = len(self._files)
+            used = self._used
+            reserved = self._reserved
+        return {
+            'files': files,
+            'used_bytes': used,
+            'reserved_bytes': reserved,
+            'quota_bytes': self.quota_bytes,
+            'expired': self.expired,
+            'waits': self.waits,
+            'rejected': self.rejected,
+        }
+
+
+class MediaTooLargeError(Exception):
+    """媒體超過允許上傳的大小"""
+
+    def __init__(self, size, limit):
+        super().__init__(f"媒體大小 {size} bytes 超過上限 {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+class SpooledMedia:
+    """
+    先存在記憶體、超過門檻才寫入磁碟的媒體緩衝
+
+    溢出時使用匿名暫存檔（建立後即自動 unlink），不會在 TEMP_DIR 留下檔案；
+    提供 store（TempFileManager）時改寫入由其管理的暫存檔，計入暫存空間上限，close() 時立即刪除。
+    digest=True 時會在寫入的同時計算 SHA-256
+    """
+
+    def __init__(self, threshold, digest=False, store=None, owner=None):
+        self.threshold = threshold
+        self.size = 0
+        self.fileobj = io.BytesIO()
+        self.spilled = False
+        self.store = store
+        self.owner = owner
+        self.path = None
+        self._hash = hashlib.sha256() if digest else None
+
+    @property
+    def digest(self):
+        """內容的 SHA-256（十六進位），未啟用時為 None"""
+        return self._hash.hexdigest() if self._hash is not None else None
+
+    def _open_disk_file(self):
+        if self.store is None:
+            return tempfile.TemporaryFile(dir=TEMP_DIR)
+        self.path = self.store.new_path('.part', owner=self.owner)
+        return open(self.path, 'w+b')
+
+    def write(self, data):
+        if not self.spilled and self.size + len(data) > self.threshold:
+            disk_file = self._open_disk_file()
+            with self.fileobj.getbuffer() as view:
+                disk_file.write(view)
+            if self.path is not None:
+                self.store.charge(self.path, self.size)
+            self.fileobj.close()
+            self.fileobj = disk_file
+            self.spilled = True
+        self.fileobj.write(data)
+        self.size += len(data)
+        if self.path is not None:
+            self.store.charge(self.path, len(data))
+        if self._hash is not None:
+            self._hash.update(data)
+
+    def rewind(self):
+        self.fileobj.seek(0)
+        return self.fileobj
+
+    def close(self):
+        try:
+            self.fileobj.close()
+        except Exception:
+            pass
+        if self.path is not None:
+            self.store.release(self.path)
+            self.path = None
+
+
+async def spool_stream(chunks, threshold, max_bytes=None, digest=False, store=None, owner=None):
+    """
+    將非同步的內容串流讀入 SpooledMedia
+
+    記憶體內的寫入直接在事件循環中進行，溢出到磁碟後改由工作執行緒寫入；
+    若設定 max_bytes，下載量一超過就中止並拋出 MediaTooLargeError；
+    提供 store 時，寫入磁碟前會先等待並預留暫存空間（backpressure）
+    """
+    media = SpooledMedia(threshold, digest=digest, store=store, owner=owner)
+    try:
+        async for chunk in chunks:
+            if media.spilled or media.size + len(chunk) > threshold:
+                if store is None:
+                    await asyncio.to_thread(media.write, chunk)
+                else:
+                    needed = len(chunk) if media.spilled else media.size + len(chunk)
+                    await store.wait_for_room(needed)
+                    try:
+                        await asyncio.to_thread(media.write, chunk)
+                    finally:
+                        # 寫入後已計入檔案大小；失敗時則是把預留的空間還回去
+                        store.unreserve(needed)
+            else:
+                media.write(chunk)
+            if max_bytes is not None and media.size > max_bytes:
+                raise MediaTooLargeError(media.size, max_bytes)
+    except Exception:
+        media.close()
+        raise
+    media.rewind()
+    return media
@@ -0,0 +1,207 @@
+import uuid
+import asyncio
+import logging
+import aiohttp
+
+from utils.metrics import RATE_LIMITED
+
+logger = logging.getLogger('line_discord_bridge')
+
+# 這些狀態碼視為暫時性錯誤，會以退避方式重試
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+# push 經由發送排程送出，429 交給排程暫停權杖桶後重試，這裡只重試伺服器錯誤
+_PUSH_RETRY_STATUSES = {500, 502, 503, 504}
+
+
+def new_retry_key():
+    """push 的重送鍵（X-Line-Retry-Key）；同一次邏輯上的 push 在所有重試中都要使用同一個鍵"""
+    return str(uuid.uuid4())
+
+
+class LineApiError(Exception):
+    """Line API 回傳錯誤（屬性名稱與 linebot.exceptions.LineBotApiError 相同）"""
+
+    def __init__(self, status_code, headers=None, message=''):
+        super().__init__(f"Line API 錯誤 {status_code}: {message}")
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.message = message
+
+
+class LineContent:
+    """訊息內容的串流回應；使用完畢必須呼叫 close()（或以 async with 使用）"""
+
+    def __init__(self, response):
+        self.response = response
+        self.headers = response.headers
+
+    @property
+    def content_type(self):
+        return self.headers.get('Content-Type')
+
+    @property
+    def content_length(self):
+        try:
+            return int(self.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            return None
+
+    def iter_chunked(self, chunk_size):
+        return self.response.content.iter_chunked(chunk_size)
+
+    def close(self):
+        self.response.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+class AsyncLineClient:
+    """
+    非同步 Line Messaging API 用戶端：
+    - 共用一個 keep-alive 連線池的 aiohttp session
+    - 每個請求都有逾時，暫時性錯誤（429/5xx/連線錯誤）以指數退避重試
+    - push 帶 X-Line-Retry-Key 重試，Line 已接受過的請求不會重複發送
+    - 以 semaphore 限制同時進行的請求數
+    """
+
+    def __init__(self, access_token, api_base='https://api.line.me', data_base='https://api-data.line.me',
+                 timeout=10, max_retries=3, backoff=0.5, concurrency=16):
+        self.access_token = access_token
+        self.api_base = api_base.rstrip('/')
+        self.data_base = data_base.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.concurrency = concurrency
+        self._session = None
+        self._semaphore = None
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    @property
+    def session(self):
+        """第一次使用時才建立 session（必須在事件循環中）"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'Authorization': f"Bearer {self.access_token}"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def _request(self, method, url, json=None, stream=False, headers=None, retry_statuses=_RETRY_STATUSES):
+        """
+        發送請求並回傳 JSON（stream=True 時回傳尚未讀取內容的 response）
+
+        失敗時拋出 LineApiError 或 aiohttp 的連線錯誤
+        """
+        session = self.session
+        attempt = 0
+        while True:
+            self.requests += 1
+            try:
+                async with self._semaphore:
+                    kwargs = {'headers': headers} if headers else {}
+                    if stream:
+                        # 下載大檔不限總時間，只限制連線與每次讀取的等待時間
+                        kwargs['timeout'] = aiohttp.ClientTimeout(
+                            total=None, sock_connect=self.timeout, sock_read=self.timeout
+                        )
+                    response = await session.request(method, url, json=json, **kwargs)
+                    if response.status < 400:
+                        if stream:
+                            return response
+                        async with response:
+                            if response.content_length == 0 or response.status == 204:
+                                return {}
+                            return await response.json(content_type=None)
+                    async with response:
+                        error = LineApiError(response.status, dict(response.headers), await response.text())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+                retryable = True
+            else:
+                retryable = error.status_code in retry_statuses
+                if error.status_code == 429:
+                    RATE_LIMITED.labels('line').inc()
+
+            if not retryable or attempt >= self.max_retries:
+                self.failures += 1
+                raise error
+            delay = self.backoff * (2 ** attempt)
+            if isinstance(error, LineApiError) and error.status_code == 429:
+                try:
+                    delay = max(delay, float(error.headers.get('Retry-After', delay)))
+                except (TypeError, ValueError):
+                    pass
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"Line API 請求失敗（{error}），{delay:.1f} 秒後第 {attempt} 次重試")
+            await asyncio.sleep(delay)
+
+    # -----------------------------
+    # API
+    # -----------------------------
+    async def get_bot_info(self):
+        return await self._request('GET', f"{self.api_base}/v2/bot/info")
+
+    async def get_profile(self, user_id):
+        return await self._request('GET', f"{self.api_base}/v2/bot/profile/{user_id}")
+
+    async def get_group_member_profile(self, group_id, user_id):
+        return await self._request('GET', f"{self.api_base}/v2/bot/group/{group_id}/member/{user_id}")
+
+    async def get_room_member_profile(self, room_id, user_id):
+        return await self._request('GET', f"{self.api_base}/v2/bot/room/{room_id}/member/{user_id}")
+
+    async def get_group_member_ids(self, group_id, start=None):
+        url = f"{self.api_base}/v2/bot/group/{group_id}/members/ids"
+        if start:
+            url = f"{url}?start={start}"
+        return await self._request('GET', url)
+
+    async def push_message(self, to, messages, retry_key=None):
+        """
+        messages 為 Line 訊息物件（dict）的列表，一次最多 5 則
+
+        呼叫端會在外層重試（例如發送排程遇到 429）時，應先以 new_retry_key() 產生鍵並每次傳入同一個；
+        Line 回應 409 代表這個鍵的請求先前已被接受，視為成功
+        """
+        try:
+            return await self._request(
+                'POST', f"{self.api_base}/v2/bot/message/push",
+                json={'to': to, 'messages': messages},
+                headers={'X-Line-Retry-Key': retry_key or new_retry_key()},
+                retry_statuses=_PUSH_RETRY_STATUSES,
+            )
+        except LineApiError as e:
+            if e.status_code == 409:
+                logger.info("Line push 先前已被接受（重送鍵相同），略過重複發送")
+                return {}
+            raise
+
+    async def get_message_content(self, message_id):
+        """取得訊息內容的串流回應（LineContent）"""
+        response = await self._request(
+            'GET', f"{self.data_base}/v2/bot/message/{message_id}/content", stream=True
+        )
+        return LineContent(response)
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'failures': self.failures,
+            'concurrency': self.concurrency,
+        }
@@ -0,0 +1,95 @@
+import hmac
+import base64
+import hashlib
+
+from linebot.models import MessageEvent
+
+try:
+    import orjson
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(data) -> bytes:
+        return orjson.dumps(data)
+except ImportError:  # orjson 為可選依賴
+    import json
+
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(data) -> bytes:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def verify_signature(channel_secret: bytes, body: bytes, signature: str) -> bool:
+    """直接對原始 bytes 驗證 X-Line-Signature，不需先解碼成字串"""
+    digest = hmac.new(channel_secret, body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest), signature.encode('utf-8'))
+
+
+class SourceView:
+    """事件來源的輕量檢視（屬性名稱與 SDK 模型一致）"""
+
+    __slots__ = ('type', 'user_id', 'group_id', 'room_id')
+
+    def __init__(self, data):
+        self.type = data.get('type')
+        self.user_id = data.get('userId')
+        self.group_id = data.get('groupId')
+        self.room_id = data.get('roomId')
+
+
+class MessageView:
+    """訊息內容的輕量檢視，只保留轉發用得到的欄位"""
+
+    __slots__ = ('id', 'type', 'text', 'sticker_id', 'package_id', 'keywords', 'file_name', 'file_size')
+
+    def __init__(self, data):
+        self.id = data.get('id')
+        self.type = data.get('type')
+        self.text = data.get('text')
+        self.sticker_id = data.get('stickerId')
+        self.package_id = data.get('packageId')
+        self.keywords = data.get('keywords')
+        self.file_name = data.get('fileName')
+        self.file_size = data.get('fileSize')
+
+
+class DeliveryContextView:
+    __slots__ = ('is_redelivery',)
+
+    def __init__(self, data):
+        self.is_redelivery = bool(data.get('isRedelivery', False))
+
+
+class MessageEventView:
+    """MessageEvent 的輕量檢視，直接包裝解析後的 dict，不建立完整的 SDK 模型樹"""
+
+    __slots__ = ('type', 'timestamp', 'webhook_event_id', 'delivery_context', 'source', 'message', 'reply_token')
+
+    def __init__(self, data):
+        self.type = 'message'
+        self.timestamp = data.get('timestamp')
+        self.webhook_event_id = data.get('webhookEventId')
+        self.delivery_context = DeliveryContextView(data.get('deliveryContext') or {})
+        self.source = SourceView(data.get('source') or {})
+        self.message = MessageView(data.get('message') or {})
+        self.reply_token = data.get('replyToken')
+
+
+def build_events(payload, lightweight=False):
+    """
+    從已解析的 webhook payload 建立訊息事件
+
+    只處理 message 類型；lightweight=True 時回傳 MessageEventView，否則回傳 SDK 的 MessageEvent
+    """
+    events = []
+    for data in payload.get('events', ()):
+        if data.get('type') != 'message':
+            continue
+        if lightweight:
+            events.append(MessageEventView(data))
+        else:
+            events.append(MessageEvent.new_from_json_dict(data))
+    return events
@@ -1,46 +1,107 @@
+import json
+import queue
+import atexit
 import logging
+import logging.handlers
+import itertools
 import pytz
 from datetime import datetime
-from config import TIMEZONE_NAME
+from config import TIMEZONE_NAME, LOG_FORMAT, LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_SAMPLE_EVERY
 
 class TimezoneFormatter(logging.Formatter):
     """
     自訂日誌格式器，以指定時區顯示時間戳
-    
+
     時間格式化範例: 2025-09-15 23:22:45 +08:00(asia/taipei)
-    使用 pytz 時區庫，讓日誌記錄使用可識別的當地時間
+    使用 pytz 時區庫，讓日誌記錄使用可識別的當地時間；
+    同一秒內的記錄共用快取的時間字串，不必每筆都重新 strftime
     """
     def __init__(self, fmt=None, datefmt=None, timezone=None):
         super().__init__(fmt, datefmt)
         self.timezone = timezone or pytz.utc
+        self._cached_second = None
+        self._cached_time = ''
 
     def formatTime(self, record, datefmt=None):
-        dt = datetime.fromtimestamp(record.created, self.timezone)
-        tz_offset = dt.strftime('%z')
-        tz_offset_fmt = f"{tz_offset[:3]}:{tz_offset[3:]}" if tz_offset else ''
-        time_str = dt.strftime('%Y-%m-%d %H:%M:%S')
-        return f"{time_str} {tz_offset_fmt}({self.timezone.zone.lower()})"
+        second = int(record.created)
+        if second != self._cached_second:
+            dt = datetime.fromtimestamp(second, self.timezone)
+            tz_offset = dt.strftime('%z')
+            tz_offset_fmt = f"{tz_offset[:3]}:{tz_offset[3:]}" if tz_offset else ''
+            time_str = dt.strftime('%Y-%m-%d %H:%M:%S')
+            self._cached_time = f"{time_str} {tz_offset_fmt}({self.timezone.zone.lower()})"
+            self._cached_second = second
+        return self._cached_time
+
+class JsonFormatter(TimezoneFormatter):
+    """每筆記錄輸出一行 JSON，方便交給日誌收集系統"""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+_payload_counter = itertools.count()
+
+def should_log_payload():
+    """內容日誌抽樣：每 LOG_PAYLOAD_SAMPLE_EVERY 筆記錄一筆（0 表示不記錄）"""
+    if LOG_PAYLOAD_SAMPLE_EVERY <= 0:
+        return False
+    return next(_payload_counter) % LOG_PAYLOAD_SAMPLE_EVERY == 0
+
+def truncate_payload(payload, limit=None):
+    """截斷過長的訊息內容或 webhook 內容，避免日誌成為請求路徑上的主要成本"""
+    limit = LOG_PAYLOAD_MAX_CHARS if limit is None else limit
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload[:limit * 4].decode('utf-8', errors='replace')
+    else:
+        payload = str(payload)
+    if len(payload) <= limit:
+        return payload
+    return f"{payload[:limit]}…（共 {len(payload)} 字元）"
 
 def setup_logging():
-    """設置日誌系統"""
+    """
+    設置日誌系統
+
+    記錄時只把記錄放進佇列，格式化與輸出由 QueueListener 的背景執行緒處理
+    """
     # 使用全域設定的時區
     custom_timezone = pytz.timezone(TIMEZONE_NAME)
-    
+
     # 創建格式器
-    formatter = TimezoneFormatter(
-        fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        timezone=custom_timezone
-    )
-    
-    # 配置日誌
-    logging.basicConfig(level=logging.INFO)
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter(timezone=custom_timezone)
+    else:
+        formatter = TimezoneFormatter(
+            fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            timezone=custom_timezone
+        )
+
+    # 實際輸出的處理器交給背景執行緒
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    # 配置日誌：根記錄器只保留 QueueHandler
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(logging.INFO)
+    listener.start()
+    atexit.register(listener.stop)
     logger = logging.getLogger('line_discord_bridge')
-    
-    # 設置所有處理器的格式
-    for handler in logging.getLogger().handlers:
-        handler.setFormatter(formatter)
-    
+
     # 記錄目前使用的時區設定
     logger.info(f"日誌系統已設定使用時區: {TIMEZONE_NAME}")
-    
-    return logger
\ No newline at end of file
+
+    return logger
@@ -0,0 +1,113 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+from utils.metrics import LOOP_LAG, LOOP_STALLS
+
+logger = logging.getLogger('line_discord_bridge')
+
+
+class LoopWatchdog:
+    """
+    事件循環延遲監測（成本只有每 interval 秒一次的心跳與每 threshold/2 秒一次的執行緒檢查，可常駐開啟）：
+    - 循環內的心跳協程每次 sleep interval 秒，實際醒來比預期晚的時間就是延遲，記入直方圖
+    - 另一個取樣執行緒檢查心跳是否逾期；逾期超過 threshold 秒時，以 sys._current_frames()
+      擷取循環執行緒當下的堆疊，也就是正在卡住循環的程式碼
+    - 每次卡住只擷取一次堆疊，記錄到日誌並保留最近幾筆供 /stats 查看；循環恢復後補記總卡住時間
+
+    卡住的程式碼若在 C 擴充中持有 GIL，取樣執行緒要等它釋放後才能擷取，此時堆疊會落在呼叫該擴充的那一行
+    """
+
+    def __init__(self, interval=0.1, threshold=0.25, stack_depth=20, max_reports=20):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_depth = stack_depth
+        self.reports = deque(maxlen=max_reports)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._deadline = None
+        self._beat = 0
+        self._captured_beat = None
+        self._current_report = None
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """在事件循環中呼叫：啟動心跳協程與取樣執行緒"""
+        self._loop_thread_id = threading.get_ident()
+        self._deadline = time.monotonic() + self.interval
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._sample, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"事件循環監測已啟動（門檻 {self.threshold * 1000:.0f} ms）")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    # -----------------------------
+    # 循環內：量測延遲
+    # -----------------------------
+    async def _heartbeat(self):
+        while True:
+            deadline = time.monotonic() + self.interval
+            self._deadline = deadline
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - deadline)
+            self._beat += 1
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            report = self._current_report
+            if report is not None:
+                # 取樣執行緒已記錄這次卡住，補上實際的總延遲
+                self._current_report = None
+                report['lag_ms'] = round(lag * 1000, 1)
+                logger.warning(f"事件循環已恢復，這次共延遲 {lag * 1000:.0f} ms")
+
+    # -----------------------------
+    # 取樣執行緒：逾期時擷取循環執行緒的堆疊
+    # -----------------------------
+    def _sample(self):
+        # 每次喚醒都要取得 GIL，檢查頻率只需足以在門檻的一半時間內發現卡住
+        check_interval = self.threshold / 2
+        while not self._stop.wait(check_interval):
+            beat = self._beat
+            overdue = time.monotonic() - self._deadline
+            if overdue < self.threshold or self._captured_beat == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            frames = traceback.format_stack(frame, limit=self.stack_depth)
+            del frame
+            self._captured_beat = beat
+            self.stalls += 1
+            LOOP_STALLS.inc()
+            report = {
+                'at': time.time(),
+                'lag_ms': round(overdue * 1000, 1),
+                'frames': [line.rstrip() for line in frames],
+            }
+            self.reports.append(report)
+            self._current_report = report
+            logger.warning(
+                f"事件循環已卡住 {overdue * 1000:.0f} ms，循環執行緒目前的堆疊（最內層在最後）：\n" + ''.join(frames)
+            )
+
+    def stats(self) -> dict:
+        return {
+            'interval_ms': self.interval * 1000,
+            'threshold_ms': self.threshold * 1000,
+            'max_lag_ms': round(self.max_lag * 1000, 1),
+            'stalls': self.stalls,
+            'recent_stalls': list(self.reports),
+        }
@@ -0,0 +1,166 @@
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger('line_discord_bridge')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    digest TEXT NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    jump_url TEXT NOT NULL,
+    attachment_url TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (digest, channel_id)
+);
+CREATE INDEX IF NOT EXISTS media_last_used ON media (last_used);
+"""
+
+
+class MediaCacheEntry:
+    """已經轉傳過的媒體在 Discord 上的位置"""
+
+    __slots__ = ('digest', 'channel_id', 'message_id', 'jump_url', 'attachment_url', 'size')
+
+    def __init__(self, digest, channel_id, message_id, jump_url, attachment_url, size):
+        self.digest = digest
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.jump_url = jump_url
+        self.attachment_url = attachment_url
+        self.size = size
+
+
+class MediaCache:
+    """
+    以內容雜湊定址的媒體索引（SQLite WAL）：
+    - 記錄 (SHA-256, 頻道) → 已上傳的 Discord 訊息，同一份媒體再次轉傳到同一個頻道時改為回覆原訊息
+    - 以頻道區隔：不同橋接之間不會互相回覆或附上其他頻道的連結
+    - 筆數與所代表的媒體總量皆有上限，超過時依最近使用時間（LRU）淘汰
+    - 超過 ttl 的項目不再使用（原訊息可能已被刪除或洗版洗掉）
+    """
+
+    def __init__(self, db_path, max_entries=5000, max_bytes=2 * 1024 * 1024 * 1024, ttl=7 * 24 * 3600):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._conn.executescript(_SCHEMA)
+
+    def _migrate(self):
+        """舊版索引只以雜湊為鍵（不分頻道）；索引只是快取，直接捨棄重建"""
+        columns = self._conn.execute("PRAGMA table_info(media)").fetchall()
+        primary_key = [row[1] for row in sorted(columns, key=lambda row: row[5]) if row[5]]
+        if primary_key == ['digest']:
+            logger.info("媒體索引改為依頻道區隔，捨棄舊的索引")
+            self._conn.execute("DROP TABLE media")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -----------------------------
+    # 同步操作（於工作執行緒中執行）
+    # -----------------------------
+    def _lookup(self, digest, channel_id):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, channel_id, message_id, jump_url, attachment_url, size"
+                " FROM media WHERE digest = ? AND channel_id = ? AND created_at >= ?",
+                (digest, channel_id, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE media SET last_used = ?, hits = hits + 1 WHERE digest = ? AND channel_id = ?",
+                (now, digest, channel_id),
+            )
+        return MediaCacheEntry(*row)
+
+    def _remember(self, digest, channel_id, message_id, jump_url, attachment_url, size):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media"
+                " (digest, channel_id, message_id, jump_url, attachment_url, size, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, channel_id, message_id, jump_url, attachment_url, size, now, now),
+            )
+            self._trim(now)
+
+    def _forget(self, digest, channel_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM media WHERE digest = ? AND channel_id = ?", (digest, channel_id))
+
+    def _trim(self, now):
+        """淘汰過期項目，再依 LRU 淘汰到筆數與總量都在上限內（呼叫前需持有鎖）"""
+        self._conn.execute("DELETE FROM media WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM media WHERE rowid IN"
+            " (SELECT rowid FROM media ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        )
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM media").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for rowid, size in self._conn.execute("SELECT rowid, size FROM media ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            victims.append((rowid,))
+            total -= size
+        self._conn.executemany("DELETE FROM media WHERE rowid = ?", victims)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+
+    # -----------------------------
+    # 非同步介面
+    # -----------------------------
+    async def lookup(self, digest, channel_id):
+        """查詢已轉傳到 channel_id 的媒體，沒有時回傳 None"""
+        entry = await asyncio.to_thread(self._lookup, digest, channel_id)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.bytes_saved += entry.size
+        return entry
+
+    async def remember(self, digest, message, size):
+        """記錄媒體上傳後的 Discord 訊息（discord.Message）"""
+        attachment_url = message.attachments[0].url if message.attachments else None
+        await asyncio.to_thread(
+            self._remember, digest, message.channel.id, message.id, message.jump_url, attachment_url, size
+        )
+
+    async def forget(self, digest, channel_id):
+        await asyncio.to_thread(self._forget, digest, channel_id)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': self.count(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'bytes_saved': self.bytes_saved,
+        }
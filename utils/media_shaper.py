@@ -0,0 +1,218 @@
+import io
+import time
+import shutil
+import tempfile
+import asyncio
+import logging
+import zipfile
+import importlib.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from config import TEMP_DIR
+from utils.file_utils import SpooledMedia
+
+logger = logging.getLogger('line_discord_bridge')
+
+PILLOW_AVAILABLE = importlib.util.find_spec('PIL') is not None
+
+
+def _shrink_image(data, target_bytes, max_dimension):
+    """
+    在子行程中縮小圖片：先限制長邊，再逐步降低 JPEG 品質與尺寸直到不超過 target_bytes
+
+    回傳 (新圖片 bytes 或 None, 使用的 CPU 秒數)
+    """
+    started = time.process_time()
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        image.thumbnail((max_dimension, max_dimension))
+        quality = 85
+        while True:
+            out = io.BytesIO()
+            image.save(out, format='JPEG', quality=quality, optimize=True)
+            if out.tell() <= target_bytes:
+                return out.getvalue(), time.process_time() - started
+            if quality > 50:
+                quality -= 10
+                continue
+            width, height = image.size
+            if min(width, height) < 64:
+                return None, time.process_time() - started
+            image = image.resize((int(width * 0.75), int(height * 0.75)))
+
+
+def split_into_archive_parts(media, filename, part_size, spool_threshold, store=None):
+    """
+    將檔案打包成不壓縮的 zip 後切成多個分割檔（.zip.001、.zip.002 …），每個不超過 part_size
+
+    切割後的檔案可用 7-Zip 等工具合併解壓；於工作執行緒中執行。
+    提供 store（TempFileManager）時，壓縮檔與分割檔都計入暫存空間
+    """
+    archive_path = None
+    if store is None:
+        archive = tempfile.TemporaryFile(dir=TEMP_DIR)
+    else:
+        archive_path = store.new_path('.zip', owner=filename)
+        archive = open(archive_path, 'w+b')
+    parts = []
+    try:
+        with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            with zf.open(filename, 'w', force_zip64=True) as entry:
+                shutil.copyfileobj(media.rewind(), entry, 1024 * 1024)
+        if archive_path is not None:
+            store.charge(archive_path, archive.tell())
+
+        archive.seek(0)
+        index = 1
+        while True:
+            chunk = archive.read(part_size)
+            if not chunk:
+                break
+            part = SpooledMedia(spool_threshold, store=store, owner=filename)
+            part.write(chunk)
+            part.rewind()
+            parts.append((f"{filename}.zip.{index:03d}", part))
+            index += 1
+    except Exception:
+        for _, part in parts:
+            part.close()
+        raise
+    finally:
+        archive.close()
+        if archive_path is not None:
+            store.release(archive_path)
+    return parts
+
+
+class MediaShaper:
+    """
+    媒體整形（縮圖/分割）：
+    - 圖片縮小在 ProcessPoolExecutor 中執行，不佔用事件循環與 Webhook
+    - 以 semaphore 限制同時進行的工作數，每個工作有逾時
+    - 圖片要整份讀入記憶體再傳給子行程，超過 max_input_bytes 的不縮圖
+    - 每分鐘的子行程 CPU 秒數有預算，用完就暫停縮圖（改用原本的處理方式）；逾時的工作以整段逾時計入
+    """
+
+    def __init__(self, workers=2, concurrency=2, timeout=30, cpu_budget_per_minute=30,
+                 image_target_bytes=8 * 1024 * 1024, image_max_dimension=4096,
+                 max_input_bytes=32 * 1024 * 1024):
+        self.workers = workers
+        self.timeout = timeout
+        self.cpu_budget_per_minute = cpu_budget_per_minute
+        self.image_target_bytes = image_target_bytes
+        self.image_max_dimension = image_max_dimension
+        self.max_input_bytes = max_input_bytes
+        self._concurrency = concurrency
+        self._semaphore = None
+        self._executor = None
+        self._cpu_usage = deque()
+        self.images_shrunk = 0
+        self.bytes_saved = 0
+        self.skipped_budget = 0
+        self.skipped_too_large = 0
+        self.failures = 0
+        self.archives_split = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._executor
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _cpu_used(self):
+        """最近一分鐘子行程使用的 CPU 秒數"""
+        cutoff = time.monotonic() - 60
+        while self._cpu_usage and self._cpu_usage[0][0] < cutoff:
+            self._cpu_usage.popleft()
+        return sum(seconds for _, seconds in self._cpu_usage)
+
+    async def shrink_image(self, media, target_bytes=None):
+        """
+        縮小圖片到 target_bytes 以下，成功回傳新的 SpooledMedia，否則回傳 None
+
+        原本的 media 不會被關閉，由呼叫端決定如何處理
+        """
+        if not PILLOW_AVAILABLE:
+            return None
+        if self._cpu_used() >= self.cpu_budget_per_minute:
+            self.skipped_budget += 1
+            logger.warning("媒體整形的 CPU 預算已用完，略過縮圖")
+            return None
+        if media.size > self.max_input_bytes:
+            self.skipped_too_large += 1
+            logger.warning(f"圖片 {media.size} bytes 超過縮圖上限 {self.max_input_bytes} bytes，略過縮圖")
+            return None
+        target_bytes = target_bytes or self.image_target_bytes
+
+        executor = self.executor
+        async with self._semaphore:
+            # 在 semaphore 內才讀入記憶體，同時佔用的記憶體不超過 concurrency 份
+            data = await asyncio.to_thread(lambda: media.rewind().read())
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                executor, _shrink_image, data, target_bytes, self.image_max_dimension
+            )
+            del data
+            try:
+                shrunk, cpu_seconds = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                # 子行程無法中途停止，逾時的工作仍在佔用 CPU，以整段逾時計入預算
+                self._cpu_usage.append((time.monotonic(), self.timeout))
+                self.failures += 1
+                logger.error(f"縮小圖片逾時（{self.timeout} 秒）")
+                return None
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"縮小圖片失敗: {e!r}")
+                return None
+        self._cpu_usage.append((time.monotonic(), cpu_seconds))
+        if shrunk is None:
+            self.failures += 1
+            return None
+
+        result = SpooledMedia(len(shrunk) + 1)
+        result.write(shrunk)
+        result.rewind()
+        self.images_shrunk += 1
+        self.bytes_saved += max(media.size - result.size, 0)
+        return result
+
+    async def split_archive(self, media, filename, part_size, spool_threshold, store=None):
+        """將過大的檔案切成多個分割壓縮檔，回傳 [(檔名, SpooledMedia)]"""
+        if store is None:
+            parts = await asyncio.to_thread(
+                split_into_archive_parts, media, filename, part_size, spool_threshold, store
+            )
+        else:
+            # 壓縮檔與分割檔各約一份原檔大小
+            reserved = media.size * 2
+            await store.wait_for_room(reserved)
+            try:
+                parts = await asyncio.to_thread(
+                    split_into_archive_parts, media, filename, part_size, spool_threshold, store
+                )
+            finally:
+                store.unreserve(reserved)
+        self.archives_split += 1
+        return parts
+
+    def stats(self) -> dict:
+        return {
+            'pillow_available': PILLOW_AVAILABLE,
+            'images_shrunk': self.images_shrunk,
+            'bytes_saved': self.bytes_saved,
+            'archives_split': self.archives_split,
+            'skipped_cpu_budget': self.skipped_budget,
+            'skipped_too_large': self.skipped_too_large,
+            'failures': self.failures,
+            'cpu_seconds_last_minute': round(self._cpu_used(), 3),
+        }
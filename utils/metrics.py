@@ -0,0 +1,229 @@
+import time
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger('line_discord_bridge')
+
+# 預設的延遲分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramChild:
+    """單一標籤組合的直方圖：觀測時只做一次二分搜尋與兩次加法，不配置新物件"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def observe_since(self, started):
+        """記錄從 started（time.perf_counter()）到現在的秒數"""
+        self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        """取得標籤組合對應的子指標（第一次之後都是同一個物件，可事先保存）"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def collect(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def collect(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class CallbackMetric(_Metric):
+    """
+    在抓取時才呼叫 callback 取值的指標，用來輸出各元件 stats() 已有的計數與佇列深度，
+    不在熱路徑上增加任何成本
+
+    callback 回傳 [(標籤值 tuple, 數值)]
+    """
+
+    def __init__(self, name, documentation, labelnames=(), callback=None, type='gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type = type
+
+    def collect(self):
+        for values, value in self.callback():
+            if value is None:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        """以名稱登記指標；同名的指標會被取代（例如重新載入 Cog 時）"""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """輸出 Prometheus 文字格式"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.collect())
+            except Exception as e:
+                logger.warning(f"收集指標 {metric.name} 時發生錯誤: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        lines.append('')
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge_callback(name, documentation, labelnames=(), callback=None, type='gauge'):
+    return REGISTRY.register(CallbackMetric(name, documentation, labelnames, callback, type))
+
+
+# -----------------------------
+# 轉發流程各階段的指標
+# -----------------------------
+STAGE_SECONDS = histogram(
+    'bridge_stage_seconds',
+    '各處理階段耗時（秒）',
+    ('stage',),
+)
+WEBHOOK_VERIFY = STAGE_SECONDS.labels('webhook_verify')
+WEBHOOK_PARSE = STAGE_SECONDS.labels('webhook_parse')
+EVENT_LOG_APPEND = STAGE_SECONDS.labels('event_log_append')
+DISPATCH_WAIT = STAGE_SECONDS.labels('dispatch_wait')
+PROFILE_LOOKUP = STAGE_SECONDS.labels('profile_lookup')
+MEDIA_DOWNLOAD = STAGE_SECONDS.labels('media_download')
+DISCORD_UPLOAD = STAGE_SECONDS.labels('discord_upload')
+DISCORD_SEND = STAGE_SECONDS.labels('discord_send')
+LINE_PUSH = STAGE_SECONDS.labels('line_push')
+EVENT_TOTAL = STAGE_SECONDS.labels('event_total')
+
+SEND_QUEUE_SECONDS = histogram(
+    'bridge_send_queue_seconds',
+    '發送排程中等待權杖的時間（秒）',
+    ('scheduler',),
+)
+
+LOOP_LAG = histogram(
+    'bridge_event_loop_lag_seconds',
+    '事件循環心跳比預期晚醒來的時間（秒）',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+).labels()
+LOOP_STALLS = counter(
+    'bridge_event_loop_stalls_total',
+    '事件循環延遲超過門檻（已擷取堆疊）的次數',
+).labels()
+
+WEBHOOK_EVENTS = counter(
+    'bridge_webhook_events_total',
+    '收到的 webhook 事件數（依處理結果）',
+    ('result',),
+)
+EVENTS_ACCEPTED = WEBHOOK_EVENTS.labels('accepted')
+EVENTS_DUPLICATE = WEBHOOK_EVENTS.labels('duplicate')
+EVENTS_REJECTED = WEBHOOK_EVENTS.labels('rejected')
+
+RATE_LIMITED = counter(
+    'bridge_rate_limited_total',
+    '收到 429 限流回應的次數',
+    ('target',),
+)
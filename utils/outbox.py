@@ -0,0 +1,214 @@
+import time
+import uuid
+import shutil
+import sqlite3
+import asyncio
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger('line_discord_bridge')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idem_key TEXT UNIQUE,
+    channel_id INTEGER,
+    content TEXT NOT NULL,
+    filename TEXT,
+    blob_path TEXT,
+    blob_size INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_created_at ON outbox (created_at);
+"""
+
+
+class OutboxEntry:
+    """佇列中的一筆待送訊息"""
+
+    __slots__ = ('id', 'idem_key', 'channel_id', 'content', 'filename', 'blob_path', 'attempts')
+
+    def __init__(self, id, idem_key, channel_id, content, filename, blob_path, attempts):
+        self.id = id
+        self.idem_key = idem_key
+        self.channel_id = channel_id
+        self.content = content
+        self.filename = filename
+        self.blob_path = blob_path
+        self.attempts = attempts
+
+    @property
+    def has_attachment(self):
+        return self.blob_path is not None
+
+
+class Outbox:
+    """
+    持久化的 Discord 待送佇列（SQLite WAL）：
+    - 文字與附件都會保存，重啟後仍可重送
+    - 以 idem_key 去重，同一則 Line 訊息不會重複排入
+    - 筆數、附件總量與保存時間皆有上限，超過時淘汰最舊的項目
+    - 附件以內容雜湊命名，重複的附件在磁碟上只存一份
+    - 只有在確認送出後才刪除（at-least-once）
+    """
+
+    def __init__(self, db_path, blob_dir, max_rows=10000, max_blob_bytes=512 * 1024 * 1024,
+                 retention_seconds=48 * 3600):
+        self.db_path = Path(db_path)
+        self.blob_dir = Path(blob_dir)
+        self.max_rows = max_rows
+        self.max_blob_bytes = max_blob_bytes
+        self.retention_seconds = retention_seconds
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -----------------------------
+    # 同步操作（於工作執行緒中執行）
+    # -----------------------------
+    def _blob_bytes(self):
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(blob_size), 0) FROM (SELECT DISTINCT blob_path, blob_size FROM outbox)"
+        ).fetchone()[0]
+
+    def _store_blob(self, media):
+        """保存附件；有內容雜湊時以雜湊命名，相同內容只存一份"""
+        digest = getattr(media, 'digest', None)
+        blob_path = self.blob_dir / (digest or uuid.uuid4().hex)
+        if digest and blob_path.exists():
+            return blob_path
+        tmp_path = blob_path.with_suffix('.tmp')
+        fileobj = media.rewind()
+        with open(tmp_path, 'wb') as fd:
+            shutil.copyfileobj(fileobj, fd, 1024 * 1024)
+        tmp_path.replace(blob_path)
+        return blob_path
+
+    def _enqueue(self, content, idem_key, channel_id, media, filename):
+        blob_path = None
+        blob_size = 0
+        with self._lock:
+            if idem_key and self._conn.execute(
+                "SELECT 1 FROM outbox WHERE idem_key = ?", (idem_key,)
+            ).fetchone():
+                return False
+            if media is not None:
+                if self._blob_bytes() + media.size <= self.max_blob_bytes:
+                    blob_path = self._store_blob(media)
+                    blob_size = media.size
+                else:
+                    logger.warning(f"待送佇列附件空間已滿，{filename} 僅保留文字")
+                    filename = None
+            self._conn.execute(
+                "INSERT INTO outbox (idem_key, channel_id, content, filename, blob_path, blob_size, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (idem_key, channel_id, content, filename,
+                 str(blob_path) if blob_path else None, blob_size, time.time()),
+            )
+            self._trim()
+        return True
+
+    def _trim(self):
+        """依保存時間與筆數上限淘汰最舊的項目（呼叫前需持有鎖）"""
+        cutoff = time.time() - self.retention_seconds
+        expired = self._conn.execute(
+            "SELECT id, blob_path FROM outbox WHERE created_at < ?", (cutoff,)
+        ).fetchall()
+        overflow = self._conn.execute(
+            "SELECT id, blob_path FROM outbox ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_rows,)
+        ).fetchall()
+        victims = {row[0]: row[1] for row in expired + overflow}
+        if victims:
+            logger.warning(f"待送佇列超過上限或保存期限，捨棄 {len(victims)} 則最舊的訊息")
+            self._delete(victims)
+
+    def _delete(self, victims):
+        self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in victims])
+        for blob_path in set(victims.values()):
+            # 相同內容的附件共用檔案，沒有其他項目參照時才刪除
+            if blob_path and not self._conn.execute(
+                "SELECT 1 FROM outbox WHERE blob_path = ?", (blob_path,)
+            ).fetchone():
+                Path(blob_path).unlink(missing_ok=True)
+
+    def _fetch(self, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, idem_key, channel_id, content, filename, blob_path, attempts"
+                " FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [OutboxEntry(*row) for row in rows]
+
+    def _ack(self, entries):
+        with self._lock:
+            self._delete({e.id: e.blob_path for e in entries})
+
+    def _mark_failed(self, entries):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", [(e.id,) for e in entries]
+            )
+
+    def pending(self):
+        """目前佇列中的筆數（同步版本）"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    # -----------------------------
+    # 非同步介面
+    # -----------------------------
+    async def enqueue(self, content, idem_key=None, channel_id=None, media=None, filename=None):
+        """排入一則待送訊息；media 為 SpooledMedia 時會一併保存附件"""
+        return await asyncio.to_thread(self._enqueue, content, idem_key, channel_id, media, filename)
+
+    async def fetch(self, limit=50):
+        return await asyncio.to_thread(self._fetch, limit)
+
+    async def ack(self, entries):
+        await asyncio.to_thread(self._ack, entries)
+
+    async def mark_failed(self, entries):
+        await asyncio.to_thread(self._mark_failed, entries)
+
+    async def count(self):
+        return await asyncio.to_thread(self.pending)
+
+
+def pack_text_entries(entries, limit=2000):
+    """
+    將連續、送往同一頻道的純文字項目合併成不超過 limit 字元的批次
+
+    回傳 [(entries, content)]；附件項目各自成為一批
+    """
+    batches = []
+    group, text = [], ''
+    for entry in entries:
+        if group and entry.channel_id != group[0].channel_id:
+            batches.append((group, text))
+            group, text = [], ''
+        if entry.has_attachment or len(entry.content) > limit:
+            if group:
+                batches.append((group, text))
+                group, text = [], ''
+            batches.append(([entry], entry.content[:limit]))
+            continue
+        candidate = f"{text}\n{entry.content}" if text else entry.content
+        if len(candidate) > limit:
+            batches.append((group, text))
+            group, candidate = [], entry.content
+        group.append(entry)
+        text = candidate
+    if group:
+        batches.append((group, text))
+    return batches
@@ -0,0 +1,121 @@
+import time
+import asyncio
+from typing import NamedTuple, Optional
+from collections import OrderedDict
+
+# 負向快取的占位值（查詢失敗也記住一段時間，避免一直打 API）
+_MISSING = object()
+
+
+class LineProfile(NamedTuple):
+    """快取的 Line 使用者資料：顯示名稱與頭像網址"""
+    display_name: str
+    picture_url: Optional[str] = None
+
+
+class ProfileCache:
+    """
+    Line 使用者資料的 LRU + TTL 快取：
+    - 有上限，超過時淘汰最久未使用的項目
+    - 成功結果保留 ttl 秒，失敗結果保留 negative_ttl 秒
+    - 同一個鍵同時只會有一個查詢在進行，其他呼叫者共用結果
+    """
+
+    def __init__(self, max_size=2048, ttl=3600, negative_ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key):
+        """回傳 (是否命中, 值)；過期項目會被移除"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def peek(self, key):
+        """只查快取，不觸發載入；未命中或負向快取時回傳 None"""
+        found, value = self._lookup(key)
+        if not found or value is _MISSING:
+            return None
+        return value
+
+    def put(self, key, value):
+        """寫入快取；value 為 None 代表查詢失敗（負向快取）"""
+        if value is None:
+            self._entries[key] = (time.monotonic() + self.negative_ttl, _MISSING)
+        else:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key, loader):
+        """
+        取得快取值，未命中時呼叫 loader() 載入
+
+        loader 為回傳值或 None（失敗）的協程函式
+        """
+        found, value = self._lookup(key)
+        if found:
+            if value is _MISSING:
+                self.negative_hits += 1
+                return None
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # 負責載入的呼叫者被取消時，其他等待者視為查詢失敗
+                if inflight.cancelled():
+                    return None
+                raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                value = await loader()
+            except Exception:
+                value = None
+            self.put(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0,
+        }
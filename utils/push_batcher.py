@@ -0,0 +1,101 @@
+import asyncio
+import logging
+
+logger = logging.getLogger('line_discord_bridge')
+
+# Line push API 單次最多可帶 5 則訊息
+LINE_MAX_MESSAGES_PER_PUSH = 5
+
+
+class _Batch:
+    __slots__ = ('messages', 'origins', 'timer')
+
+    def __init__(self):
+        self.messages = []
+        self.origins = []
+        self.timer = None
+
+
+class PushBatcher:
+    """
+    將送往同一個 Line 目標的訊息打包成一次 push：
+    - 湊滿 5 則立即送出
+    - 否則第一則進來後最多等待 window 秒就送出
+    - 同一目標的 push 依序送出，不會交錯
+    - 盡力送出：重試由 push 自行處理，最終失敗的批次不會保存，只以 on_failure(to, origins, error)
+      通知呼叫端，origins 為 add() 時提供的來源（例如原本的 Discord 訊息）
+    """
+
+    def __init__(self, push, window=1.0, max_messages=LINE_MAX_MESSAGES_PER_PUSH, on_failure=None):
+        self.push = push
+        self.on_failure = on_failure
+        self.window = window
+        self.max_messages = max_messages
+        self._batches = {}
+        self._locks = {}
+        # 背景送出的工作需保留參照，否則可能在完成前被回收
+        self._tasks = set()
+        self.messages = 0
+        self.pushes = 0
+        self.failed = 0
+
+    def add(self, to, messages, origin=None):
+        """排入一或多則 Line 訊息物件（dict）；送出在背景進行"""
+        for message in messages:
+            batch = self._batches.get(to)
+            if batch is None:
+                batch = self._batches[to] = _Batch()
+                loop = asyncio.get_running_loop()
+                batch.timer = loop.call_later(self.window, self._schedule_flush, to, batch)
+            batch.messages.append(message)
+            if origin is not None and origin not in batch.origins:
+                batch.origins.append(origin)
+            self.messages += 1
+            if len(batch.messages) >= self.max_messages:
+                self._batches.pop(to, None)
+                batch.timer.cancel()
+                self._spawn(self._send(to, batch))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _schedule_flush(self, to, batch):
+        if self._batches.get(to) is batch:
+            del self._batches[to]
+            self._spawn(self._send(to, batch))
+
+    async def _send(self, to, batch):
+        messages = batch.messages
+        lock = self._locks.setdefault(to, asyncio.Lock())
+        async with lock:
+            self.pushes += 1
+            try:
+                await self.push(to, messages)
+            except Exception as e:
+                self.failed += len(messages)
+                logger.error(f"推送 {len(messages)} 則訊息到Line時發生錯誤，已捨棄: {e}")
+                if self.on_failure is not None:
+                    try:
+                        await self.on_failure(to, batch.origins, e)
+                    except Exception as report_error:
+                        logger.error(f"通知推送失敗時發生錯誤: {report_error}")
+
+    async def flush_all(self):
+        for to in list(self._batches):
+            batch = self._batches.pop(to)
+            batch.timer.cancel()
+            await self._send(to, batch)
+        # 等待已在背景送出中的 push
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            'window_seconds': self.window,
+            'messages': self.messages,
+            'pushes': self.pushes,
+            'failed_messages': self.failed,
+            'messages_per_push': round(self.messages / self.pushes, 2) if self.pushes else 0.0,
+        }
@@ -0,0 +1,232 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+from utils.metrics import SEND_QUEUE_SECONDS, RATE_LIMITED
+
+logger = logging.getLogger('line_discord_bridge')
+
+# 優先順序：數字越小越先送
+PRIORITY_TEXT = 0
+PRIORITY_ATTACHMENT = 1
+
+
+class SchedulerOverloaded(Exception):
+    """排程佇列已滿，這次發送被拒收"""
+
+
+class TokenBucket:
+    """
+    權杖桶：每秒補充 rate 個權杖，最多累積 capacity 個
+
+    收到 429 時依 retry_after 暫停（Line 不提供剩餘次數標頭；Discord 的標頭由 py-cord 內部處理，
+    只有 429 警告會傳到 DiscordRateLimitListener）
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """距離下一個權杖可用還要等待的秒數（0 代表可以立即發送）"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """被限流時暫停這個桶一段時間"""
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = max(self.blocked_until, self.updated + seconds)
+
+
+class _Lane:
+    """同一個桶的待送工作，依優先順序排隊，由單一工作者依序送出"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.heap = []
+        self.task = None
+
+
+class SendScheduler:
+    """
+    集中式發送排程器：
+    - 每個目標（Discord 頻道、Line push API）各自一個權杖桶
+    - 文字優先於附件送出
+    - 佇列滿時優先捨棄排在最後的低優先工作，呼叫端會收到 SchedulerOverloaded
+    - retry_after(error) 回傳秒數時視為被限流：暫停該桶後重試
+    """
+
+    def __init__(self, name, rate, capacity, max_queue=500, retry_after=None, max_retries=3):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.max_retries = max_retries
+        self._lanes = {}
+        self._seq = itertools.count()
+        self.sent = 0
+        self.shed = 0
+        self.throttled = 0
+        self.last_delay = 0.0
+        self.max_delay = 0.0
+        self._delay_total = 0.0
+        self._delay_metric = SEND_QUEUE_SECONDS.labels(name)
+
+    def bucket(self, key):
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(TokenBucket(self.rate, self.capacity))
+        return lane.bucket
+
+    def pause(self, key, seconds):
+        """外部得知被限流（例如 429）時暫停對應的桶"""
+        self.throttled += 1
+        self.bucket(key).pause(seconds)
+
+    def queue_depth(self, key=None):
+        """等待中的工作數；指定 key 時只計算該桶"""
+        if key is not None:
+            lane = self._lanes.get(key)
+            return len(lane.heap) if lane else 0
+        return sum(len(lane.heap) for lane in self._lanes.values())
+
+    async def submit(self, key, send, priority=PRIORITY_TEXT):
+        """
+        排入一個發送工作並等待結果
+
+        send 為不帶參數、回傳 awaitable 的函式；佇列已滿時拋出 SchedulerOverloaded
+        """
+        self.bucket(key)
+        lane = self._lanes[key]
+        future = asyncio.get_running_loop().create_future()
+        item = [priority, next(self._seq), time.monotonic(), send, future, 0]
+
+        if len(lane.heap) >= self.max_queue:
+            victim = max(lane.heap)
+            if victim[:2] < item[:2]:
+                self.shed += 1
+                raise SchedulerOverloaded(f"{self.name} 佇列已滿（{self.max_queue}）")
+            lane.heap.remove(victim)
+            heapq.heapify(lane.heap)
+            self.shed += 1
+            if not victim[4].done():
+                victim[4].set_exception(SchedulerOverloaded(f"{self.name} 佇列已滿，低優先工作被捨棄"))
+
+        heapq.heappush(lane.heap, item)
+        if lane.task is None or lane.task.done():
+            lane.task = asyncio.create_task(self._drain(lane))
+        return await future
+
+    async def _drain(self, lane):
+        while lane.heap:
+            wait = lane.bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            item = heapq.heappop(lane.heap)
+            priority, seq, enqueued_at, send, future, attempts = item
+            if future.done():
+                continue
+            delay = time.monotonic() - enqueued_at
+            self.last_delay = delay
+            self.max_delay = max(self.max_delay, delay)
+            self._delay_total += delay
+            self._delay_metric.observe(delay)
+            lane.bucket.consume()
+            try:
+                result = await send()
+            except Exception as e:
+                seconds = self.retry_after(e) if self.retry_after else None
+                if seconds is not None and attempts < self.max_retries:
+                    self.throttled += 1
+                    lane.bucket.pause(seconds)
+                    item[5] = attempts + 1
+                    heapq.heappush(lane.heap, item)
+                    logger.warning(f"{self.name} 被限流，{seconds:.2f} 秒後重試")
+                    continue
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.sent += 1
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth(),
+            'buckets': len(self._lanes),
+            'sent': self.sent,
+            'shed': self.shed,
+            'throttled': self.throttled,
+            'last_queue_delay_seconds': round(self.last_delay, 3),
+            'max_queue_delay_seconds': round(self.max_delay, 3),
+            'avg_queue_delay_seconds': round(self._delay_total / self.sent, 3) if self.sent else 0.0,
+        }
+
+
+class DiscordRateLimitListener(logging.Handler):
+    """
+    py-cord 只會在內部處理 429 並記錄警告，不會把回應標頭交給呼叫端；
+    這個 handler 監聽 discord.http 的限流警告，讓排程器暫停對應頻道的桶
+    """
+
+    def __init__(self, scheduler):
+        super().__init__(level=logging.WARNING)
+        self.scheduler = scheduler
+
+    def emit(self, record):
+        try:
+            if not str(record.msg).startswith("We are being rate limited") or len(record.args) < 2:
+                return
+            RATE_LIMITED.labels('discord').inc()
+            retry_after, bucket = record.args[0], str(record.args[1])
+            channel_id = bucket.split(':', 1)[0]
+            if channel_id.isdigit():
+                self.scheduler.pause(int(channel_id), float(retry_after))
+            else:
+                self.scheduler.throttled += 1
+        except Exception:
+            pass
+
+
+def line_retry_after(error):
+    """Line API 回傳 429 時，依 Retry-After 標頭（預設 1 秒）決定等待時間"""
+    if getattr(error, 'status_code', None) != 429:
+        return None
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 1))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def discord_retry_after(error):
+    """py-cord 重試用盡後仍拋出 429 時，依 Retry-After 標頭決定等待時間"""
+    if getattr(error, 'status', None) != 429:
+        return None
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After', 1))
+    except (TypeError, ValueError):
+        return 1.0
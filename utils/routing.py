@@ -0,0 +1,120 @@
+import json
+import logging
+from pathlib import Path
+
+logger = logging.getLogger('line_discord_bridge')
+
+
+class Bridge:
+    """一組 Line 群組（或聊天室/使用者）↔ Discord 頻道的橋接"""
+
+    __slots__ = ('name', 'line_id', 'channel_id', 'relay_to_line', 'default', 'channel',
+                 'to_discord', 'to_line')
+
+    def __init__(self, name, line_id, channel_id, relay_to_line=False, default=False):
+        self.name = name
+        self.line_id = line_id
+        self.channel_id = channel_id
+        self.relay_to_line = relay_to_line
+        self.default = default
+        self.channel = None  # 解析後的 Discord 頻道物件（on_ready 時快取）
+        self.to_discord = 0
+        self.to_line = 0
+
+    def stats(self) -> dict:
+        return {
+            'line_id': self.line_id,
+            'channel_id': self.channel_id,
+            'channel_ready': self.channel is not None,
+            'relay_to_line': self.relay_to_line,
+            'to_discord': self.to_discord,
+            'to_line': self.to_line,
+        }
+
+
+class RoutingTable:
+    """
+    橋接路由表：
+    - 以 dict 預先建立 Line ID → 橋接、Discord 頻道 ID → 橋接兩個方向的索引，查詢為 O(1)
+    - 可指定一個預設橋接，接收不在表中的 Line 來源（相容單一頻道的舊設定）
+    """
+
+    def __init__(self, bridges):
+        self.bridges = list(bridges)
+        self.by_line_id = {}
+        self.by_channel_id = {}
+        self.default = None
+        for bridge in self.bridges:
+            if bridge.line_id:
+                if bridge.line_id in self.by_line_id:
+                    raise ValueError(f"Line ID {bridge.line_id} 重複出現在多個橋接中")
+                self.by_line_id[bridge.line_id] = bridge
+            # 同一個 Discord 頻道只對應一個 Line 目標
+            if bridge.channel_id in self.by_channel_id:
+                raise ValueError(f"Discord 頻道 {bridge.channel_id} 重複出現在多個橋接中")
+            self.by_channel_id[bridge.channel_id] = bridge
+            if bridge.default:
+                self.default = bridge
+
+    def __iter__(self):
+        return iter(self.bridges)
+
+    def __len__(self):
+        return len(self.bridges)
+
+    def for_line(self, line_id):
+        """依 Line 來源（群組/聊天室/使用者 ID）取得橋接，找不到時回傳預設橋接"""
+        return self.by_line_id.get(line_id, self.default)
+
+    def for_channel(self, channel_id):
+        return self.by_channel_id.get(channel_id)
+
+    def channel(self, channel_id=None):
+        """取得已快取的 Discord 頻道；未指定時使用預設橋接的頻道"""
+        bridge = self.by_channel_id.get(channel_id) if channel_id is not None else self.default
+        return bridge.channel if bridge is not None else None
+
+    def resolve(self, get_channel):
+        """以 get_channel(channel_id) 解析並快取所有頻道，回傳找不到的頻道 ID"""
+        missing = []
+        for bridge in self.bridges:
+            bridge.channel = get_channel(bridge.channel_id)
+            if bridge.channel is None:
+                missing.append(bridge.channel_id)
+        return missing
+
+    def bind(self, channel):
+        """直接快取一個頻道物件（例如以 REST 取得的頻道）"""
+        bridge = self.by_channel_id.get(channel.id)
+        if bridge is not None:
+            bridge.channel = channel
+
+    def stats(self) -> dict:
+        return {bridge.name: bridge.stats() for bridge in self.bridges}
+
+
+def load_routes(path=None, channel_id=0, line_id='', relay_to_line=False):
+    """
+    載入路由表
+
+    path 指向 JSON 檔時從檔案載入，格式：
+        {"bridges": [{"name": "家人", "line_id": "C...", "discord_channel_id": 123,
+                      "relay_to_line": true, "default": false}]}
+    未指定檔案時，以 DISCORD_CHANNEL_ID / LINE_GROUP_ID 建立單一的預設橋接（與舊設定相同）
+    """
+    if not path:
+        return RoutingTable([Bridge('default', line_id, channel_id, relay_to_line, default=True)])
+
+    data = json.loads(Path(path).read_text(encoding='utf-8'))
+    bridges = []
+    for index, item in enumerate(data.get('bridges', [])):
+        bridges.append(Bridge(
+            name=item.get('name') or f"bridge{index}",
+            line_id=item.get('line_id', ''),
+            channel_id=int(item['discord_channel_id']),
+            relay_to_line=bool(item.get('relay_to_line', relay_to_line)),
+            default=bool(item.get('default', False)),
+        ))
+    table = RoutingTable(bridges)
+    logger.info(f"已從 {path} 載入 {len(table)} 組橋接")
+    return table
@@ -0,0 +1,180 @@
+import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import aiohttp
+
+from utils.profile_cache import ProfileCache
+
+logger = logging.getLogger('line_discord_bridge')
+
+# 貼圖 PNG 通常只有數十 KB，超過此大小視為異常回應
+STICKER_MAX_BYTES = 1024 * 1024
+
+
+class StickerCache:
+    """
+    Line 貼圖圖片的兩層快取：
+    - 記憶體：常用的貼圖（沿用 ProfileCache 的 LRU、負向快取與同鍵查詢合併）
+    - 磁碟：以 package_id/sticker_id 為鍵的 PNG 檔，總大小有上限，依最近使用時間（檔案 mtime）淘汰，重啟後仍有效
+    - 兩層都未命中才向貼圖 CDN 下載，因此同一張貼圖之後不再需要連線 Line
+    """
+
+    def __init__(self, cache_dir, base_url, max_bytes=256 * 1024 * 1024, memory_entries=256,
+                 timeout=10.0, negative_ttl=300):
+        self.cache_dir = Path(cache_dir)
+        self.base_url = base_url.rstrip('/')
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.session = None
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.disk_hits = 0
+        self.fetched = 0
+        self.fetch_failures = 0
+        self.evictions = 0
+
+        self.memory = ProfileCache(max_size=memory_entries, ttl=float('inf'), negative_ttl=negative_ttl)
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # 鍵 → 檔案大小，依最近使用排序（最舊在前）
+        self._total_bytes = 0
+        # 上限調低後重啟時，超出的部分會在這裡淘汰
+        self._scan()
+
+    @staticmethod
+    def key(package_id, sticker_id):
+        """快取鍵；ID 不是數字時回傳 None（不用來組路徑或網址）"""
+        package_id, sticker_id = str(package_id or ''), str(sticker_id or '')
+        if not (package_id.isdigit() and sticker_id.isdigit()):
+            return None
+        return f"{package_id}/{sticker_id}"
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.png"
+
+    # -----------------------------
+    # 磁碟層（於工作執行緒中執行）
+    # -----------------------------
+    def _scan(self):
+        """啟動時依 mtime 重建 LRU 順序，並清掉上次寫到一半的檔案"""
+        entries = []
+        for path in self.cache_dir.glob('*/*'):
+            if path.suffix != '.png':
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, f"{path.parent.name}/{path.stem}", stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _read_disk(self, key):
+        with self._lock:
+            if key not in self._index:
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            # 以 mtime 記錄最近使用時間，重啟後仍能維持 LRU 順序
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total_bytes -= self._index.pop(key, 0)
+            return None
+        return data
+
+    def _write_disk(self, key, data):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        partial = path.with_suffix('.part')
+        partial.write_bytes(data)
+        os.replace(partial, path)
+        with self._lock:
+            self._total_bytes += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            self._path(key).unlink(missing_ok=True)
+
+    # -----------------------------
+    # 下載
+    # -----------------------------
+    def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def _fetch(self, sticker_id):
+        url = f"{self.base_url}/{sticker_id}/android/sticker.png"
+        async with self._ensure_session().get(url) as response:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            data = await response.content.read(STICKER_MAX_BYTES + 1)
+        if len(data) > STICKER_MAX_BYTES:
+            raise RuntimeError(f"超過 {STICKER_MAX_BYTES} bytes")
+        return data
+
+    async def _load(self, key, sticker_id):
+        data = await asyncio.to_thread(self._read_disk, key)
+        if data is not None:
+            self.disk_hits += 1
+            return data
+        try:
+            data = await self._fetch(sticker_id)
+        except Exception as e:
+            # 負向快取一段時間，避免同一張取不到的貼圖一直重試
+            self.fetch_failures += 1
+            logger.warning(f"無法下載貼圖 {key}: {e}")
+            return None
+        self.fetched += 1
+        try:
+            await asyncio.to_thread(self._write_disk, key, data)
+        except OSError as e:
+            logger.warning(f"寫入貼圖快取時發生錯誤: {e}")
+        return data
+
+    async def get(self, package_id, sticker_id, fetch=True):
+        """
+        取得貼圖 PNG 內容，取不到時回傳 None
+
+        fetch=False 時只查記憶體與磁碟，不連線（過載降級時使用）
+        """
+        key = self.key(package_id, sticker_id)
+        if key is None:
+            return None
+        if fetch:
+            return await self.memory.get(key, lambda: self._load(key, sticker_id))
+        data = self.memory.peek(key)
+        if data is None:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.disk_hits += 1
+                self.memory.put(key, data)
+        return data
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            disk_entries, disk_bytes = len(self._index), self._total_bytes
+        return {
+            'memory': self.memory.stats(),
+            'disk_entries': disk_entries,
+            'disk_bytes': disk_bytes,
+            'disk_hits': self.disk_hits,
+            'fetched': self.fetched,
+            'fetch_failures': self.fetch_failures,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,125 @@
+import re
+import time
+import logging
+
+import aiohttp
+import discord
+
+logger = logging.getLogger('line_discord_bridge')
+
+# Discord 不允許 webhook 名稱包含這些字（不分大小寫），插入零寬空白避開
+_RESERVED_NAME_RE = re.compile(r'(?i)(discord|clyde)')
+_MAX_NAME_LENGTH = 80
+
+
+def webhook_username(name):
+    """將 Line 顯示名稱轉成可作為 webhook 身分的名稱（1–80 字元）"""
+    name = _RESERVED_NAME_RE.sub(lambda m: f"{m.group(0)[0]}\u200b{m.group(0)[1:]}", (name or '').strip())
+    return name[:_MAX_NAME_LENGTH] or 'Line用戶'
+
+
+class WebhookSender:
+    """
+    以頻道 webhook 轉發 Line 訊息（DISCORD_DELIVERY=webhook）：
+    - 每個橋接頻道只建立或取得一次 webhook，之後重複使用
+    - 所有 webhook 共用一個 keep-alive 的 aiohttp 連線池，與機器人帳號的連線分開
+    - 每則訊息以 Line 使用者的名稱與頭像作為 webhook 身分
+    - 頻道沒有管理 webhook 權限或 webhook 被刪除時回報未就緒，由呼叫端改用機器人帳號發送
+    """
+
+    def __init__(self, name='Line Bridge', connections=20, retry_interval=600):
+        self.name = name
+        self.connections = connections
+        self.retry_interval = retry_interval
+        self.session = None
+        self._webhooks = {}
+        self._failed_at = {}
+        self.sent = 0
+        self.created = 0
+        self.failures = 0
+
+    def _ensure_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60),
+            )
+        return self.session
+
+    async def prepare(self, channel, bot_user):
+        """取得或建立頻道的 webhook；失敗時記錄並在 retry_interval 秒內不再嘗試"""
+        if channel.id in self._webhooks:
+            return True
+        failed_at = self._failed_at.get(channel.id)
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+            return False
+        try:
+            webhook = None
+            for existing in await channel.webhooks():
+                if existing.token and existing.name == self.name and existing.user == bot_user:
+                    webhook = existing
+                    break
+            if webhook is None:
+                webhook = await channel.create_webhook(name=self.name, reason='Line 訊息轉發')
+                self.created += 1
+        except discord.HTTPException as e:
+            self._failed_at[channel.id] = time.monotonic()
+            logger.warning(f"無法取得頻道 {channel.id} 的 webhook（需要管理 Webhook 權限），改用機器人帳號發送: {e}")
+            return False
+
+        # 以機器人的連線狀態建立，回傳的訊息才能解析出頻道（jump_url 等），連線則走獨立的連線池
+        self._webhooks[channel.id] = discord.Webhook(
+            {
+                'id': webhook.id,
+                'type': 1,
+                'token': webhook.token,
+                'name': webhook.name,
+                'channel_id': channel.id,
+                'guild_id': getattr(channel.guild, 'id', None),
+            },
+            session=self._ensure_session(),
+            state=channel._state,
+        )
+        self._failed_at.pop(channel.id, None)
+        logger.info(f"頻道 {channel.id} 將以 webhook 轉發 Line 訊息")
+        return True
+
+    def ready(self, channel_id):
+        return channel_id in self._webhooks
+
+    def invalidate(self, channel_id):
+        """webhook 已失效（例如被手動刪除），之後改用機器人帳號，直到重新建立"""
+        if self._webhooks.pop(channel_id, None) is not None:
+            self._failed_at[channel_id] = time.monotonic()
+
+    async def send(self, channel_id, content, author, file=None):
+        """以 author（LineProfile）的名稱與頭像發送，回傳 WebhookMessage"""
+        webhook = self._webhooks[channel_id]
+        kwargs = {'username': webhook_username(author.display_name), 'wait': True}
+        if author.picture_url:
+            kwargs['avatar_url'] = author.picture_url
+        if file is not None:
+            kwargs['file'] = file
+        try:
+            message = await webhook.send(content, **kwargs)
+        except discord.NotFound:
+            self.failures += 1
+            self.invalidate(channel_id)
+            logger.warning(f"頻道 {channel_id} 的 webhook 已不存在，改用機器人帳號發送")
+            raise
+        except discord.HTTPException:
+            self.failures += 1
+            raise
+        self.sent += 1
+        return message
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def stats(self) -> dict:
+        return {
+            'channels': len(self._webhooks),
+            'created': self.created,
+            'sent': self.sent,
+            'failures': self.failures,
+        }